@@ -0,0 +1,108 @@
+"""
+Measures the chunk compression codecs on the workloads chunks are made of:
+compression ratio, compression and decompression throughput of one thread,
+and decompression throughput with a pool of threads, as a download runs it.
+
+  logs      synthetic application log lines
+  json      synthetic JSON records
+  random    incompressible bytes (sampling should skip these)
+
+Throughput is in MB/s of uncompressed data. 'sampled' is the share of
+chunks the compressibility sample chose to compress.
+
+Usage: python benchmarks/bench_compression.py [--mb 32] [--chunk-kb 1024] [--threads 8]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.compression import CODECS, choose_codec, compress, decompress
+
+
+def make_logs(size):
+    rng = random.Random(1)
+    levels = ["INFO", "INFO", "INFO", "WARN", "ERROR", "DEBUG"]
+    lines, total = [], 0
+    while total < size:
+        line = (f"2024-05-01T{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}."
+                f"{rng.randrange(1000):03d}Z {rng.choice(levels)} [worker-{rng.randrange(16)}] "
+                f"GET /api/v1/items/{rng.randrange(100000)} status={rng.choice([200, 200, 200, 404, 500])} "
+                f"latency_ms={rng.randrange(2000)} user={rng.randrange(5000)}\n")
+        lines.append(line)
+        total += len(line)
+    return "".join(lines).encode()[:size]
+
+
+def make_json(size):
+    rng = random.Random(2)
+    records, total = [], 0
+    while total < size:
+        record = json.dumps({"id": rng.randrange(10 ** 9), "name": f"item-{rng.randrange(10 ** 5)}",
+                             "price": round(rng.random() * 100, 2), "tags": rng.sample(["a", "b", "c", "d", "e"], 2),
+                             "in_stock": rng.random() < 0.5}) + "\n"
+        records.append(record)
+        total += len(record)
+    return "".join(records).encode()[:size]
+
+
+WORKLOADS = {"logs": make_logs, "json": make_json, "random": os.urandom}
+
+
+def measure(chunks, codec, threads):
+    """
+    Returns:
+        Tuple[float, float, float, float, float]: Compression ratio, share of
+        chunks sampled as compressible, compress MB/s, decompress MB/s with
+        one thread and with the pool.
+    """
+    total = sum(len(c) for c in chunks)
+    chosen = [choose_codec(c, codec) for c in chunks]
+
+    started = time.perf_counter()
+    packed = [compress(c, codec) for c in chunks]
+    compress_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for p in packed:
+        decompress(p, codec)
+    decompress_s = time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        started = time.perf_counter()
+        list(pool.map(lambda p: decompress(p, codec), packed))
+        parallel_s = time.perf_counter() - started
+
+    mb = total / (1024 * 1024)
+    ratio = total / sum(len(p) for p in packed)
+    sampled = sum(1 for c in chosen if c) / len(chunks)
+    return ratio, sampled, mb / compress_s, mb / decompress_s, mb / parallel_s
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=32, help="Data per workload")
+    parser.add_argument("--chunk-kb", type=int, default=1024)
+    parser.add_argument("--threads", type=int, default=8, help="Threads decompressing in parallel")
+    parser.add_argument("--codecs", nargs="+", default=sorted(CODECS), choices=sorted(CODECS))
+    args = parser.parse_args()
+
+    chunk_size = args.chunk_kb * 1024
+    print(f"{args.mb} MB per workload in {args.chunk_kb} KB chunks, {args.threads} decompression threads")
+    print(f"{'workload':>8} {'codec':>6} {'ratio':>7} {'sampled':>8} {'comp MB/s':>10} "
+          f"{'decomp MB/s':>12} {'x' + str(args.threads) + ' MB/s':>10}")
+    for workload, make in WORKLOADS.items():
+        data = make(args.mb * 1024 * 1024)
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        for codec in args.codecs:
+            ratio, sampled, comp, decomp, parallel = measure(chunks, codec, args.threads)
+            print(f"{workload:>8} {codec:>6} {ratio:>7.2f} {sampled:>8.0%} {comp:>10.1f} {decomp:>12.1f} {parallel:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
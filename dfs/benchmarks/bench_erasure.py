@@ -0,0 +1,56 @@
+"""
+Measures Reed-Solomon encode and decode throughput on a single core.
+
+Usage: python benchmarks/bench_erasure.py [--size-mb 64] [--codes 4+2 6+3 10+4]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.erasure import ReedSolomon
+
+
+def measure(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=64, help="Data encoded per run")
+    parser.add_argument("--stripe-mb", type=float, default=1, help="Stripe (chunk) size")
+    parser.add_argument("--codes", nargs="+", default=["4+2", "6+3", "10+4"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    stripe_size = int(args.stripe_mb * 1024 * 1024)
+    stripes = [os.urandom(stripe_size) for _ in range(max(1, args.size_mb * 1024 * 1024 // stripe_size))]
+    total_mb = len(stripes) * stripe_size / (1024 * 1024)
+
+    print(f"{'code':>6} {'encode MB/s':>12} {'decode MB/s':>12} {'degraded MB/s':>14}")
+    for code in args.codes:
+        k, m = (int(x) for x in code.split("+"))
+        rs = ReedSolomon(k, m)
+        encoded = [rs.encode(s) for s in stripes]
+
+        encode_s = measure(lambda: [rs.encode(s) for s in stripes], args.repeat)
+        # Decode from the data fragments only (no parity needed)
+        decode_s = measure(
+            lambda: [rs.decode(dict(enumerate(f[:k])), stripe_size) for f in encoded], args.repeat
+        )
+        # Degraded read: the first m data fragments are lost
+        degraded_s = measure(
+            lambda: [rs.decode({i: f[i] for i in range(m, k + m)}, stripe_size) for f in encoded], args.repeat
+        )
+        print(f"{code:>6} {total_mb / encode_s:>12.1f} {total_mb / decode_s:>12.1f} {total_mb / degraded_s:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Load-tests a storage node's write path: many concurrent clients each storing
+chunks as fast as they can, against each server mode and upload endpoint.
+
+  dev:store     Flask development server, multipart POST /store (the original path)
+  dev:put       Flask development server, raw PUT /chunk/<id>
+  pooled:put    Pooled thread server, raw PUT /chunk/<id>
+
+Usage: python benchmarks/bench_node_server.py [--clients 128] [--chunk-kb 1024] [--seconds 10]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import requests
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def start_node(port, server, storage_dir):
+    env = os.environ.copy()
+    env["PYTHONPATH"] = BASE_DIR
+    process = subprocess.Popen(
+        [sys.executable, "nodes/node_storage.py", "--port", str(port), "--server", server,
+         "--storage-dir", storage_dir],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            requests.get(f"http://localhost:{port}/status", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"node on port {port} did not start")
+
+
+def run_clients(url, endpoint, clients, payload, seconds):
+    """
+    Returns (completed requests, failed requests, elapsed seconds).
+    """
+    deadline = time.monotonic() + seconds
+    counts = [[0, 0] for _ in range(clients)]
+
+    def client(i):
+        session = requests.Session()
+        n = 0
+        while time.monotonic() < deadline:
+            chunk_id = f"bench_{i}_{n}"
+            n += 1
+            try:
+                if endpoint == "store":
+                    r = session.post(f"{url}/store", files={"chunk": (chunk_id, payload)},
+                                     data={"chunk_id": chunk_id}, timeout=30)
+                else:
+                    r = session.put(f"{url}/chunk/{chunk_id}", data=payload, timeout=30)
+                r.raise_for_status()
+                counts[i][0] += 1
+            except requests.RequestException:
+                counts[i][1] += 1
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    return sum(c[0] for c in counts), sum(c[1] for c in counts), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=128, help="Concurrent uploaders")
+    parser.add_argument("--chunk-kb", type=int, default=1024)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--modes", nargs="+", default=["dev:store", "dev:put", "pooled:put"])
+    args = parser.parse_args()
+
+    payload = os.urandom(args.chunk_kb * 1024)
+    print(f"{args.clients} clients, {args.chunk_kb} KB chunks, {args.seconds:.0f} s per mode")
+    print(f"{'mode':>12} {'req/s':>9} {'MB/s':>9} {'failed':>7}")
+    for mode in args.modes:
+        server, endpoint = mode.split(":")
+        storage_dir = tempfile.mkdtemp(prefix="dfs_bench_")
+        node = start_node(args.port, server, storage_dir)
+        try:
+            done, failed, elapsed = run_clients(f"http://localhost:{args.port}", endpoint, args.clients,
+                                                payload, args.seconds)
+        finally:
+            node.terminate()
+            node.wait()
+            shutil.rmtree(storage_dir, ignore_errors=True)
+        mb = done * len(payload) / (1024 * 1024)
+        print(f"{mode:>12} {done / elapsed:>9.1f} {mb / elapsed:>9.1f} {failed:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measures per-chunk store and read latency of each node storage engine as the
+number of stored chunks grows.
+
+Usage: python benchmarks/bench_storage_engine.py [--chunks 200000] [--steps 4] [--chunk-kb 4]
+"""
+import io
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from nodes.storage_engine import open_engine, ENGINES
+
+
+def read(engine, chunk_id):
+    if engine.whole_files:
+        path, _, _ = engine.locate(chunk_id)
+        with open(path, "rb") as f:
+            return f.read()
+    return engine.read(chunk_id)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200000, help="Chunks stored by the end of the run")
+    parser.add_argument("--steps", type=int, default=4, help="Number of measurement points")
+    parser.add_argument("--chunk-kb", type=float, default=4)
+    parser.add_argument("--reads", type=int, default=2000, help="Random reads per measurement point")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+    parser.add_argument("--fsync", action="store_true", help="Sync every chunk (slow on most disks)")
+    parser.add_argument("--dir", help="Directory to create the stores in (default: system temp)")
+    args = parser.parse_args()
+
+    payload = os.urandom(int(args.chunk_kb * 1024))
+    step = args.chunks // args.steps
+    print(f"{'engine':>8} {'chunks':>9} {'put us':>8} {'get us':>8} {'reload s':>9}")
+    for name in args.engines:
+        root = tempfile.mkdtemp(prefix=f"dfs_engine_{name}_", dir=args.dir)
+        try:
+            engine = open_engine(name, root, fsync=args.fsync)
+            engine.load()
+            stored = 0
+            for _ in range(args.steps):
+                started = time.perf_counter()
+                for i in range(stored, stored + step):
+                    engine.put(f"chunk{i:09d}", io.BytesIO(payload), len(payload))
+                put_us = (time.perf_counter() - started) / step * 1e6
+                stored += step
+
+                ids = [f"chunk{random.randrange(stored):09d}" for _ in range(args.reads)]
+                started = time.perf_counter()
+                for chunk_id in ids:
+                    read(engine, chunk_id)
+                get_us = (time.perf_counter() - started) / len(ids) * 1e6
+
+                # Startup cost without a snapshot: a full scan
+                engine.close()
+                os.remove(engine.index.snapshot_path)
+                started = time.perf_counter()
+                engine = open_engine(name, root, fsync=args.fsync)
+                engine.load()
+                reload_s = time.perf_counter() - started
+                print(f"{name:>8} {stored:>9} {put_us:>8.0f} {get_us:>8.0f} {reload_s:>9.2f}")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+            if os.path.exists(root.rstrip(os.sep) + ".index"):
+                os.remove(root.rstrip(os.sep) + ".index")
+
+
+if __name__ == "__main__":
+    main()
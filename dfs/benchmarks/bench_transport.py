@@ -0,0 +1,88 @@
+"""
+Measures the connection-setup overhead per chunk on one hop: uploading chunks
+to a storage node with a bare requests call per chunk (a new TCP connection
+each time) against the shared keep-alive transport.
+
+  bare         requests.put per chunk, as every component did before
+  transport    core.transport.Transport, one pooled session per node
+
+Usage: python benchmarks/bench_transport.py [--chunks 2000] [--chunk-kb 4] [--clients 1 8]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.transport import Transport
+from bench_node_server import start_node
+
+
+def upload(url, mode, chunks, clients, payload):
+    """
+    Stores chunks split over concurrent clients.
+
+    Returns:
+        Tuple[float, int]: Elapsed seconds, and connections opened.
+    """
+    transport = Transport(timeout=30, pool_size=clients)
+    put = transport.put if mode == "transport" else requests.put
+
+    def client(i):
+        for n in range(i, chunks, clients):
+            put(f"{url}/chunk/bench_{n}", data=payload, timeout=30).raise_for_status()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    if mode == "transport":
+        pools = transport.session(url).get_adapter(url).poolmanager.pools
+        opened = sum(pools[key].num_connections for key in pools.keys())
+    else:
+        opened = chunks
+    transport.close()
+    return elapsed, opened
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks stored per run")
+    parser.add_argument("--chunk-kb", type=float, default=4)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8], help="Concurrent uploaders per run")
+    parser.add_argument("--port", type=int, default=18001)
+    args = parser.parse_args()
+
+    payload = os.urandom(int(args.chunk_kb * 1024))
+    url = f"http://localhost:{args.port}"
+    storage_dir = tempfile.mkdtemp(prefix="dfs_bench_")
+    node = start_node(args.port, "pooled", storage_dir)
+    try:
+        print(f"{args.chunks} chunks of {args.chunk_kb:g} KB to one node")
+        print(f"{'mode':>10} {'clients':>8} {'us/chunk':>9} {'chunks/s':>9} {'connections':>12}")
+        for clients in args.clients:
+            per_chunk = {}
+            for mode in ("bare", "transport"):
+                elapsed, opened = upload(url, mode, args.chunks, clients, payload)
+                per_chunk[mode] = elapsed / args.chunks * 1e6
+                print(f"{mode:>10} {clients:>8} {per_chunk[mode]:>9.0f} {args.chunks / elapsed:>9.0f} {opened:>12}")
+            print(f"{'saved':>10} {clients:>8} {per_chunk['bare'] - per_chunk['transport']:>9.0f}")
+    finally:
+        node.terminate()
+        node.wait()
+        shutil.rmtree(storage_dir, ignore_errors=True)
+        if os.path.exists(storage_dir + ".index"):
+            os.remove(storage_dir + ".index")
+
+
+if __name__ == "__main__":
+    main()
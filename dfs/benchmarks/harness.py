@@ -0,0 +1,383 @@
+"""
+End-to-end benchmark of the DFS: starts a topology of clusters × nodes on
+localhost with the dfs_launcher functions, drives upload, download and
+delete workloads through the real clients, and writes the results as JSON
+so runs can be compared.
+
+For every phase it reports throughput (MB/s of file data), client-side
+per-chunk latency (p50/p99), and a per-hop breakdown: the latency
+histograms and counters each tier's /metrics gained during the phase
+(global balancer, cluster managers, nodes), merged across the services of
+a tier.
+
+The global balancer always listens on port 6000, where the clients expect
+it, so nothing else may be using that port. Node storage, balancer state,
+upload journals and service logs go to a scratch directory that is removed
+afterwards unless --keep is given.
+
+Usage: python benchmarks/harness.py [--clusters 2] [--nodes 3] [--files 1MB:8,16MB:4,64MB:1]
+           [--concurrency 4] [--chunk-kb N] [--phases upload download delete]
+           [--output results.json] [--baseline earlier.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(BASE_DIR)
+
+import dfs_launcher
+from core.metrics import Histogram
+
+GLOBAL_URL = "http://localhost:6000"
+SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+PHASES = ("upload", "download", "delete")
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def parse_mix(text):
+    """
+    Parses a file size mix such as '1MB:8,16MB:4' (eight 1 MB files and
+    four 16 MB ones) into a list of sizes.
+    """
+    sizes = []
+    for part in text.split(","):
+        size, _, count = part.partition(":")
+        sizes += [parse_size(size)] * int(count or 1)
+    return sizes
+
+
+def write_file(path, size, data, rng):
+    """
+    Writes size bytes of random (incompressible) or log-like text data.
+    """
+    block = 1024 * 1024
+    with open(path, "wb") as f:
+        written = 0
+        while written < size:
+            n = min(block, size - written)
+            if data == "random":
+                f.write(os.urandom(n))
+            else:
+                lines = []
+                while sum(len(line) for line in lines) < n:
+                    lines.append(f"2024-05-01T12:{rng.randrange(60):02d}:{rng.randrange(60):02d}Z INFO "
+                                 f"[worker-{rng.randrange(16)}] GET /api/items/{rng.randrange(10 ** 5)} "
+                                 f"status=200 latency_ms={rng.randrange(2000)}\n")
+                f.write("".join(lines).encode()[:n])
+            written += n
+
+
+class Topology:
+    """
+    A local DFS started with the dfs_launcher functions: clusters of nodes
+    behind their cluster managers, and the global balancer.
+    """
+
+    def __init__(self, clusters, nodes, work_dir, node_base, cluster_base):
+        self.work_dir = work_dir
+        self.processes = []
+        self.urls = {"global": [GLOBAL_URL], "cluster": [], "node": []}
+        self.expected_nodes = clusters * nodes
+        self.log = open(os.path.join(work_dir, "services.log"), "wb")
+
+        cluster_map = {}
+        for c in range(clusters):
+            ports = dfs_launcher.get_free_ports(node_base + c * nodes, nodes)
+            cluster_port = cluster_base + c
+            cluster_url = f"http://localhost:{cluster_port}"
+            self.processes.append(dfs_launcher.launch_cluster_manager(cluster_port, ports, stdout=self.log))
+            self.processes += dfs_launcher.launch_nodes(c, ports, cluster_url=cluster_url,
+                                                        storage_root=os.path.join(work_dir, "node_storage"),
+                                                        stdout=self.log)
+            cluster_map[f"cluster_{c + 1}"] = cluster_url
+            self.urls["cluster"].append(cluster_url)
+            self.urls["node"] += [f"http://localhost:{port}" for port in ports]
+        self.processes.append(dfs_launcher.launch_global_balancer(cluster_map, stdout=self.log))
+
+    def wait_ready(self, timeout=60):
+        """
+        Waits until the global balancer sees every node as healthy.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(f"{GLOBAL_URL}/status", timeout=1).json()["active_nodes"] >= self.expected_nodes:
+                    return
+            except (requests.RequestException, ValueError, KeyError):
+                pass
+            time.sleep(0.25)
+        raise RuntimeError(f"topology not ready after {timeout}s; see {self.log.name}")
+
+    def scrape(self):
+        """
+        Returns:
+            Dict[str, List[dict]]: Tier → /metrics snapshot of each service.
+        """
+        snapshots = {}
+        for tier, urls in self.urls.items():
+            snapshots[tier] = []
+            for url in urls:
+                try:
+                    snapshots[tier].append(requests.get(f"{url}/metrics", timeout=5).json())
+                except (requests.RequestException, ValueError):
+                    snapshots[tier].append({"counters": {}, "histograms": {}})
+        return snapshots
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.log.close()
+
+
+def latency_summary(histogram):
+    return {
+        "count": histogram.count,
+        "mean_ms": round(1000 * histogram.sum / histogram.count, 3) if histogram.count else None,
+        "p50_ms": round(1000 * histogram.quantile(0.5), 3) if histogram.count else None,
+        "p99_ms": round(1000 * histogram.quantile(0.99), 3) if histogram.count else None,
+    }
+
+
+def histogram_delta(before, after):
+    """
+    Returns the observations a histogram gained between two snapshots.
+    """
+    delta = Histogram.from_snapshot(after)
+    if before:
+        delta.merge(Histogram.from_snapshot(before), sign=-1)
+    return delta
+
+
+def hop_breakdown(before, after):
+    """
+    Merges, per tier, what every service's metrics gained between two
+    scrapes: latency summaries of the histograms that saw traffic, and
+    counter increments.
+    """
+    tiers = {}
+    for tier, snapshots in after.items():
+        histograms, counters = {}, {}
+        for old, new in zip(before[tier], snapshots):
+            for name, snapshot in new["histograms"].items():
+                delta = histogram_delta(old["histograms"].get(name), snapshot)
+                if name in histograms:
+                    histograms[name].merge(delta)
+                else:
+                    histograms[name] = delta
+            for name, value in new["counters"].items():
+                counters[name] = counters.get(name, 0) + value - old["counters"].get(name, 0)
+        tiers[tier] = {
+            "latency": {name: latency_summary(h) for name, h in sorted(histograms.items()) if h.count},
+            "counters": {name: value for name, value in sorted(counters.items()) if value},
+        }
+    return tiers
+
+
+def run_phase(topology, operation, items, concurrency, client_metrics=None, histogram=None):
+    """
+    Runs operation over items with concurrency threads and measures it.
+
+    Args:
+        operation (Callable[[tuple], bool]): Runs one item; True on success.
+        items (List[Tuple[str, int]]): (file name or path, size) pairs.
+        client_metrics (Metrics): Client module metrics holding the per-chunk
+            histogram named histogram.
+    """
+    before = topology.scrape()
+    chunk_before = client_metrics.snapshot()["histograms"].get(histogram) if client_metrics else None
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(operation, items))
+    seconds = time.perf_counter() - started
+    after = topology.scrape()
+
+    done_bytes = sum(size for (_, size), ok in zip(items, results) if ok)
+    result = {
+        "files": len(items),
+        "failed": results.count(False),
+        "bytes": done_bytes,
+        "seconds": round(seconds, 3),
+        "mb_s": round(done_bytes / (1024 * 1024) / seconds, 2) if seconds else None,
+        "files_s": round(len(items) / seconds, 2) if seconds else None,
+    }
+    if client_metrics:
+        chunk_after = client_metrics.snapshot()["histograms"].get(histogram)
+        if chunk_after:
+            result["chunk_latency"] = latency_summary(histogram_delta(chunk_before, chunk_after))
+    result["hops"] = hop_breakdown(before, after)
+    return result
+
+
+def p99_chunk_ms(result):
+    return (result.get("chunk_latency") or {}).get("p99_ms")
+
+
+def change(old, new):
+    if old is None or new is None:
+        return f"{'-':>21}"
+    percent = f"{100 * (new - old) / old:+.0f}%" if old else ""
+    return f"{old:>8} → {new:<8} {percent:>4}"
+
+
+def compare(results, baseline):
+    """
+    Prints throughput and p99 chunk latency of each phase against a baseline.
+    """
+    print(f"\n{'phase':>9} {'MB/s':>21} {'p99 chunk ms':>23}")
+    for phase, now in results["phases"].items():
+        then = baseline.get("phases", {}).get(phase)
+        if not then:
+            continue
+
+        print(f"{phase:>9} {change(then['mb_s'], now['mb_s'])} "
+              f"{change(p99_chunk_ms(then), p99_chunk_ms(now))}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end DFS benchmark")
+    parser.add_argument("--clusters", type=int, default=2)
+    parser.add_argument("--nodes", type=int, default=3, help="Nodes per cluster")
+    parser.add_argument("--files", default="1MB:8,16MB:4,64MB:1", help="File size mix, SIZE:COUNT,...")
+    parser.add_argument("--data", choices=["random", "text"], default="random")
+    parser.add_argument("--concurrency", type=int, default=4, help="Files uploaded/downloaded/deleted at once")
+    parser.add_argument("--chunk-kb", type=int, help="Chunk size (default: chosen per file by the client)")
+    parser.add_argument("--workers", type=int, default=8, help="Chunk transfers in flight per file")
+    parser.add_argument("--cdc", action="store_true", help="Content-defined chunking with deduplication")
+    parser.add_argument("--replicas", type=int)
+    parser.add_argument("--ec", metavar="K+M")
+    parser.add_argument("--compress", metavar="CODEC")
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=list(PHASES))
+    parser.add_argument("--node-port", type=int, default=25001, help="First node port")
+    parser.add_argument("--cluster-port", type=int, default=27001, help="First cluster manager port")
+    parser.add_argument("--work-dir", help="Scratch directory (default: a new temporary one)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare with")
+    args = parser.parse_args()
+
+    erasure = None
+    if args.ec:
+        k, _, m = args.ec.partition("+")
+        erasure = {"k": int(k), "m": int(m)}
+    with socket.socket() as probe:
+        if probe.connect_ex(("localhost", 6000)) == 0:
+            parser.error("port 6000 is in use; stop the running DFS first")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="dfs-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    # Services and clients keep their state in the scratch directory
+    os.environ["DFS_STATE_DIR"] = os.path.join(work_dir, "state")
+    os.environ["DFS_LOG_DIR"] = os.path.join(work_dir, "logs")
+    os.environ["DFS_JOURNAL_DIR"] = os.path.join(work_dir, "journal")
+    os.environ["DFS_UPLOAD_WORKERS"] = os.environ["DFS_DOWNLOAD_WORKERS"] = str(args.workers)
+    from client import upload, download
+    from client.delete import delete_file
+    from core.metadata import load_metadata
+
+    sizes = parse_mix(args.files)
+    input_dir = os.path.join(work_dir, "input")
+    output_dir = os.path.join(work_dir, "output")
+    os.makedirs(input_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(0)
+    files = []
+    for i, size in enumerate(sizes):
+        path = os.path.join(input_dir, f"bench_{i:04d}.bin")
+        write_file(path, size, args.data, rng)
+        files.append((path, size))
+    names = [(os.path.basename(path), size) for path, size in files]
+    print(f"[INFO] {len(files)} files, {sum(sizes) / (1024 * 1024):.1f} MB of {args.data} data in {work_dir}")
+
+    def upload_one(item):
+        return upload.upload_file(item[0], chunking="cdc" if args.cdc else "fixed", replicas=args.replicas,
+                                  erasure=erasure, fresh=True, compression=args.compress,
+                                  chunk_size=args.chunk_kb * 1024 if args.chunk_kb else None) is not None
+
+    def download_one(item):
+        output_path = os.path.join(output_dir, item[0])
+        try:
+            return download.download_to_path(load_metadata(item[0]), output_path)
+        finally:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    def delete_one(item):
+        return delete_file(item[0]) is not None
+
+    print(f"[INFO] Starting {args.clusters} clusters × {args.nodes} nodes")
+    topology = Topology(args.clusters, args.nodes, work_dir, args.node_port, args.cluster_port)
+    results = {
+        "benchmark": "dfs-end-to-end",
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "keep")},
+        "phases": {},
+    }
+    try:
+        topology.wait_ready()
+        phases = {
+            "upload": (upload_one, files, upload.METRICS, "chunk.upload.seconds"),
+            "download": (download_one, names, download.METRICS, "chunk.download.seconds"),
+            "delete": (delete_one, names, None, None),
+        }
+        for phase in args.phases:
+            operation, items, client_metrics, histogram = phases[phase]
+            # The clients report every chunk; only the results are printed
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run_phase(topology, operation, items, args.concurrency, client_metrics, histogram)
+            results["phases"][phase] = result
+            latency = result.get("chunk_latency")
+            chunks = f", chunk p50 {latency['p50_ms']} ms p99 {latency['p99_ms']} ms" if latency else ""
+            print(f"[OK] {phase:>8}: {result['mb_s']} MB/s, {result['files_s']} files/s, "
+                  f"{result['failed']} failed{chunks}")
+    finally:
+        topology.stop()
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[OK] Results written to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
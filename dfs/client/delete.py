@@ -0,0 +1,121 @@
+# client/delete.py
+import os
+import sys
+from core.transport import Transport
+from core.deletion import delete_from_nodes, failed_deletes
+from core.metadata import delete_metadata, iter_stored_objects, load_metadata
+
+LOAD_BALANCER_URL = "http://localhost:6000"
+
+# Chunk IDs per batch delete request, and batch requests in flight at once
+DELETE_BATCH = int(os.getenv("DFS_DELETE_BATCH", "1000"))
+DELETE_WORKERS = int(os.getenv("DFS_DELETE_WORKERS", "16"))
+
+# Keep-alive connections to the balancer and to the nodes
+BALANCER_HTTP = Transport(timeout=30)
+NODE_HTTP = Transport(timeout=30, pool_size=DELETE_WORKERS)
+
+
+def group_by_node(metadata):
+    """
+    Returns:
+        Dict[str, List[str]]: Node URL → IDs of the chunks and fragments of a
+        file stored there.
+    """
+    by_node = {}
+    for object_id, nodes in iter_stored_objects(metadata):
+        for node in nodes:
+            by_node.setdefault(node, []).append(object_id)
+    return by_node
+
+
+def record_tombstones(failed):
+    """
+    Hands deletes that failed to the clusters, which replay them when the
+    nodes are back.
+
+    Returns:
+        bool: Every failed delete was recorded.
+    """
+    try:
+        r = BALANCER_HTTP.post(f"{LOAD_BALANCER_URL}/tombstones", json={"tombstones": failed})
+        r.raise_for_status()
+        return r.json()["recorded"] == sum(len(ids) for ids in failed.values())
+    except Exception as e:
+        print(f"[ERROR] Could not record tombstones: {e}")
+        return False
+
+
+def release_chunks(metadata):
+    """
+    Releases a content-defined file's references to its deduplicated
+    chunks, which may be shared with other files; the clusters delete the
+    chunks no file refers to any more, and replay failed deletes themselves.
+    """
+    # Each chunk is released by the cluster holding it for this file only
+    chunks = {chunk["id"]: chunk["nodes"] for chunk in metadata["chunks"]}
+    r = BALANCER_HTTP.post(f"{LOAD_BALANCER_URL}/dedup/release", json={"chunks": chunks})
+    r.raise_for_status()
+    result = r.json()
+    print(f"[OK] Released {len(chunks)} chunks, {len(result['deleted'])} no longer referenced were deleted")
+    if result["failed"]:
+        print(f"[WARN] {len(result['failed'])} chunks will be deleted when their nodes are back")
+
+
+def delete_file(file_name):
+    """
+    Deletes a file's chunks from every node, then its metadata.
+
+    Chunks are grouped by node and deleted in batches, all nodes at once.
+    Deletes a node fails (or misses because it is down) become tombstones
+    its cluster replays later; only if those cannot be recorded is the
+    metadata kept, so that the delete can be retried.
+
+    Returns:
+        dict: The file's metadata if it was deleted, otherwise None.
+    """
+    try:
+        metadata = load_metadata(file_name)
+    except Exception as e:
+        print(f"[ERROR] Could not read metadata: {e}")
+        return None
+
+    if metadata is None:
+        print(f"[ERROR] Metadata not found for {file_name}")
+        return None
+
+    if metadata.get("chunking") == "cdc":
+        try:
+            release_chunks(metadata)
+        except Exception as e:
+            print(f"[ERROR] Could not release chunks: {e}")
+            return None
+    else:
+        by_node = group_by_node(metadata)
+        results = delete_from_nodes(NODE_HTTP, by_node, batch_size=DELETE_BATCH, workers=DELETE_WORKERS)
+        failed = failed_deletes(results)
+        for node, statuses in results.items():
+            tag = "[WARN]" if node in failed else "[OK]"
+            print(f"{tag} {node}: {len(statuses) - len(failed.get(node, ()))}/{len(statuses)} chunks deleted")
+        if failed:
+            count = sum(len(ids) for ids in failed.values())
+            if not record_tombstones(failed):
+                print(f"[FAIL] {count} chunks could not be deleted: {failed}")
+                return None
+            print(f"[WARN] {count} chunks will be deleted when their nodes are back")
+
+    try:
+        delete_metadata(file_name)
+    except Exception as e:
+        print(f"[ERROR] Could not delete metadata: {e}")
+        return None
+    print(f"[SUCCESS] Metadata for '{file_name}' deleted.")
+    return metadata
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python client/delete.py <file_basename>")
+        sys.exit(1)
+
+    sys.exit(0 if delete_file(sys.argv[1]) else 1)
@@ -0,0 +1,168 @@
+import io
+import os
+import bisect
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from client.download import ReplicaSelector, fetch_chunk_range, load_file_metadata
+
+# Chunks kept in memory per open file, and how many chunks past the current
+# one are fetched in the background while a file is read sequentially
+CACHE_CHUNKS = int(os.getenv("DFS_CACHE_CHUNKS", "8"))
+READAHEAD_CHUNKS = int(os.getenv("DFS_READAHEAD_CHUNKS", "2"))
+
+
+class DFSFile(io.RawIOBase):
+    """
+    A stored file opened as a seekable, read-only binary file object.
+
+    Chunks are fetched on demand and kept in a bounded LRU cache. While the
+    file is read sequentially the next readahead chunks are fetched in the
+    background, so a streaming reader rarely waits on the network; a seek
+    elsewhere only fetches the chunks it touches. Chunks a read needs are
+    fetched on the reading thread, never queued behind prefetches.
+
+    Example:
+        with DFSFile("dataset.parquet") as f:
+            f.seek(-8, io.SEEK_END)
+            footer = f.read(8)
+
+    Args:
+        file (str | dict): Name of the stored file, or its metadata.
+        cache_chunks (int): Chunks kept in memory (at least readahead + 1).
+        readahead (int): Chunks prefetched ahead of a sequential reader.
+    """
+
+    def __init__(self, file, cache_chunks=CACHE_CHUNKS, readahead=READAHEAD_CHUNKS):
+        super().__init__()
+        metadata = load_file_metadata(file) if isinstance(file, str) else file
+        if metadata is None:
+            raise FileNotFoundError(f"No such file in the DFS: {file}")
+        self.metadata = metadata
+        self.name = metadata["file_name"]
+        self.readahead = readahead
+        self.cache_chunks = max(cache_chunks, readahead + 1)
+
+        self._chunks = metadata["chunks"]
+        self._offsets = [chunk["offset"] for chunk in self._chunks]
+        self._size = metadata.get("file_size")
+        self._pos = 0
+        self._last = -1
+        self._cache = OrderedDict()
+        self._selector = ReplicaSelector()
+        # Runs read-ahead only
+        self._pool = ThreadPoolExecutor(max_workers=max(readahead, 1), thread_name_prefix="dfs-read")
+
+        self._codec = None
+        if metadata.get("erasure"):
+            from core.erasure import ReedSolomon
+            self._codec = ReedSolomon(metadata["erasure"]["k"], metadata["erasure"]["m"])
+
+    @property
+    def size(self):
+        if self._size is None:
+            # Legacy metadata has no sizes: the last chunk tells the total
+            if not self._chunks:
+                self._size = 0
+            else:
+                self._size = self._chunks[-1]["offset"] + len(self._chunk(len(self._chunks) - 1))
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        self._checkClosed()
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._pos + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self._pos = position
+        return position
+
+    def _fetch(self, index):
+        chunk = self._chunks[index]
+        size = chunk["size"] if chunk["size"] is not None else self.metadata["chunk_size"]
+        return fetch_chunk_range(chunk, 0, size, self._selector, self._codec)
+
+    def _chunk(self, index):
+        """
+        Returns the contents of chunk index, from the cache if possible, and
+        schedules read-ahead when the reader moved on to the next chunk. A
+        chunk that is not cached, or whose prefetch has not started yet, is
+        fetched here once the read-ahead is scheduled.
+        """
+        future = self._cache.get(index)
+        fetch = future is None or future.cancel()
+        if fetch:
+            future = self._cache[index] = Future()
+        self._cache.move_to_end(index)
+
+        if index == self._last + 1:
+            for ahead in range(index + 1, min(index + 1 + self.readahead, len(self._chunks))):
+                if ahead not in self._cache:
+                    self._cache[ahead] = self._pool.submit(self._fetch, ahead)
+        self._last = index
+
+        while len(self._cache) > self.cache_chunks:
+            _, evicted = self._cache.popitem(last=False)
+            evicted.cancel()
+
+        if fetch:
+            try:
+                future.set_result(self._fetch(index))
+            except Exception as e:
+                future.set_exception(e)
+        try:
+            return future.result()
+        except Exception:
+            self._cache.pop(index, None)
+            raise
+
+    def readinto(self, buffer):
+        self._checkClosed()
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view) and self._chunks:
+            index = bisect.bisect_right(self._offsets, self._pos) - 1
+            if index < 0:
+                break
+            data = self._chunk(index)
+            within = self._pos - self._chunks[index]["offset"]
+            n = min(len(view) - filled, len(data) - within)
+            if n <= 0:
+                break
+            view[filled:filled + n] = data[within:within + n]
+            filled += n
+            self._pos += n
+        return filled
+
+    def read(self, size=-1):
+        self._checkClosed()
+        if size is None or size < 0:
+            size = max(self.size - self._pos, 0)
+        buffer = bytearray(size)
+        n = self.readinto(buffer)
+        del buffer[n:]
+        return bytes(buffer)
+
+    def readall(self):
+        return self.read()
+
+    def close(self):
+        if not self.closed:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._cache.clear()
+        super().close()
@@ -1,21 +1,43 @@
 # client/download.py
 import os
 import sys
-import json
+import time
+import bisect
 import hashlib
-import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import requests
-from core.chunker import reconstruct_file
+from core.transport import Transport
+from core.chunker import write_at
+from core.compression import DecompressionError, decompress
+from core.integrity import ChecksumMismatch, chunk_digest, merkle_root, verify
+from core.metrics import Metrics
+from core.metadata import load_metadata, stored_digest, stored_size
 
 # Base paths
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-METADATA_DIR = os.path.join(BASE_DIR, "metadata")
-CHUNK_DIR = os.path.join(BASE_DIR, "chunks")
 OUTPUT_DIR = os.path.join(BASE_DIR, "tests", "output_files")
 INPUT_DIR = os.path.join(BASE_DIR, "tests", "input_files")
 
+# Number of chunks fetched concurrently, and the block size used to stream
+# each response body to disk.
+DOWNLOAD_WORKERS = int(os.getenv("DFS_DOWNLOAD_WORKERS", "8"))
+STREAM_BLOCK_SIZE = 256 * 1024
+
+# Fetches the fragments of erasure-coded chunks in parallel
+FRAGMENT_POOL = ThreadPoolExecutor(max_workers=32)
+
+# Keep-alive connections to the nodes, one pool per node
+NODE_HTTP = Transport(timeout=5, pool_size=32)
+
+# Time to fetch each chunk into the output file, failovers included
+METRICS = Metrics()
+
+# Failures after which a chunk or fragment is fetched from another source
+FETCH_ERRORS = (requests.RequestException, ChecksumMismatch, DecompressionError)
+
 # Ensure dirs exist
-os.makedirs(CHUNK_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 def calculate_sha256(file_path):
@@ -28,45 +50,394 @@ def calculate_sha256(file_path):
     except FileNotFoundError:
         return None
 
-def extract_chunk_number(name):
-    match = re.search(r"_chunk(\d+)$", name)
-    return int(match.group(1)) if match else -1
+def load_file_metadata(file_basename):
+    try:
+        return load_metadata(file_basename)
+    except requests.RequestException as e:
+        print(f"[ERROR] Metadata service unavailable: {e}")
+        return None
 
-def download_and_reconstruct(file_basename):
-    metadata_file = os.path.join(METADATA_DIR, f"{file_basename}.json")
-    if not os.path.exists(metadata_file):
-        print(f"[ERROR] Metadata not found for {file_basename}")
-        return
+class ReplicaSelector:
+    """
+    Chooses which replica to read each chunk from.
+
+    Prefers the node with the fewest requests in flight from this client,
+    then the one with the lowest recent time per chunk, so reads spread over
+    replicas and drift toward faster nodes. Nodes that failed are tried last.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = defaultdict(int)
+        self._latency = {}
+        self._failures = defaultdict(int)
+
+    def order(self, nodes):
+        with self._lock:
+            return sorted(nodes, key=lambda n: (self._failures[n], self._in_flight[n], self._latency.get(n, 0.0)))
 
-    with open(metadata_file, "r") as f:
-        metadata = json.load(f)
+    def begin(self, node):
+        with self._lock:
+            self._in_flight[node] += 1
+        return time.monotonic()
 
-    # Sort chunks using safe numeric key
-    chunk_names = sorted(metadata.keys(), key=extract_chunk_number)
+    def end(self, node, started, ok):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._in_flight[node] -= 1
+            if ok:
+                # Exponentially weighted moving average of seconds per chunk
+                previous = self._latency.get(node, elapsed)
+                self._latency[node] = 0.8 * previous + 0.2 * elapsed
+            else:
+                self._failures[node] += 1
 
-    for chunk_id in chunk_names:
-        node_url = metadata[chunk_id]
-        chunk_path = os.path.join(CHUNK_DIR, chunk_id)
+def unpack(chunk, data):
+    """
+    Decompresses a chunk's stored bytes, if it is compressed, and checks the
+    result against the chunk's checksum.
+    """
+    if chunk.get("compression"):
+        data = decompress(data, chunk["compression"])
+        verify(chunk["id"], chunk_digest(data), chunk.get("sha256"))
+    return data
+
+def fetch_compressed(chunk, selector):
+    """
+    Fetches a compressed chunk whole from the first replica that serves a
+    good copy, and decompresses it. Decompression runs in the calling
+    worker thread (the codecs release the GIL), so the chunks of a file are
+    decompressed in parallel.
+
+    Returns:
+        Tuple[bytes, str]: The chunk, and the node it was read from.
+    """
+    error = None
+    for node in selector.order(chunk["nodes"]):
+        started = selector.begin(node)
         try:
-            r = requests.get(f"{node_url}/chunk/{chunk_id}", timeout=5)
+            r = NODE_HTTP.get(f"{node}/chunk/{chunk['id']}")
             r.raise_for_status()
-            with open(chunk_path, "wb") as out_file:
-                out_file.write(r.content)
-            print(f"[OK] Downloaded {chunk_id} from {node_url}")
+            verify(chunk["id"], chunk_digest(r.content), stored_digest(chunk))
+            data = unpack(chunk, r.content)
+            selector.end(node, started, ok=True)
+            return data, node
+        except FETCH_ERRORS as e:
+            selector.end(node, started, ok=False)
+            error = e
+    raise error
+
+def fetch_chunk_into(fd, chunk, selector):
+    """
+    Streams one chunk straight to its offset in the output file, trying its
+    replicas in the selector's order and failing over on error. A transfer
+    that breaks part-way is resumed from the next replica with a Range
+    request instead of starting over. The chunk is hashed as it streams; one
+    that does not match its recorded checksum is fetched again, whole, from
+    the next replica.
+
+    Returns:
+        Tuple[int, str, str]: End offset of the chunk in the file, the node
+        it was read from, and its SHA-256.
+    """
+    if chunk.get("compression"):
+        data, node = fetch_compressed(chunk, selector)
+        write_at(fd, data, chunk["offset"])
+        return chunk["offset"] + len(data), node, chunk.get("sha256")
+
+    error = None
+    offset = chunk["offset"]
+    hasher = hashlib.sha256()
+    for node in selector.order(chunk["nodes"]):
+        headers = {}
+        if offset > chunk["offset"]:
+            headers["Range"] = f"bytes={offset - chunk['offset']}-"
+        started = selector.begin(node)
+        try:
+            with NODE_HTTP.get(f"{node}/chunk/{chunk['id']}", headers=headers, stream=True) as r:
+                r.raise_for_status()
+                if headers and r.status_code != 206:
+                    # The replica ignored the range: take the whole chunk
+                    offset, hasher = chunk["offset"], hashlib.sha256()
+                for block in r.iter_content(STREAM_BLOCK_SIZE):
+                    write_at(fd, block, offset)
+                    hasher.update(block)
+                    offset += len(block)
+            digest = hasher.hexdigest()
+            verify(chunk["id"], digest, chunk.get("sha256"))
+            selector.end(node, started, ok=True)
+            return offset, node, digest
+        except ChecksumMismatch as e:
+            selector.end(node, started, ok=False)
+            print(f"[WARN] Corrupt copy of {chunk['id']} on {node}, trying another replica: {e}")
+            offset, hasher = chunk["offset"], hashlib.sha256()
+            error = e
         except requests.RequestException as e:
-            print(f"[ERROR] Failed to download {chunk_id} from {node_url}: {e}")
-            return
+            selector.end(node, started, ok=False)
+            done = offset - chunk["offset"]
+            resume = f", resuming at byte {done}" if done else ""
+            print(f"[WARN] Failed to download {chunk['id']} from {node}, trying another replica{resume}: {e}")
+            error = e
+    raise error
+
+def fetch_range(object_id, nodes, start, length, selector, expected=None):
+    """
+    Fetches length bytes from offset start of a stored chunk or fragment,
+    trying its replicas in the selector's order.
+
+    Args:
+        expected (str): SHA-256 of the whole object, checked when the range
+            covers all of it; a replica serving a corrupt copy is skipped.
+    """
+    error = None
+    for node in selector.order(nodes):
+        started = selector.begin(node)
+        try:
+            r = NODE_HTTP.get(f"{node}/chunk/{object_id}",
+                              headers={"Range": f"bytes={start}-{start + length - 1}"})
+            if r.status_code == 416:
+                # Past the end of the object (legacy metadata has no sizes)
+                selector.end(node, started, ok=True)
+                return b""
+            r.raise_for_status()
+            data = r.content if r.status_code == 206 else r.content[start:start + length]
+            if expected:
+                verify(object_id, chunk_digest(data), expected)
+            selector.end(node, started, ok=True)
+            return data
+        except FETCH_ERRORS as e:
+            selector.end(node, started, ok=False)
+            error = e
+    raise error
+
+def fetch_fragment(fragment, selector):
+    error = None
+    for node in selector.order(fragment["nodes"]):
+        started = selector.begin(node)
+        try:
+            r = NODE_HTTP.get(f"{node}/chunk/{fragment['id']}")
+            r.raise_for_status()
+            verify(fragment["id"], chunk_digest(r.content), fragment.get("sha256"))
+            selector.end(node, started, ok=True)
+            return fragment["index"], r.content
+        except FETCH_ERRORS as e:
+            selector.end(node, started, ok=False)
+            error = e
+    raise error
+
+def fetch_stripe(chunk, selector, codec):
+    """
+    Rebuilds an erasure-coded chunk from any k of its fragments.
+
+    The k data fragments are requested first, in parallel; each one that
+    fails, or does not match its checksum, is replaced by a request for the
+    next parity fragment. The rebuilt chunk is checked against its own
+    checksum, and decompressed if it was stored compressed.
+
+    Returns:
+        Tuple[bytes, str]: The chunk, and a summary of the fragments it was
+        rebuilt from.
+    """
+    candidates = sorted(chunk["fragments"], key=lambda f: f["index"])
+    spare = iter(candidates[codec.k:])
+    pending = {FRAGMENT_POOL.submit(fetch_fragment, f, selector) for f in candidates[:codec.k]}
+    received = {}
+    error = None
+
+    while pending and len(received) < codec.k:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                index, data = future.result()
+                received[index] = data
+            except FETCH_ERRORS as e:
+                error = e
+                replacement = next(spare, None)
+                if replacement is not None:
+                    pending.add(FRAGMENT_POOL.submit(fetch_fragment, replacement, selector))
+
+    if len(received) < codec.k:
+        raise error or requests.RequestException(f"Not enough fragments for {chunk['id']}")
+    data = codec.decode(received, stored_size(chunk))
+    verify(chunk["id"], chunk_digest(data), stored_digest(chunk))
+    return unpack(chunk, data), f"fragments {sorted(received)}"
+
+def fetch_stripe_into(fd, chunk, selector, codec):
+    """
+    Rebuilds an erasure-coded chunk and writes it at its offset in the
+    output file.
+
+    Returns:
+        Tuple[int, str, str]: End offset of the chunk in the file, a summary
+        of the fragments it was rebuilt from, and its (verified) SHA-256.
+    """
+    data, source = fetch_stripe(chunk, selector, codec)
+    write_at(fd, data, chunk["offset"])
+    return chunk["offset"] + chunk["size"], source, chunk.get("sha256")
+
+def fetch_chunk_range(chunk, start, length, selector, codec=None):
+    """
+    Fetches bytes [start, start + length) of one chunk. For an erasure-coded
+    chunk only the data fragments covering the range are read, falling back
+    to rebuilding the stripe if one of them is unavailable. Whole chunks and
+    whole fragments are checked against their checksums. A compressed chunk
+    is always fetched whole.
+    """
+    if chunk.get("compression"):
+        data = fetch_stripe(chunk, selector, codec)[0] if codec else fetch_compressed(chunk, selector)[0]
+        return data[start:start + length]
+    if codec is None:
+        whole = start == 0 and length == chunk["size"]
+        return fetch_range(chunk["id"], chunk["nodes"], start, length, selector,
+                           expected=chunk.get("sha256") if whole else None)
+
+    fragment_size = codec.fragment_size(chunk["size"])
+    fragments = {f["index"]: f for f in chunk["fragments"]}
+    try:
+        parts = []
+        for index in range(start // fragment_size, (start + length - 1) // fragment_size + 1):
+            low = max(start, index * fragment_size)
+            high = min(start + length, (index + 1) * fragment_size)
+            fragment = fragments[index]
+            whole = high - low == fragment_size
+            parts.append(fetch_range(fragment["id"], fragment["nodes"], low - index * fragment_size,
+                                     high - low, selector, expected=fragment.get("sha256") if whole else None))
+        return b"".join(parts)
+    except (*FETCH_ERRORS, KeyError):
+        data, _ = fetch_stripe(chunk, selector, codec)
+        return data[start:start + length]
+
+def read_range(metadata, start, length, workers=DOWNLOAD_WORKERS):
+    """
+    Reads bytes [start, start + length) of a distributed file, touching only
+    the chunks that overlap the range and fetching just the overlapping part
+    of each one.
+
+    Args:
+        metadata (dict): The file's metadata (see load_file_metadata).
+        start (int): Offset of the first byte.
+        length (int): Number of bytes to read.
+        workers (int): Chunks fetched concurrently.
+
+    Returns:
+        bytes: The range, shorter than length if it runs past the end of the
+        file.
+    """
+    chunks = metadata["chunks"]
+    end = start + length
+    if metadata.get("file_size") is not None:
+        end = min(end, metadata["file_size"])
+    if start >= end or not chunks:
+        return b""
+
+    codec = None
+    if metadata.get("erasure"):
+        from core.erasure import ReedSolomon
+        codec = ReedSolomon(metadata["erasure"]["k"], metadata["erasure"]["m"])
+
+    # Chunks are in file order; legacy metadata has no sizes, but its chunks
+    # all have the nominal size except the last
+    first = max(bisect.bisect_right([c["offset"] for c in chunks], start) - 1, 0)
+    pieces = []
+    for chunk in chunks[first:]:
+        if chunk["offset"] >= end:
+            break
+        size = chunk["size"] if chunk["size"] is not None else metadata["chunk_size"]
+        low, high = max(start, chunk["offset"]), min(end, chunk["offset"] + size)
+        if low < high:
+            pieces.append((chunk, low - chunk["offset"], high - low))
+
+    selector = ReplicaSelector()
+    if len(pieces) == 1:
+        return fetch_chunk_range(*pieces[0], selector, codec)
+    with ThreadPoolExecutor(max_workers=min(workers, len(pieces))) as pool:
+        return b"".join(pool.map(lambda piece: fetch_chunk_range(*piece, selector, codec), pieces))
+
+def download_to_path(metadata, output_path, workers=DOWNLOAD_WORKERS):
+    """
+    Downloads every chunk of a file concurrently into output_path.
+
+    The output file is preallocated when its size is known, and each worker
+    writes its chunk at the chunk's offset, so chunks may arrive in any order.
+    Each chunk is read from its least busy replica, failing over to the others;
+    erasure-coded chunks are rebuilt from any k of their fragments. Every
+    chunk is verified against its checksum as it arrives, and the file as a
+    whole by the Merkle root of those checksums, so it is never read back.
+
+    Returns:
+        bool: True when every chunk was fetched.
+    """
+    fd = os.open(output_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        file_size = metadata.get("file_size")
+        if file_size:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, file_size)
+            else:
+                os.ftruncate(fd, file_size)
+
+        codec = None
+        if metadata.get("erasure"):
+            from core.erasure import ReedSolomon
+            codec = ReedSolomon(metadata["erasure"]["k"], metadata["erasure"]["m"])
+
+        end = 0
+        digests = {}
+        selector = ReplicaSelector()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(METRICS.timed("chunk.download.seconds", fetch_stripe_into), fd, chunk, selector, codec)
+                if "fragments" in chunk else
+                pool.submit(METRICS.timed("chunk.download.seconds", fetch_chunk_into), fd, chunk, selector): chunk
+                for chunk in metadata["chunks"]
+            }
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    chunk_end, node, digests[chunk["offset"]] = future.result()
+                    end = max(end, chunk_end)
+                    print(f"[OK] Downloaded {chunk['id']} from {node}")
+                except FETCH_ERRORS as e:
+                    print(f"[ERROR] Failed to download {chunk['id']} from any replica: {e}")
+                    for pending in futures:
+                        pending.cancel()
+                    return False
+
+        if metadata.get("merkle_root"):
+            root = merkle_root(digests[chunk["offset"]] for chunk in metadata["chunks"])
+            if root != metadata["merkle_root"]:
+                print(f"[ERROR] Merkle root {root} does not match the recorded {metadata['merkle_root']}")
+                return False
+
+        # Legacy metadata has no file size; trim to the last byte written
+        if not file_size:
+            os.ftruncate(fd, end)
+        return True
+    finally:
+        os.close(fd)
+
+def download_and_reconstruct(file_basename):
+    metadata = load_file_metadata(file_basename)
+    if metadata is None:
+        print(f"[ERROR] Metadata not found for {file_basename}")
+        return None
 
     name, ext = os.path.splitext(file_basename)
     output_path = os.path.join(OUTPUT_DIR, f"{name}_reconstructed{ext}")
-    reconstruct_file(chunk_names, output_path)
+    if not download_to_path(metadata, output_path):
+        return None
 
-    # Verify integrity
+    print(f"\n✅ Reconstructed file saved at: {output_path}")
+    if metadata.get("merkle_root"):
+        print(f"Merkle Root       : {metadata['merkle_root']} (verified over {len(metadata['chunks'])} chunks)")
+
+    # Compare with the original when it is at hand (local testing)
     original_path = os.path.join(INPUT_DIR, file_basename)
     orig_hash = calculate_sha256(original_path)
+    if orig_hash is None and metadata.get("merkle_root"):
+        return output_path
     recon_hash = calculate_sha256(output_path)
 
-    print(f"\n✅ Reconstructed file saved at: {output_path}")
     print(f"Original Hash     : {orig_hash}")
     print(f"Reconstructed Hash: {recon_hash}")
 
@@ -78,6 +449,8 @@ def download_and_reconstruct(file_basename):
     else:
         print("⚠️ Could not compare hashes (missing file).")
 
+    return output_path
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python client/download.py <file_basename>")
@@ -0,0 +1,135 @@
+import os
+import json
+import threading
+from urllib.parse import quote
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Journals of uploads that have not finished yet, one per file name
+JOURNAL_DIR = os.getenv("DFS_JOURNAL_DIR", os.path.join(BASE_DIR, "journal"))
+
+
+def journal_path(file_name):
+    return os.path.join(JOURNAL_DIR, quote(file_name, safe="") + ".journal")
+
+
+class UploadJournal:
+    """
+    Append-only local record of an upload in progress, so that an upload
+    that failed or was interrupted can be resumed instead of started over.
+
+    The first line describes the source (file size and modification time,
+    and the chunking, replication and erasure settings). The following lines
+    record the placement the balancer chose for a batch of chunks, or one
+    chunk or fragment confirmed stored on a node, with its SHA-256. A torn
+    last line (from a crash while it was written) is ignored.
+
+    A journal only claims a chunk was stored. Before a resumed upload skips
+    a chunk it checks with the node that the chunk is still there with the
+    same checksum, and sends it again otherwise.
+
+    Args:
+        path (str): Journal file path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.source = None
+        self.placements = None
+        self._stored = {}  # (object_id, node) -> sha256
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads an existing journal.
+
+        Returns:
+            bool: False if there is none.
+        """
+        try:
+            with open(self.path) as f:
+                lines = f.read().split("\n")
+        except FileNotFoundError:
+            return False
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "source" in record:
+                self.source = record["source"]
+            elif "placements" in record:
+                self.placements = {**(self.placements or {}), **record["placements"]}
+            elif "stored" in record:
+                self._stored[(record["stored"], record["node"])] = record["sha256"]
+        return self.source is not None
+
+    def resumes(self, source):
+        """
+        Tells whether this journal records an upload of the same source with
+        the same settings that got as far as placing chunks.
+        """
+        return self.source == source and self.placements is not None
+
+    def start(self, source):
+        """
+        Starts a new journal for an upload, replacing any previous one.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.close()
+        self.source, self.placements, self._stored = source, None, {}
+        self._file = open(self.path, "w")
+        self._append({"source": source})
+
+    def reopen(self):
+        """
+        Continues appending to a journal that was loaded to be resumed.
+        """
+        self._file = open(self.path, "a")
+        # Terminate a torn last line so the next record starts on its own
+        self._file.write("\n")
+
+    def record_placements(self, placements):
+        """
+        Records the placement of a batch of chunks, in addition to those of
+        earlier batches.
+        """
+        self.placements = {**(self.placements or {}), **placements}
+        self._append({"placements": placements})
+
+    def record_stored(self, object_id, node, digest):
+        with self._lock:
+            self._stored[(object_id, node)] = digest
+        self._append({"stored": object_id, "node": node, "sha256": digest})
+
+    def stored(self, object_id, node, digest):
+        """
+        Tells whether the journal recorded this chunk or fragment as stored
+        on node with the given checksum.
+        """
+        with self._lock:
+            return self._stored.get((object_id, node)) == digest
+
+    def stored_count(self):
+        with self._lock:
+            return len(self._stored)
+
+    def _append(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """
+        Deletes the journal, once the upload is committed or abandoned.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
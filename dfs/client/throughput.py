@@ -0,0 +1,71 @@
+import os
+import json
+import threading
+from client.journal import JOURNAL_DIR
+
+# Round trip and transfer rate measured by earlier uploads, kept next to
+# the upload journals
+THROUGHPUT_PATH = os.getenv("DFS_THROUGHPUT_FILE", os.path.join(JOURNAL_DIR, "throughput.json"))
+
+# Weight of a new measurement in the moving averages
+SMOOTHING = 0.3
+
+
+class ThroughputEstimate:
+    """
+    Moving averages of the request round trip and of the bytes per second
+    one upload stream moves, as uploads observe them. Upload clients size
+    the chunks of the next file from these (see choose_chunk_size), and
+    save them so the next run starts from what this one measured.
+
+    Args:
+        path (str): JSON file the estimate is loaded from and saved to.
+    """
+
+    def __init__(self, path=THROUGHPUT_PATH):
+        self.path = path
+        self.rtt = None
+        self.bandwidth = None
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            self.rtt, self.bandwidth = saved.get("rtt_s"), saved.get("bandwidth_bps")
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    @staticmethod
+    def _smooth(average, value):
+        return value if average is None else average + SMOOTHING * (value - average)
+
+    def observe_rtt(self, seconds):
+        with self._lock:
+            self.rtt = self._smooth(self.rtt, seconds)
+
+    def observe_transfers(self, transfers):
+        """
+        Folds in the chunk transfers of one upload.
+
+        Args:
+            transfers (List[Tuple[int, float]]): (bytes, seconds) of each.
+        """
+        if not transfers:
+            return
+        total_bytes = sum(size for size, _ in transfers)
+        with self._lock:
+            # The round trip of each request is not spent moving data
+            busy = sum(seconds for _, seconds in transfers) - len(transfers) * (self.rtt or 0)
+            if total_bytes and busy > 0:
+                self.bandwidth = self._smooth(self.bandwidth, total_bytes / busy)
+
+    def save(self):
+        with self._lock:
+            state = {"rtt_s": self.rtt, "bandwidth_bps": self.bandwidth}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[WARN] Could not save throughput estimate: {e}")
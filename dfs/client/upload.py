@@ -1,60 +1,459 @@
 import os
-import sys
 import json
+import time
+import threading
+from functools import partial
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from core.chunker import split_file
+from core.transport import Transport
+from core.chunker import ChunkReader, ContentDefinedChunkReader, choose_chunk_size
+from core.compression import CODECS, choose_codec, compress
+from core.metadata import DEFAULT_CHUNK_SIZE, build_metadata, fragment_id, load_metadata, save_metadata
+from core.integrity import DIGEST_HEADER, chunk_digest
+from core.metrics import Metrics
+from client.journal import UploadJournal, journal_path
+from client.throughput import ThroughputEstimate
 
 # Configuration
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-CHUNK_DIR = os.path.join(BASE_DIR, "chunks")
 METADATA_DIR = os.path.join(BASE_DIR, "metadata")
 INPUT_DIR = os.path.join(BASE_DIR, "tests", "input_files")
 LOAD_BALANCER_URL = "http://localhost:6000"
 
+# Upload concurrency: worker threads sending chunks, and how many chunks may be
+# read into memory ahead of the network (in flight or queued) at any time.
+UPLOAD_WORKERS = int(os.getenv("DFS_UPLOAD_WORKERS", "8"))
+MAX_IN_FLIGHT = int(os.getenv("DFS_MAX_IN_FLIGHT", str(UPLOAD_WORKERS * 2)))
+
+# Chunks placed per request to the balancer; an upload reads at most one
+# batch ahead of the chunks in flight
+PLACE_BATCH = int(os.getenv("DFS_PLACE_BATCH", "64"))
+
+# Keep-alive connections to the balancer and to the nodes, one pool per
+# server, sized so every upload worker can hold a connection to each node
+BALANCER_HTTP = Transport(timeout=30)
+NODE_HTTP = Transport(timeout=5, pool_size=max(UPLOAD_WORKERS, 1))
+
+# Time to send each chunk (every replica, or every fragment of a stripe)
+METRICS = Metrics()
+
+# Request round trip and per-stream transfer rate measured by uploads, which
+# chunk sizes are chosen from
+THROUGHPUT = ThroughputEstimate()
+
 # Ensure required directories exist
-os.makedirs(CHUNK_DIR, exist_ok=True)
 os.makedirs(METADATA_DIR, exist_ok=True)
 
-def upload_file(file_path):
-    if not os.path.exists(file_path):
-        print(f"[ERROR] File not found: {file_path}")
-        return
+def place_chunks(chunks, dedup=False, replicas=None):
+    """
+    Asks the global balancer for the placement of every chunk in one request.
 
-    print(f"[INFO] Splitting file: {file_path}")
-    chunk_files = split_file(file_path, output_dir=CHUNK_DIR)
+    Args:
+        chunks (Iterable[Tuple[str, int]]): (chunk_id, size) of each unique chunk.
+        dedup (bool): Chunks are content-addressed; those already stored are
+            referenced instead of placed again.
+        replicas (int): Replication factor, or None for the cluster default.
 
-    file_name = os.path.basename(file_path)
-    metadata = {}
+    Returns:
+        Dict[str, dict]: chunk_id → {"cluster", "nodes", "existing"}.
+    """
+    response = BALANCER_HTTP.post(
+        f"{LOAD_BALANCER_URL}/place",
+        json={
+            "chunks": [{"id": chunk_id, "size": size} for chunk_id, size in chunks],
+            "dedup": dedup,
+            "replicas": replicas
+        }
+    )
+    response.raise_for_status()
+    return response.json()["placements"]
+
+def send_chunk(node, chunk_name, data, digest):
+    """
+    Stores a single chunk directly on its assigned node, sending the bytes
+    as the raw request body. The node rejects the chunk unless it matches
+    the given SHA-256.
+    """
+    response = NODE_HTTP.put(
+        f"{node}/chunk/{chunk_name}",
+        data=data,
+        headers={"Content-Type": "application/octet-stream", DIGEST_HEADER: digest}
+    )
+    response.raise_for_status()
+    return response.json()
+
+def is_stored(node, chunk_name, digest):
+    """
+    Checks with a node that it holds a chunk with the given SHA-256.
+    """
+    try:
+        response = NODE_HTTP.head(f"{node}/chunk/{chunk_name}")
+    except requests.exceptions.RequestException:
+        return False
+    return response.status_code == 200 and response.headers.get(DIGEST_HEADER) == digest
+
+def store_chunk(journal, node, chunk_name, data, digest):
+    """
+    Stores a chunk on a node unless the journal and the node agree that it
+    is already there, and journals it.
 
-    for chunk_name in chunk_files:
-        chunk_path = os.path.join(CHUNK_DIR, chunk_name)
+    Returns:
+        bool: True if the chunk was sent, False if it was already stored.
+    """
+    if journal.stored(chunk_name, node, digest) and is_stored(node, chunk_name, digest):
+        return False
+    send_chunk(node, chunk_name, data, digest)
+    journal.record_stored(chunk_name, node, digest)
+    return True
 
+def send_compressed(journal, nodes, chunk_name, data, compression):
+    """
+    Compresses one chunk and stores it on each of its nodes in turn.
+
+    Returns:
+        Tuple[dict, bool]: Fields for the chunk's metadata entry, and
+        whether any copy had to be sent.
+    """
+    payload = compress(data, compression)
+    digest = chunk_digest(payload)
+    sent = False
+    for node in nodes:
+        sent |= store_chunk(journal, node, chunk_name, payload, digest)
+    return {"stored_size": len(payload), "stored_sha256": digest}, sent
+
+def send_stripe(journal, codec, nodes, chunk_name, data, compression=None):
+    """
+    Erasure-codes one chunk (compressed first, if a codec is given) and
+    stores fragment i on nodes[i]. When the cluster has fewer nodes than
+    fragments, nodes are reused round-robin.
+
+    Returns:
+        Tuple[dict, bool]: Fields for the chunk's metadata entry (its
+        fragments), and whether any fragment had to be sent.
+    """
+    entry = {}
+    if compression:
+        data = compress(data, compression)
+        entry = {"stored_size": len(data), "stored_sha256": chunk_digest(data)}
+    fragments = []
+    sent = False
+    for index, fragment in enumerate(codec.encode(data)):
+        node = nodes[index % len(nodes)]
+        name = fragment_id(chunk_name, index)
+        digest = chunk_digest(fragment)
+        sent |= store_chunk(journal, node, name, fragment, digest)
+        fragments.append({"id": name, "index": index, "nodes": [node], "sha256": digest})
+    entry["fragments"] = fragments
+    return entry, sent
+
+def abandon(journal, file_name):
+    """
+    Drops the journal of an upload that will not be resumed. Chunks it
+    stored are left to the cluster managers' orphan collection, except that
+    the references a deduplicated upload took on its chunks are released
+    here, unless the upload was in fact committed.
+    """
+    if journal.placements and journal.source.get("chunking") == "cdc":
+        chunks = {chunk_id: placement["nodes"] for chunk_id, placement in journal.placements.items()}
         try:
-            with open(chunk_path, "rb") as chunk_file:
-                response = requests.post(
-                    f"{LOAD_BALANCER_URL}/upload_chunk",
-                    files={"chunk": chunk_file},
-                    data={"chunk_id": chunk_name},
-                    timeout=5
-                )
+            committed = load_metadata(file_name)
+            if not (committed and {c["id"] for c in committed["chunks"]} == set(chunks)):
+                response = BALANCER_HTTP.post(f"{LOAD_BALANCER_URL}/dedup/release", json={"chunks": chunks})
                 response.raise_for_status()
-                result = response.json()
-                print(f"[OK] Uploaded {chunk_name} → {result['cluster']} / {result['node']}")
-                metadata[chunk_name] = result['node']
         except requests.exceptions.RequestException as e:
-            print(f"[FAIL] Upload failed for {chunk_name}: {e}")
+            print(f"[WARN] Could not release the chunks of the abandoned upload: {e}")
+    journal.discard()
+
+def adaptive_chunk_size(file_size, workers):
+    """
+    Chooses a file's chunk size from its size, the number of healthy nodes
+    and the throughput measured so far. Asking the balancer for the node
+    count also measures the round trip.
+    """
+    nodes = None
+    try:
+        started = time.perf_counter()
+        response = BALANCER_HTTP.get(f"{LOAD_BALANCER_URL}/status", timeout=5)
+        response.raise_for_status()
+        THROUGHPUT.observe_rtt(time.perf_counter() - started)
+        nodes = response.json().get("active_nodes")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"[WARN] Could not get the cluster status ({e}); sizing chunks by file size only")
+    return choose_chunk_size(file_size, nodes=nodes, streams=workers, rtt=THROUGHPUT.rtt,
+                             bandwidth=THROUGHPUT.bandwidth)
+
+def upload_file(file_path, workers=UPLOAD_WORKERS, max_in_flight=MAX_IN_FLIGHT, chunking="fixed",
+                replicas=None, erasure=None, fresh=False, compression=None, chunk_size=None):
+    """
+    Uploads a file, resuming an earlier attempt at the same upload if it
+    left a journal, unless fresh is set. With a compression codec, every
+    chunk that a quick sample shows to be compressible is compressed by the
+    upload workers before it is sent. Without a chunk_size, fixed-size
+    chunks are sized for the file by adaptive_chunk_size; content-defined
+    chunks keep the default average size, since a file chunked with another
+    average would share no chunks with the files already stored.
+
+    Returns:
+        dict: The file's metadata once it is uploaded, otherwise None.
+    """
+    if not os.path.exists(file_path):
+        print(f"[ERROR] File not found: {file_path}")
+        return None
+
+    print(f"[INFO] Streaming file: {file_path}")
+    file_name = os.path.basename(file_path)
+    file_size = os.path.getsize(file_path)
+    failures = []
+    stored = {}
+    digests = {}
+    codecs = {}
+    skipped = []
+
+    # The upload is journaled as it goes; a journal of the same source and
+    # settings left by an earlier attempt is resumed, with its chunk size
+    # (journals written without one get a newly chosen size)
+    stat = os.stat(file_path)
+    journal = UploadJournal(journal_path(file_name))
+    journal.load()
+    if chunk_size is None:
+        previous = journal.source or {}
+        if chunking == "cdc":
+            chunk_size = DEFAULT_CHUNK_SIZE
+        elif (not fresh and previous.get("chunk_size")
+              and (previous.get("size"), previous.get("mtime_ns")) == (file_size, stat.st_mtime_ns)):
+            chunk_size = previous["chunk_size"]
+        else:
+            chunk_size = adaptive_chunk_size(file_size, workers)
+    print(f"[INFO] Chunk size: {chunk_size // 1024} KB")
+    source = {"file": file_name, "size": file_size, "mtime_ns": stat.st_mtime_ns, "chunk_size": chunk_size,
+              "chunking": chunking, "replicas": replicas, "erasure": erasure, "compression": compression}
+    resumed = journal.source is not None and not fresh and journal.resumes(source)
+    if resumed:
+        journal.reopen()
+        print(f"[INFO] Resuming upload: {journal.stored_count()} chunks journaled as stored")
+    else:
+        if journal.source is not None:
+            abandon(journal, file_name)
+        journal.start(source)
+
+    codec = None
+    if erasure:
+        from core.erasure import ReedSolomon
+        codec = ReedSolomon(erasure["k"], erasure["m"])
+        # Every fragment of a stripe goes to a distinct node where possible
+        replicas = erasure["k"] + erasure["m"]
+
+    # Backpressure: the reader blocks once max_in_flight chunks are pending,
+    # so memory stays bounded while the pool keeps every worker busy.
+    slots = threading.BoundedSemaphore(max(max_in_flight, workers))
+    abort = threading.Event()
+
+    # (bytes, seconds) of every chunk actually sent, for the throughput estimate
+    transfers = []
+
+    def timed(send, size):
+        def run(*args):
+            started = time.perf_counter()
+            result = send(*args)
+            elapsed = time.perf_counter() - started
+            METRICS.observe("chunk.upload.seconds", elapsed)
+            # Compressed and striped sends also return metadata entry fields
+            sent = result[1] if isinstance(result, tuple) else result
+            if sent:
+                transfers.append((size, elapsed))
+            return result
+        return run
+
+    def on_done(chunk_name, cluster, node, future):
+        slots.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"[FAIL] Upload failed for {chunk_name} to {node}: {e}")
+            failures.append(chunk_name)
+            abort.set()
+            return
+        if isinstance(result, tuple):
+            stored[chunk_name], result = result
+        if not result:
+            skipped.append(chunk_name)
+            print(f"[SKIP] {chunk_name} already stored on {cluster} / {node}")
             return
+        print(f"[OK] Uploaded {chunk_name} → {cluster} / {node}")
+
+    def submit(pool, send, size, chunk_name, cluster, node, *args):
+        """
+        Hands one transfer to the pool once a slot is free, reporting it to
+        on_done as a transfer of chunk_name to node.
+
+        Returns:
+            bool: False if the upload was aborted while waiting for a slot.
+        """
+        slots.acquire()
+        if abort.is_set():
+            slots.release()
+            return False
+        future = pool.submit(timed(send, size), journal, *args)
+        future.add_done_callback(partial(on_done, chunk_name, cluster, node))
+        return True
+
+    dedup = chunking == "cdc"
+    reader_class = ContentDefinedChunkReader if dedup else ChunkReader
+    # A resumed upload keeps the placements it journaled
+    placements = dict(journal.placements) if resumed else {}
+    # (chunk_name, offset, size) of every chunk, in file order
+    layout = []
 
-    metadata_path = os.path.join(METADATA_DIR, f"{file_name}.json")
-    with open(metadata_path, "w") as f:
-        json.dump(metadata, f, indent=2)
+    def name_chunk(chunk_name, view):
+        """
+        Chooses a chunk's codec from a sample. A content-defined chunk stored
+        compressed is named after its codec too, so that deduplication never
+        mixes compressed and plain copies.
+        """
+        chosen = choose_codec(view, compression)
+        if chosen and dedup:
+            digests[f"{chunk_name}.{chosen}"] = chunk_name
+            chunk_name = f"{chunk_name}.{chosen}"
+        codecs[chunk_name] = chosen
+        return chunk_name
 
-    print(f"\n[SUCCESS] File uploaded. Metadata saved at: {metadata_path}")
+    with reader_class(file_path, chunk_size) as reader, ThreadPoolExecutor(max_workers=workers) as pool:
+        # Chunks are read, placed and sent PLACE_BATCH at a time, so that
+        # content-defined chunks are hashed while earlier ones are in transit
+        # and at most one batch is read ahead of the chunks in flight
+        pending = iter(reader)
+        submitted = set()
+        while not abort.is_set():
+            batch = list(islice(pending, PLACE_BATCH))
+            if not batch:
+                break
+            if compression:
+                batch = [(name_chunk(chunk_name, view), offset, view) for chunk_name, offset, view in batch]
+
+            # Erasure-coded chunks are placed by fragment size, and
+            # compressed ones by their size before compression
+            sizes = {}
+            for chunk_name, _, view in batch:
+                if chunk_name not in placements:
+                    sizes.setdefault(chunk_name, codec.fragment_size(len(view)) if codec else len(view))
+            if sizes:
+                try:
+                    placed = place_chunks(sizes.items(), dedup=dedup, replicas=replicas)
+                except requests.exceptions.RequestException as e:
+                    print(f"[FAIL] Could not place chunks: {e}")
+                    failures.extend(sizes)
+                    break
+                placements.update(placed)
+                journal.record_placements(placed)
+
+            for chunk_name, offset, view in batch:
+                layout.append((chunk_name, offset, len(view)))
+                placement = placements[chunk_name]
+                # A repeated chunk within the file is only sent once
+                if chunk_name in submitted:
+                    continue
+                submitted.add(chunk_name)
+                # Content-defined chunks are already named by their SHA-256
+                digest = digests.get(chunk_name) or (chunk_name if dedup else chunk_digest(view))
+                digests[chunk_name] = digest
+                if placement["existing"]:
+                    print(f"[DEDUP] {chunk_name} already stored on {', '.join(placement['nodes'])}")
+                    continue
+
+                cluster, nodes = placement["cluster"], placement["nodes"]
+                if codec:
+                    if not submit(pool, send_stripe, len(view), chunk_name, cluster, ", ".join(nodes),
+                                  codec, nodes, chunk_name, view, codecs.get(chunk_name)):
+                        break
+                    continue
+
+                if codecs.get(chunk_name):
+                    # Compressed once, then sent to every replica
+                    if not submit(pool, send_compressed, len(view), chunk_name, cluster, ", ".join(nodes),
+                                  nodes, chunk_name, view, codecs[chunk_name]):
+                        break
+                    continue
+
+                # Replicas are sent in parallel, each taking its own slot. The
+                # next chunks are paged in from disk while earlier ones are still
+                # in transit.
+                for node in nodes:
+                    if not submit(pool, store_chunk, len(view), chunk_name, cluster, node,
+                                  node, chunk_name, view, digest):
+                        break
+                if abort.is_set():
+                    break
+
+    THROUGHPUT.observe_transfers(transfers)
+    THROUGHPUT.save()
+
+    if failures:
+        journal.close()
+        print(f"[FAIL] Upload incomplete; run it again to resume from {journal.path}")
+        return None
+    if skipped:
+        print(f"[INFO] {len(skipped)} chunk copies were already stored by an earlier attempt")
+
+    chunks = [
+        {"id": chunk_name, "offset": offset, "size": size, "sha256": digests[chunk_name],
+         **({} if codec else {"nodes": placements[chunk_name]["nodes"]}),
+         **({"compression": codecs[chunk_name]} if codecs.get(chunk_name) else {}),
+         **stored.get(chunk_name, {})}
+        for chunk_name, offset, size in layout
+    ]
+    if compression:
+        compressed = [c for c in chunks if "stored_size" in c]
+        before = sum(c["size"] for c in compressed)
+        after = sum(c["stored_size"] for c in compressed)
+        print(f"[INFO] Compressed {len(compressed)}/{len(chunks)} chunks with {compression}: "
+              f"{before / (1024 * 1024):.1f} MB → {after / (1024 * 1024):.1f} MB")
+    metadata = build_metadata(file_name, file_size, chunk_size, chunks, chunking=chunking, erasure=erasure)
+    try:
+        save_metadata(metadata)
+    except requests.exceptions.RequestException as e:
+        # Keep the upload: the global balancer imports this file on startup
+        metadata_path = os.path.join(METADATA_DIR, f"{file_name}.json")
+        with open(metadata_path, "w") as f:
+            json.dump(metadata, f, indent=2)
+        print(f"[WARN] Metadata service unavailable ({e}); metadata saved at {metadata_path} for import")
+        journal.discard()
+        return metadata
+
+    journal.discard()
+    print(f"\n[SUCCESS] File uploaded. Metadata saved to {LOAD_BALANCER_URL}/files/{file_name}")
+    return metadata
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python client/upload.py <filename>")
-        sys.exit(1)
+    import argparse
+    parser = argparse.ArgumentParser(description="Upload a file from tests/input_files to the DFS")
+    parser.add_argument("filename")
+    parser.add_argument("--cdc", action="store_true",
+                        help="Use content-defined chunking and deduplicate against stored chunks")
+    parser.add_argument("--replicas", type=int,
+                        help="Number of nodes each chunk is stored on (default: cluster setting)")
+    parser.add_argument("--ec", metavar="K+M",
+                        help="Erasure-code each chunk into K data and M parity fragments "
+                             "instead of replicating")
+    parser.add_argument("--compress", metavar="CODEC", choices=sorted(CODECS),
+                        help=f"Compress compressible chunks with CODEC ({', '.join(sorted(CODECS))})")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Start over instead of resuming an interrupted upload of the same file")
+    parser.add_argument("--chunk-kb", type=int,
+                        help="Chunk size in KB "
+                             "(default: chosen from the file size, nodes and measured throughput)")
+    args = parser.parse_args()
+
+    erasure = None
+    if args.ec:
+        if args.cdc or args.replicas:
+            parser.error("--ec cannot be combined with --cdc or --replicas")
+        k, _, m = args.ec.partition("+")
+        if not (k.isdigit() and m.isdigit()):
+            parser.error("--ec expects K+M, e.g. 4+2")
+        erasure = {"k": int(k), "m": int(m)}
 
-    file_path = os.path.join(INPUT_DIR, sys.argv[1])
-    upload_file(file_path)
+    file_path = os.path.join(INPUT_DIR, args.filename)
+    upload_file(file_path, chunking="cdc" if args.cdc else "fixed", replicas=args.replicas, erasure=erasure,
+                fresh=args.fresh, compression=args.compress,
+                chunk_size=args.chunk_kb * 1024 if args.chunk_kb else None)
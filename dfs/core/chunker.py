@@ -1,4 +1,74 @@
 import os
+import math
+import mmap
+import shutil
+import hashlib
+import numpy as np
+
+# Gear table for the content-defined chunking rolling hash
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], 'big') for i in range(256)]
+GEAR_TABLE = np.array(GEAR, dtype=np.uint32)
+
+# Bytes hashed per vectorised step while looking for a cut point; a chunk
+# scans at most one block past its cut
+GEAR_BLOCK = 64 * 1024
+
+# Adaptive chunk sizes are powers of two between these bounds
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = int(os.getenv("DFS_MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
+
+# Most chunks a file is split into (each costs a metadata entry and a
+# placement); larger files get larger chunks
+MAX_CHUNKS = int(os.getenv("DFS_MAX_CHUNKS", "4096"))
+
+# Chunks per upload stream (or node, if there are more nodes), so the file
+# spreads over the cluster and a slow or failed transfer holds up little of it
+CHUNKS_PER_STREAM = 8
+
+# Share of a chunk transfer that should be spent moving data rather than on
+# the request round trip; sets the smallest worthwhile chunk
+TRANSFER_SHARE = 0.8
+
+# Smallest chunk when the round trip and bandwidth were never measured
+UNMEASURED_MIN_CHUNK_SIZE = 1024 * 1024
+
+
+def chunk_name(file_name, index):
+    return f"{file_name}_chunk{index:05d}"
+
+
+def choose_chunk_size(file_size, nodes=None, streams=8, rtt=None, bandwidth=None):
+    """
+    Picks the chunk size for a file.
+
+    The file is cut into about CHUNKS_PER_STREAM chunks per upload stream
+    (or per node, when there are more nodes than streams), but never into
+    chunks so small that the per-request round trip outweighs the transfer
+    (by TRANSFER_SHARE, given the measured round trip and per-stream
+    bandwidth), nor into more than MAX_CHUNKS chunks. Small files therefore
+    go in one or a few chunks, and huge files in large ones.
+
+    Args:
+        file_size (int): Size of the file in bytes.
+        nodes (int): Healthy nodes, if known.
+        streams (int): Chunks the client transfers at once.
+        rtt (float): Measured request round trip, in seconds.
+        bandwidth (float): Measured bytes per second of one transfer stream.
+
+    Returns:
+        int: A power of two between MIN_CHUNK_SIZE and MAX_CHUNK_SIZE.
+    """
+    parallel = max(streams, nodes or 0, 1)
+    if rtt and bandwidth:
+        floor = rtt * bandwidth * TRANSFER_SHARE / (1 - TRANSFER_SHARE)
+    else:
+        floor = UNMEASURED_MIN_CHUNK_SIZE
+    size = max(file_size / (parallel * CHUNKS_PER_STREAM), floor, file_size / MAX_CHUNKS, MIN_CHUNK_SIZE)
+    size = 1 << round(math.log2(size))
+    while size > MAX_CHUNK_SIZE and size > MIN_CHUNK_SIZE:
+        size >>= 1
+    return size
+
 
 def split_file(file_path, output_dir="chunks", chunk_size=1024 * 1024):
     """
@@ -7,7 +77,8 @@ def split_file(file_path, output_dir="chunks", chunk_size=1024 * 1024):
     Args:
         file_path (str): Path to the input file.
         output_dir (str): Directory to save chunks.
-        chunk_size (int): Size of each chunk in bytes (default: 1MB).
+        chunk_size (int): Size of each chunk in bytes (default: 1MB; pass
+            choose_chunk_size(...) to size chunks by the file).
 
     Returns:
         List[str]: Ordered list of chunk file names.
@@ -22,16 +93,207 @@ def split_file(file_path, output_dir="chunks", chunk_size=1024 * 1024):
             chunk = f.read(chunk_size)
             if not chunk:
                 break
-            chunk_name = f"{file_name}_chunk{i:05d}" 
-            chunk_path = os.path.join(output_dir, chunk_name)
+            name = chunk_name(file_name, i)
+            chunk_path = os.path.join(output_dir, name)
             with open(chunk_path, 'wb') as cf:
                 cf.write(chunk)
-            chunks.append(chunk_name)
+            chunks.append(name)
             i += 1
 
     return chunks
 
 
+class ChunkReader:
+    """
+    Streams a file as fixed-size chunks without staging them on disk.
+
+    The file is memory-mapped and each chunk is yielded as a memoryview slice
+    of the mapping, so no bytes are copied until a consumer reads them.
+    Use as a context manager; views must not be used after it exits.
+
+    Args:
+        file_path (str): Path to the input file.
+        chunk_size (int): Size of each chunk in bytes (default: 1MB).
+    """
+
+    def __init__(self, file_path, chunk_size=1024 * 1024):
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path)
+        self.chunk_size = chunk_size
+        self.file_size = os.path.getsize(file_path)
+        self._file = open(file_path, 'rb')
+        # mmap cannot map an empty file
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.file_size else None
+        if self._map is not None and hasattr(mmap, "MADV_SEQUENTIAL"):
+            # Let the kernel read ahead of the chunk currently being sent
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def __len__(self):
+        return -(-self.file_size // self.chunk_size)
+
+    def __iter__(self):
+        """
+        Yields:
+            Tuple[str, int, memoryview]: Chunk name, offset and data view.
+        """
+        if self._map is None:
+            return
+        view = memoryview(self._map)
+        try:
+            for i, offset in enumerate(range(0, self.file_size, self.chunk_size)):
+                yield chunk_name(self.file_name, i), offset, view[offset:offset + self.chunk_size]
+        finally:
+            view.release()
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A consumer still holds a view; the mapping is released
+                # once the last view is garbage collected.
+                pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def gear_hashes(gears):
+    """
+    Returns the Gear hash after each byte of a run, given the run's Gear
+    table values, with the hash starting from 0 at its first byte.
+
+    Each step shifts the hash left by one bit, so after 32 bytes a byte no
+    longer affects it: the hash at i is the sum of gears[i - j] << j over
+    j < 32. Sums over windows of 1, 2, 4, 8 and 16 bytes are doubled in turn,
+    five array operations instead of a Python step per byte.
+    """
+    hashes = gears.copy()
+    span = 1
+    while span < 32 and span < len(hashes):
+        hashes[span:] += hashes[:-span] << np.uint32(span)
+        span *= 2
+    return hashes
+
+
+def cdc_boundaries(data, min_size, avg_size, max_size):
+    """
+    Finds content-defined chunk boundaries with a Gear rolling hash.
+
+    Cut points depend only on nearby content, so an insertion or deletion
+    shifts the boundaries around the edit and leaves the rest unchanged.
+    Hashing starts min_size bytes into each chunk, and a stricter mask is
+    used before avg_size than after it, which keeps sizes close to average.
+    The hash is computed with NumPy a block at a time, straight from data
+    without copying it.
+
+    Args:
+        data (bytes-like): Content to split.
+        min_size (int): Smallest chunk size, except for the final chunk.
+        avg_size (int): Target average chunk size (a power of two).
+        max_size (int): Largest chunk size.
+
+    Yields:
+        int: End offset of each chunk.
+    """
+    bits = avg_size.bit_length() - 1
+    mask_strict = ((1 << (bits + 1)) - 1) << (32 - bits - 1)
+    mask_loose = ((1 << (bits - 1)) - 1) << (32 - bits + 1)
+    content = np.frombuffer(data, dtype=np.uint8)
+    length = len(content)
+    start = 0
+
+    while start < length:
+        end = min(start + max_size, length)
+        if end - start <= min_size:
+            yield end
+            return
+
+        cut = None
+        hashed = start + min_size
+        normal = min(start + avg_size, end)
+        for block in range(hashed, end, GEAR_BLOCK):
+            block_end = min(block + GEAR_BLOCK, end)
+            # The 31 bytes before the block still count towards its hashes
+            lead = max(hashed, block - 31)
+            hashes = gear_hashes(GEAR_TABLE[content[lead:block_end]])[block - lead:]
+            split = min(max(normal - block, 0), len(hashes))
+            hits = np.flatnonzero((hashes[:split] & np.uint32(mask_strict)) == 0)
+            if not len(hits):
+                hits = split + np.flatnonzero((hashes[split:] & np.uint32(mask_loose)) == 0)
+            if len(hits):
+                cut = block + int(hits[0]) + 1
+                break
+
+        cut = cut or end
+        yield cut
+        start = cut
+
+
+class ContentDefinedChunkReader(ChunkReader):
+    """
+    Streams a file as content-defined chunks addressed by their SHA-256.
+
+    Identical content yields identical chunk names regardless of the file it
+    comes from or its position, which lets the cluster deduplicate chunks.
+
+    Args:
+        file_path (str): Path to the input file.
+        avg_size (int): Target average chunk size (default: 1MB).
+        min_size (int): Minimum chunk size (default: avg_size / 4).
+        max_size (int): Maximum chunk size (default: avg_size * 4).
+    """
+
+    def __init__(self, file_path, avg_size=1024 * 1024, min_size=None, max_size=None):
+        super().__init__(file_path, chunk_size=avg_size)
+        self.min_size = min_size or avg_size // 4
+        self.max_size = max_size or avg_size * 4
+
+    def __len__(self):
+        raise TypeError("chunk count is only known after chunking")
+
+    def __iter__(self):
+        """
+        Yields:
+            Tuple[str, int, memoryview]: Content hash, offset and data view.
+        """
+        if self._map is None:
+            return
+        view = memoryview(self._map)
+        boundaries = cdc_boundaries(view, self.min_size, self.chunk_size, self.max_size)
+        try:
+            offset = 0
+            for end in boundaries:
+                chunk = view[offset:end]
+                yield hashlib.sha256(chunk).hexdigest(), offset, chunk
+                offset = end
+        finally:
+            # The boundary scan holds an array over the view until it is closed
+            boundaries.close()
+            view.release()
+
+
+def assemble_file(buffers, output_path):
+    """
+    Writes an ordered iterable of buffers to a file.
+
+    Args:
+        buffers (Iterable[bytes-like]): Chunk contents in file order.
+        output_path (str): Path to the output file.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    total = 0
+    with open(output_path, 'wb') as out_file:
+        for buf in buffers:
+            total += out_file.write(buf)
+    return total
+
 
 def reconstruct_file(chunk_files, output_path, input_dir="chunks"):
     """
@@ -43,7 +305,26 @@ def reconstruct_file(chunk_files, output_path, input_dir="chunks"):
         input_dir (str): Directory where chunks are located.
     """
     with open(output_path, 'wb') as out_file:
-        for chunk_name in chunk_files:
-            chunk_path = os.path.join(input_dir, chunk_name)
+        for name in chunk_files:
+            chunk_path = os.path.join(input_dir, name)
             with open(chunk_path, 'rb') as cf:
-                out_file.write(cf.read())
+                shutil.copyfileobj(cf, out_file)
+
+
+def write_at(fd, data, offset):
+    """
+    Writes a buffer at an absolute offset of an open file descriptor.
+
+    Uses positional writes so several threads can fill different regions of
+    the same file without sharing a file position.
+
+    Args:
+        fd (int): File descriptor opened for writing.
+        data (bytes-like): Buffer to write.
+        offset (int): Byte offset in the file.
+    """
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
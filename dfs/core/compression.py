@@ -0,0 +1,95 @@
+import os
+import bz2
+import lzma
+import zlib
+
+# Compressibility sampling: a chunk is compressed only if SAMPLE_COUNT
+# slices of SAMPLE_SIZE bytes, spread over it, shrink below SAMPLE_RATIO of
+# their size with fast zlib. Chunks under MIN_SIZE are never compressed.
+SAMPLE_SIZE = 16 * 1024
+SAMPLE_COUNT = 3
+SAMPLE_RATIO = float(os.getenv("DFS_COMPRESSION_SAMPLE_RATIO", "0.9"))
+MIN_SIZE = 1024
+
+# Compression level of the zlib codec: the fastest, which still shrinks
+# text several-fold and keeps up with the network
+ZLIB_LEVEL = int(os.getenv("DFS_ZLIB_LEVEL", "1"))
+
+
+class DecompressionError(ValueError):
+    """
+    Raised when a stored chunk cannot be decompressed with its codec.
+    """
+
+
+# Codec name → (compress, decompress), both taking and returning bytes
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, ZLIB_LEVEL), zlib.decompress),
+    "lzma": (lambda data: lzma.compress(data, preset=1), lzma.decompress),
+    "bz2": (lambda data: bz2.compress(data, 9), bz2.decompress),
+}
+
+
+def register_codec(name, compress, decompress):
+    """
+    Makes a codec available to uploads and downloads by name.
+
+    Args:
+        name (str): Name recorded in the metadata of chunks compressed with it.
+        compress (Callable[[bytes], bytes]): Compresses a whole chunk.
+        decompress (Callable[[bytes], bytes]): Inverse of compress.
+    """
+    CODECS[name] = (compress, decompress)
+
+
+try:
+    import zstandard
+    register_codec("zstd", lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+                   lambda data: zstandard.ZstdDecompressor().decompress(data))
+except ImportError:
+    pass
+
+
+def is_compressible(data):
+    """
+    Estimates from a few samples whether compressing a chunk is worth it,
+    without compressing all of it.
+    """
+    if len(data) < MIN_SIZE:
+        return False
+    if len(data) <= SAMPLE_SIZE * SAMPLE_COUNT:
+        sample = bytes(data)
+    else:
+        step = (len(data) - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+        sample = b"".join(bytes(data[i * step:i * step + SAMPLE_SIZE]) for i in range(SAMPLE_COUNT))
+    return len(zlib.compress(sample, 1)) < SAMPLE_RATIO * len(sample)
+
+
+def choose_codec(data, codec):
+    """
+    Returns the codec to store a chunk with: codec if the chunk looks
+    compressible, otherwise None (store it as is).
+    """
+    if codec is None:
+        return None
+    if codec not in CODECS:
+        raise ValueError(f"unknown compression codec {codec!r}; available: {', '.join(sorted(CODECS))}")
+    return codec if is_compressible(data) else None
+
+
+def compress(data, codec):
+    return CODECS[codec][0](data)
+
+
+def decompress(data, codec):
+    """
+    Raises:
+        DecompressionError: The data is not a valid stream for the codec, or
+        the codec is unknown.
+    """
+    if codec not in CODECS:
+        raise DecompressionError(f"unknown compression codec {codec!r}")
+    try:
+        return CODECS[codec][1](data)
+    except (zlib.error, lzma.LZMAError, OSError, EOFError, ValueError) as e:
+        raise DecompressionError(f"cannot decompress {codec} data: {e}") from e
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# Chunk IDs per DELETE /chunks request; nodes accept at most 10000
+DELETE_BATCH = 1000
+
+# Per-chunk results of a node's batch delete that mean the chunk is gone
+DONE_STATUSES = ("deleted", "missing")
+
+
+def delete_batch(http, node, chunk_ids, headers=None):
+    """
+    Deletes chunks from one node with a single DELETE /chunks request.
+
+    Returns:
+        Dict[str, str]: chunk_id → 'deleted', 'missing' or an error message.
+        If the request itself fails, every chunk gets its error.
+    """
+    try:
+        r = http.delete(f"{node}/chunks", json={"chunk_ids": list(chunk_ids)}, headers=headers)
+        r.raise_for_status()
+        return r.json()["results"]
+    except Exception as e:
+        return {chunk_id: f"error: {e}" for chunk_id in chunk_ids}
+
+
+def delete_from_nodes(http, by_node, batch_size=DELETE_BATCH, workers=16, headers=None):
+    """
+    Deletes chunks grouped by node, sending the batches of every node
+    concurrently.
+
+    Args:
+        http (Transport): Connections to the nodes.
+        by_node (Dict[str, Iterable[str]]): Node URL → chunk IDs to delete.
+        batch_size (int): Chunk IDs per request.
+        workers (int): Requests in flight at once.
+        headers (dict): Extra request headers, e.g. a background priority.
+
+    Returns:
+        Dict[str, Dict[str, str]]: Node URL → chunk_id → result, as
+        delete_batch returns it.
+    """
+    batches = []
+    for node, chunk_ids in by_node.items():
+        chunk_ids = sorted(set(chunk_ids))
+        batches.extend((node, chunk_ids[i:i + batch_size]) for i in range(0, len(chunk_ids), batch_size))
+
+    results = {node: {} for node in by_node}
+    if not batches:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+        replies = pool.map(lambda batch: delete_batch(http, batch[0], batch[1], headers), batches)
+        for (node, _), reply in zip(batches, replies):
+            results[node].update(reply)
+    return results
+
+
+def failed_deletes(results):
+    """
+    Returns:
+        Dict[str, List[str]]: Node URL → chunk IDs whose delete failed, for
+        nodes with any.
+    """
+    failed = {}
+    for node, statuses in results.items():
+        ids = [chunk_id for chunk_id, status in statuses.items() if status not in DONE_STATUSES]
+        if ids:
+            failed[node] = ids
+    return failed
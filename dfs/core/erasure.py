@@ -0,0 +1,126 @@
+import numpy as np
+
+# GF(256) arithmetic over the polynomial x^8 + x^4 + x^3 + x^2 + 1 (0x11d)
+GF_EXP = np.zeros(512, dtype=np.uint8)
+GF_LOG = np.zeros(256, dtype=np.int32)
+
+_x = 1
+for _i in range(255):
+    GF_EXP[_i] = _x
+    GF_LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11d
+GF_EXP[255:510] = GF_EXP[:255]
+
+# Full multiplication table: GF_MUL[a] is the 256-entry lookup row for
+# "multiply by a", so a whole fragment is scaled with one fancy index.
+_logs = GF_LOG[1:]
+GF_MUL = np.zeros((256, 256), dtype=np.uint8)
+GF_MUL[1:, 1:] = GF_EXP[(_logs[:, None] + _logs[None, :]) % 255]
+
+
+def gf_inv(a):
+    if a == 0:
+        raise ZeroDivisionError("0 has no inverse in GF(256)")
+    return int(GF_EXP[255 - GF_LOG[a]])
+
+
+def gf_matrix_invert(matrix):
+    """
+    Inverts a square matrix over GF(256) with Gauss-Jordan elimination.
+    """
+    n = len(matrix)
+    work = np.concatenate([np.array(matrix, dtype=np.uint8), np.eye(n, dtype=np.uint8)], axis=1)
+    for col in range(n):
+        pivot = next((r for r in range(col, n) if work[r, col]), None)
+        if pivot is None:
+            raise ValueError("matrix is singular")
+        work[[col, pivot]] = work[[pivot, col]]
+        work[col] = GF_MUL[gf_inv(int(work[col, col]))][work[col]]
+        for r in range(n):
+            if r != col and work[r, col]:
+                work[r] ^= GF_MUL[int(work[r, col])][work[col]]
+    return work[:, n:]
+
+
+class ReedSolomon:
+    """
+    Systematic Reed-Solomon erasure code with k data and m parity fragments.
+
+    A stripe is cut into k equal data fragments (zero-padded) and m parity
+    fragments are computed from a Cauchy matrix, so any k of the k+m
+    fragments are enough to rebuild the stripe. All byte arithmetic is done
+    with NumPy table lookups over whole fragments.
+
+    Args:
+        k (int): Number of data fragments.
+        m (int): Number of parity fragments.
+    """
+
+    def __init__(self, k, m):
+        if k < 1 or m < 0 or k + m > 255:
+            raise ValueError("need k >= 1, m >= 0 and k + m <= 255")
+        self.k = k
+        self.m = m
+        # Generator matrix: identity for data rows, Cauchy rows for parity.
+        # Every k x k submatrix of it is invertible.
+        cauchy = [[gf_inv((k + j) ^ i) for i in range(k)] for j in range(m)]
+        self.matrix = np.concatenate([np.eye(k, dtype=np.uint8), np.array(cauchy, dtype=np.uint8).reshape(m, k)])
+
+    def fragment_size(self, size):
+        return -(-size // self.k)
+
+    def _combine(self, rows, fragments):
+        """
+        Multiplies a coefficient matrix by a stack of fragments over GF(256).
+        """
+        out = np.zeros((len(rows), fragments.shape[1]), dtype=np.uint8)
+        for r, row in enumerate(rows):
+            for coefficient, fragment in zip(row, fragments):
+                if coefficient == 1:
+                    out[r] ^= fragment
+                elif coefficient:
+                    out[r] ^= GF_MUL[coefficient][fragment]
+        return out
+
+    def encode(self, data):
+        """
+        Splits a stripe into k data fragments and computes m parity fragments.
+
+        Args:
+            data (bytes-like): Stripe contents.
+
+        Returns:
+            List[bytes]: k + m fragments of equal size.
+        """
+        size = self.fragment_size(len(data))
+        stripe = np.zeros(self.k * size, dtype=np.uint8)
+        stripe[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        shards = stripe.reshape(self.k, size)
+        parity = self._combine(self.matrix[self.k:], shards)
+        return [shard.tobytes() for shard in shards] + [p.tobytes() for p in parity]
+
+    def decode(self, fragments, size):
+        """
+        Rebuilds a stripe from any k fragments.
+
+        Args:
+            fragments (Dict[int, bytes]): Fragment index → contents.
+            size (int): Original stripe size in bytes.
+
+        Returns:
+            bytes: The stripe.
+        """
+        if len(fragments) < self.k:
+            raise ValueError(f"need {self.k} fragments, got {len(fragments)}")
+        indices = sorted(fragments)[:self.k]
+        shards = np.stack([np.frombuffer(fragments[i], dtype=np.uint8) for i in indices])
+
+        if indices == list(range(self.k)):
+            # All data fragments present: nothing to solve
+            data = shards
+        else:
+            inverse = gf_matrix_invert(self.matrix[indices])
+            data = self._combine(inverse, shards)
+        return data.reshape(-1)[:size].tobytes()
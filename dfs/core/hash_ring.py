@@ -0,0 +1,108 @@
+import bisect
+import hashlib
+
+# Points each member gets on the ring per unit of weight; more points spread
+# the keys more evenly between members
+VNODES = 128
+
+
+def ring_hash(key):
+    """
+    Returns the 64-bit position of a key on the ring.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes, weighted per member.
+
+    A member of weight w owns max(1, round(vnodes * w)) points, placed at the
+    hashes of '<member>#<i>'. A key belongs to the members owning the first
+    points clockwise from its own hash, found with a binary search and no
+    I/O, so every component that knows the members and their weights
+    computes the same placement. Adding or removing a member only moves the
+    keys that fall between its points and their predecessors, which is its
+    share of the total weight.
+
+    Args:
+        weights (Dict[str, float]): Member → weight; members of weight 0 (or
+            less) are left out.
+        vnodes (int): Points per unit of weight.
+    """
+
+    def __init__(self, weights=None, vnodes=VNODES):
+        self.vnodes = vnodes
+        self.weights = {}
+        self._hashes = []
+        self._members = []
+        for member, weight in (weights or {}).items():
+            if weight > 0:
+                self.weights[member] = weight
+        self._build()
+
+    def _build(self):
+        points = sorted(
+            (ring_hash(f"{member}#{i}"), member)
+            for member, weight in self.weights.items()
+            for i in range(max(1, round(self.vnodes * weight)))
+        )
+        self._hashes = [h for h, _ in points]
+        self._members = [member for _, member in points]
+
+    def __len__(self):
+        return len(self.weights)
+
+    def __contains__(self, member):
+        return member in self.weights
+
+    def add(self, member, weight=1.0):
+        """
+        Adds a member, or changes its weight; weight 0 removes it.
+        """
+        if weight > 0:
+            self.weights[member] = weight
+        else:
+            self.weights.pop(member, None)
+        self._build()
+
+    def remove(self, member):
+        self.add(member, 0)
+
+    def lookup(self, key, count=1, skip=None):
+        """
+        Returns the members a key belongs to.
+
+        Args:
+            key (str): E.g. a chunk ID.
+            count (int): Distinct members wanted, e.g. the replicas.
+            skip (Callable): Takes a member and returns True to pass over it
+                (e.g. because it is down), so the next member clockwise
+                takes its place.
+
+        Returns:
+            List[str]: Up to count distinct members, in ring order.
+        """
+        found = []
+        if not self._hashes:
+            return found
+        start = bisect.bisect_right(self._hashes, ring_hash(key))
+        for i in range(len(self._hashes)):
+            member = self._members[(start + i) % len(self._hashes)]
+            if member in found or (skip and skip(member)):
+                continue
+            found.append(member)
+            if len(found) == count or len(found) == len(self.weights):
+                break
+        return found
+
+    def to_dict(self):
+        return {"vnodes": self.vnodes, "weights": dict(sorted(self.weights.items()))}
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Rebuilds a ring from to_dict(), e.g. as served by a balancer's
+        GET /ring, so clients can locate chunks themselves.
+        """
+        return cls(state["weights"], state.get("vnodes", VNODES))
@@ -0,0 +1,86 @@
+import hashlib
+
+# Header (or multipart form field, lowercase 'sha256') carrying the expected
+# checksum of a chunk sent to a node
+DIGEST_HEADER = "X-Chunk-SHA256"
+
+
+class ChecksumMismatch(ValueError):
+    """
+    Raised when a chunk's contents do not match the checksum recorded for it.
+    """
+
+
+def chunk_digest(data):
+    """
+    Returns the hex SHA-256 of a chunk's contents.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def verify(name, actual, expected):
+    """
+    Raises ChecksumMismatch unless the actual digest is the expected one. An
+    expected digest of None (metadata written before checksums) passes.
+
+    Returns:
+        str: The actual digest.
+    """
+    if expected is not None and actual != expected:
+        raise ChecksumMismatch(f"{name}: SHA-256 {actual} does not match the recorded {expected}")
+    return actual
+
+
+def merkle_root(digests):
+    """
+    Folds the digests of a file's chunks, in file order, into one root hash.
+
+    Adjacent digests are hashed together in pairs, level by level, until one
+    is left; an odd digest at the end of a level moves up unchanged. The root
+    therefore changes if any chunk, or the order of the chunks, changes, and
+    is computed from the chunk digests alone, without reading the file again.
+
+    Args:
+        digests (Iterable[str]): Hex SHA-256 of each chunk.
+
+    Returns:
+        str: Hex root hash; the SHA-256 of nothing for an empty file.
+    """
+    level = [bytes.fromhex(d) for d in digests]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        # Inner nodes are prefixed so they can never collide with a chunk digest
+        paired = [hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0].hex()
+
+
+class DigestReader:
+    """
+    Wraps a binary stream and hashes everything read through it, so a chunk
+    is checksummed while it is being written, without a second pass.
+
+    Args:
+        stream: Binary stream with read() or readinto().
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.hasher = hashlib.sha256()
+
+    def readinto(self, buffer):
+        n = self.stream.readinto(buffer)
+        if n:
+            self.hasher.update(memoryview(buffer)[:n])
+        return n
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.hasher.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
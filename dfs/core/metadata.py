@@ -0,0 +1,215 @@
+import os
+import re
+from urllib.parse import quote
+from core.integrity import merkle_root
+from core.transport import Transport
+
+METADATA_VERSION = 2
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Metadata service (served by the global balancer)
+METADATA_URL = os.getenv("METADATA_URL", "http://localhost:6000")
+METADATA_TIMEOUT = 10
+METADATA_HTTP = Transport(timeout=METADATA_TIMEOUT)
+
+
+def extract_chunk_number(name):
+    match = re.search(r"_chunk(\d+)$", name)
+    return int(match.group(1)) if match else -1
+
+
+def fragment_id(chunk_id, index):
+    return f"{chunk_id}_frag{index:02d}"
+
+
+def parse_fragment_id(name):
+    """
+    Returns (chunk_id, fragment index) for an erasure-coded fragment ID, or
+    None for a plain chunk ID.
+    """
+    match = re.match(r"^(.*)_frag(\d+)$", name)
+    return (match.group(1), int(match.group(2))) if match else None
+
+
+def build_metadata(file_name, file_size, chunk_size, chunks, chunking="fixed", erasure=None):
+    """
+    Builds the metadata document for an uploaded file.
+
+    Args:
+        file_name (str): Base name of the uploaded file.
+        file_size (int): Size of the original file in bytes.
+        chunk_size (int): Nominal chunk size used when splitting (the
+            average size for content-defined chunking).
+        chunks (List[dict]): Chunk entries in file order, each with
+            'id', 'offset', 'size', 'sha256' (of the chunk's contents) and
+            either 'nodes' (the replicas' node URLs) or, when erasure coded,
+            'fragments' (each with 'id', 'index', 'nodes' and 'sha256').
+            A compressed chunk also has 'compression' (the codec) and,
+            unless it was deduplicated, 'stored_size' and 'stored_sha256'
+            of the compressed bytes that the nodes hold (or that were
+            erasure coded). When every chunk has a checksum, the file's
+            Merkle root over them is recorded as 'merkle_root'.
+        chunking (str): 'fixed' for numbered fixed-size chunks, or 'cdc'
+            for content-defined chunks named by their SHA-256.
+        erasure (dict): {'k': ..., 'm': ...} when chunks are erasure coded.
+
+    Returns:
+        dict: Metadata ready to be serialized as JSON.
+    """
+    metadata = {
+        "version": METADATA_VERSION,
+        "file_name": file_name,
+        "file_size": file_size,
+        "chunk_size": chunk_size,
+        "chunking": chunking,
+        "chunks": chunks,
+    }
+    if all(chunk.get("sha256") for chunk in chunks):
+        metadata["merkle_root"] = merkle_root(chunk["sha256"] for chunk in chunks)
+    if erasure:
+        metadata["erasure"] = erasure
+    return metadata
+
+
+def stored_size(chunk):
+    """
+    Returns the size of a chunk as stored: compressed, if it is.
+    """
+    return chunk.get("stored_size", chunk["size"])
+
+
+def stored_digest(chunk):
+    """
+    Returns the SHA-256 of a chunk as stored, or None if it is not known.
+    """
+    if chunk.get("compression"):
+        return chunk.get("stored_sha256")
+    return chunk.get("sha256")
+
+
+def iter_stored_objects(metadata):
+    """
+    Yields (object_id, nodes) for everything a file stores on the nodes:
+    its chunks, or the fragments of its erasure-coded chunks.
+    """
+    for chunk in metadata["chunks"]:
+        if "fragments" in chunk:
+            for fragment in chunk["fragments"]:
+                yield fragment["id"], fragment["nodes"]
+        else:
+            yield chunk["id"], chunk["nodes"]
+
+
+def normalize_metadata(data, file_name=None):
+    """
+    Returns metadata in the current format.
+
+    Files uploaded before the format was versioned are stored as a flat
+    {chunk_id: node_url} dict. Those are converted using the fixed 1 MB chunk
+    size they were split with; the size of each chunk (and therefore of the
+    file) is unknown and left as None.
+    """
+    if data.get("version") == METADATA_VERSION:
+        # Files uploaded before replication record a single node per chunk
+        for chunk in data["chunks"]:
+            if "node" in chunk:
+                chunk["nodes"] = [chunk.pop("node")]
+        return data
+
+    chunk_ids = sorted(data.keys(), key=extract_chunk_number)
+    chunks = [
+        {"id": chunk_id, "offset": i * DEFAULT_CHUNK_SIZE, "size": None, "nodes": [data[chunk_id]]}
+        for i, chunk_id in enumerate(chunk_ids)
+    ]
+    return build_metadata(file_name, None, DEFAULT_CHUNK_SIZE, chunks)
+
+
+def save_metadata(metadata):
+    """
+    Stores a file's metadata in the metadata service.
+
+    Raises:
+        requests.RequestException: The service could not store it.
+    """
+    r = METADATA_HTTP.put(f"{METADATA_URL}/files/{quote(metadata['file_name'])}", json=metadata)
+    r.raise_for_status()
+
+
+def load_metadata(file_name):
+    """
+    Returns a file's metadata in the current format, or None if the metadata
+    service has no such file.
+    """
+    r = METADATA_HTTP.get(f"{METADATA_URL}/files/{quote(file_name)}")
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return normalize_metadata(r.json(), file_name=file_name)
+
+
+def delete_metadata(file_name):
+    """
+    Removes a file's metadata. Returns False if there was none.
+    """
+    r = METADATA_HTTP.delete(f"{METADATA_URL}/files/{quote(file_name)}")
+    if r.status_code == 404:
+        return False
+    r.raise_for_status()
+    return True
+
+
+def list_files():
+    """
+    Returns every stored file as {'name', 'size', 'updated'}, sorted by name.
+    """
+    files, after = [], ""
+    while after is not None:
+        r = METADATA_HTTP.get(f"{METADATA_URL}/files", params={"after": after})
+        r.raise_for_status()
+        page = r.json()
+        files.extend(page["files"])
+        after = page["next"]
+    return files
+
+
+def iter_node_objects(node):
+    """
+    Yields {'id', 'files'} for every chunk and fragment the metadata says a
+    node stores, in ID order.
+    """
+    after = ""
+    while after is not None:
+        r = METADATA_HTTP.get(f"{METADATA_URL}/objects", params={"node": node, "after": after})
+        r.raise_for_status()
+        page = r.json()
+        yield from page["objects"]
+        after = page["next"]
+
+
+def locate_objects(object_ids, batch_size=1000):
+    """
+    Returns object ID → nodes the metadata says hold it, for the given
+    chunks and fragments; those no file references are left out.
+    """
+    object_ids = list(object_ids)
+    located = {}
+    for start in range(0, len(object_ids), batch_size):
+        r = METADATA_HTTP.post(f"{METADATA_URL}/objects/locate", json={"ids": object_ids[start:start + batch_size]},
+                               idempotent=True)
+        r.raise_for_status()
+        located.update(r.json()["nodes"])
+    return located
+
+
+def relocate_object(object_id, old, new):
+    """
+    Records in the metadata that a chunk or fragment moved from node old to
+    node new.
+
+    Returns:
+        int: Number of files updated.
+    """
+    r = METADATA_HTTP.post(f"{METADATA_URL}/objects/{quote(object_id)}/relocate", json={"from": old, "to": new},
+                           idempotent=True)
+    r.raise_for_status()
+    return r.json()["files"]
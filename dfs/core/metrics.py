@@ -0,0 +1,169 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets, with their count
+    and sum, cheap enough to update on every request.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Rebuilds a histogram from its snapshot, e.g. one read from another
+        service's /metrics.
+        """
+        bounds = [float(b) for b in snapshot["buckets"] if b != "+Inf"]
+        histogram = cls(bounds)
+        previous = 0
+        for i, cumulative in enumerate(snapshot["buckets"].values()):
+            histogram.counts[i] = cumulative - previous
+            previous = cumulative
+        histogram.count = snapshot["count"]
+        histogram.sum = snapshot["sum"]
+        return histogram
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other, sign=1):
+        """
+        Adds (or with sign=-1 subtracts, e.g. an earlier snapshot of the
+        same histogram) another histogram with the same buckets.
+        """
+        if other.bounds != self.bounds:
+            raise ValueError("histograms have different buckets")
+        self.counts = [a + sign * b for a, b in zip(self.counts, other.counts)]
+        self.count += sign * other.count
+        self.sum += sign * other.sum
+        return self
+
+    def quantile(self, q):
+        """
+        Estimates a quantile by interpolating linearly within the bucket it
+        falls in; values past the last bound report that bound.
+        """
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, (bound, count) in enumerate(zip(self.bounds, self.counts)):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                return round(lower + (bound - lower) * (rank - seen) / count, 6)
+            seen += count
+        return self.bounds[-1]
+
+    def snapshot(self):
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class Metrics:
+    """
+    Counters and latency histograms of one service, served as JSON on
+    GET /metrics.
+
+    Names are dotted, e.g. 'forward.node.seconds' or 'http.bytes_in'.
+    instrument() adds per-endpoint request latency and request/response
+    bytes; services time their own hops and decisions with timer().
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Records the time spent in the block in the histogram name, whether
+        it succeeds or raises.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def timed(self, name, func):
+        """
+        Wraps func so every call is recorded in the histogram name.
+        """
+        def wrapper(*args, **kwargs):
+            with self.timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "counters": dict(sorted(self._counters.items())),
+                "histograms": {name: h.snapshot() for name, h in sorted(self._histograms.items())},
+            }
+
+    def instrument(self, app):
+        """
+        Records every request of a Flask app: its latency per endpoint, its
+        status class, and the bytes received and sent (as declared by
+        Content-Length; streamed bodies without one are not counted). The
+        latency runs until the response is ready, so it leaves out sending a
+        streamed body such as a chunk served with sendfile. Also adds the
+        GET /metrics endpoint.
+        """
+        from flask import g, jsonify, request
+
+        @app.before_request
+        def start_timer():
+            g.metrics_started = time.perf_counter()
+
+        @app.after_request
+        def record(response):
+            started = g.pop("metrics_started", None)
+            if started is not None and request.endpoint != "metrics":
+                endpoint = request.endpoint or "unmatched"
+                self.observe(f"http.{endpoint}.seconds", time.perf_counter() - started)
+                self.inc(f"http.{endpoint}.requests")
+                self.inc(f"http.status.{response.status_code // 100}xx")
+                self.inc("http.bytes_in", request.content_length or 0)
+                self.inc("http.bytes_out", response.content_length or 0)
+            return response
+
+        app.add_url_rule("/metrics", "metrics", lambda: jsonify(self.snapshot()))
+        return app
@@ -0,0 +1,267 @@
+import os
+import ssl
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import ClientDisconnected, InternalServerError
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
+
+# Connections accepted but not yet picked up by a worker
+LISTEN_BACKLOG = 1024
+
+# Block size when a file range has to be copied through Python
+FILE_BLOCK_SIZE = 256 * 1024
+
+# Seconds an idle keep-alive connection is held open for its next request
+KEEPALIVE_TIMEOUT = float(os.getenv("DFS_KEEPALIVE_TIMEOUT", "10"))
+
+# Most unread request body discarded to keep a connection open; past this
+# the connection is closed instead
+DRAIN_LIMIT = 4 * 1024 * 1024
+
+
+class FileRange:
+    """
+    WSGI response body serving length bytes of an open file from offset.
+
+    Under werkzeug's servers (the development server and the pooled one
+    below) the status line and headers are flushed by an empty first block,
+    then the range goes from the page cache to the socket with sendfile(2)
+    without being copied through Python. Anywhere else, or when the transfer
+    is rate limited, it is read in blocks. The file is closed with the
+    response.
+
+    Args:
+        file: File object opened in binary mode.
+        offset (int): First byte to send.
+        length (int): Number of bytes to send.
+        environ (dict): WSGI environ of the request.
+        limiter (RateLimiter): Limits the transfer, in bytes per second.
+    """
+
+    def __init__(self, file, offset, length, environ, limiter=None):
+        self.file = file
+        self.offset = offset
+        self.length = length
+        self.socket = environ.get("werkzeug.socket")
+        self.limiter = limiter
+
+    def __iter__(self):
+        if (self.socket is not None and self.length and self.limiter is None
+                and not isinstance(self.socket, ssl.SSLSocket)):
+            yield b""
+            self.socket.sendfile(self.file, self.offset, self.length)
+            return
+        position, end = self.offset, self.offset + self.length
+        while position < end:
+            if self.limiter:
+                self.limiter.acquire(min(FILE_BLOCK_SIZE, end - position))
+            block = os.pread(self.file.fileno(), min(FILE_BLOCK_SIZE, end - position), position)
+            if not block:
+                return
+            yield block
+            position += len(block)
+
+    def close(self):
+        self.file.close()
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    Request handler that keeps HTTP/1.1 connections open between requests.
+
+    werkzeug's handler answers every request with "Connection: close" because
+    it cannot tell where one request body ends and the next request starts.
+    This one gives the application a body stream limited to Content-Length
+    (or de-chunked), frames every response by Content-Length or chunked
+    encoding, and after the response discards whatever part of the body the
+    application left unread, so the connection is ready for the next request.
+    Connections idle for KEEPALIVE_TIMEOUT seconds are closed.
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out as separate small writes; without this the
+        # second one waits for the client's delayed ACK on a kept connection
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def make_environ(self):
+        environ = super().make_environ()
+        if not environ.get("wsgi.input_terminated"):
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            environ["wsgi.input"] = LimitedStream(self.rfile, length)
+            environ["wsgi.input_terminated"] = True
+        return environ
+
+    def run_wsgi(self):
+        if self.headers.get("Expect", "").lower().strip(" \t") == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        self.environ = environ = self.make_environ()
+        response = {"status": None, "headers": None, "sent": False, "chunked": False}
+
+        def write(data):
+            if not response["sent"]:
+                code, _, message = response["status"].partition(" ")
+                code = int(code)
+                self.send_response(code, message)
+                keys = set()
+                for key, value in response["headers"]:
+                    self.send_header(key, value)
+                    keys.add(key.lower())
+                if not ("content-length" in keys or environ["REQUEST_METHOD"] == "HEAD"
+                        or 100 <= code < 200 or code in (204, 304)):
+                    response["chunked"] = True
+                    self.send_header("Transfer-Encoding", "chunked")
+                if self.too_large_to_drain(environ):
+                    self.send_header("Connection", "close")
+                self.end_headers()
+                response["sent"] = True
+            if data:
+                if response["chunked"]:
+                    self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+                else:
+                    self.wfile.write(data)
+            self.wfile.flush()
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info:
+                try:
+                    if response["sent"]:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            response["status"] = status
+            response["headers"] = headers
+            return write
+
+        def execute(app):
+            body = app(environ, start_response)
+            try:
+                for data in body:
+                    write(data)
+                if not response["sent"]:
+                    write(b"")
+                if response["chunked"]:
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+
+        try:
+            execute(self.server.app)
+            self.drain(environ["wsgi.input"])
+        except (ConnectionError, ClientDisconnected, socket.timeout) as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+        except Exception as e:
+            self.close_connection = True
+            if self.server.passthrough_errors:
+                raise
+            if not response["sent"]:
+                try:
+                    execute(InternalServerError())
+                except Exception:
+                    pass
+            self.server.log("error", f"Error on request {self.requestline!r}: {e!r}")
+
+    def too_large_to_drain(self, environ):
+        """
+        Tells whether the application left more than DRAIN_LIMIT bytes of a
+        declared request body unread, so the connection cannot be kept.
+        """
+        stream = environ["wsgi.input"]
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        return isinstance(stream, LimitedStream) and length > DRAIN_LIMIT and not stream.is_exhausted
+
+    def drain(self, stream):
+        """
+        Reads off the rest of the request body, or marks the connection to be
+        closed if more than DRAIN_LIMIT bytes of it are left.
+        """
+        remaining = DRAIN_LIMIT
+        while remaining > 0:
+            block = stream.read(min(FILE_BLOCK_SIZE, remaining))
+            if not block:
+                return
+            remaining -= len(block)
+        if stream.read(1):
+            self.close_connection = True
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server that hands each connection to a fixed pool of worker threads.
+
+    The Flask development server starts a new thread per request with no
+    upper bound; this one keeps a bounded set of threads busy and lets the
+    listen backlog absorb bursts, so hundreds of concurrent transfers share
+    the pool instead of each paying for a fresh thread. Connections are kept
+    alive between requests (see KeepAliveRequestHandler), so a worker stays
+    with a client for as long as it keeps sending requests; size the pool
+    for the number of concurrent clients, not requests.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind.
+        app: WSGI application.
+        threads (int): Number of worker threads.
+    """
+
+    multithread = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, host, port, app, threads=64, **kwargs):
+        kwargs.setdefault("handler", KeepAliveRequestHandler)
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        super().__init__(host, port, app, **kwargs)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self.connections_lock:
+                self.connections.discard(request)
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # Wake workers waiting on idle keep-alive connections, so shutdown
+        # does not wait out their timeout
+        with self.connections_lock:
+            for connection in self.connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        pool = getattr(self, "pool", None)
+        if pool:
+            pool.shutdown(wait=False)
+
+
+def serve(app, port, threads=64, host="0.0.0.0"):
+    """
+    Runs a Flask app on the pooled server until interrupted.
+    """
+    server = PooledWSGIServer(host, port, app, threads=threads)
+    print(f" * Serving {app.name} on http://{host}:{port} with {threads} worker threads")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,72 @@
+import time
+import threading
+
+# Marks a request as background traffic (repair, rebalancing) that the
+# receiving node throttles to its background share of I/O
+PRIORITY_HEADER = "X-DFS-Priority"
+BACKGROUND = "background"
+
+
+class RateLimiter:
+    """
+    Token bucket shared by threads, limiting a rate such as bytes per second.
+
+    acquire(n) takes n tokens, sleeping when the bucket is empty. Requests
+    larger than the bucket are allowed and put it in debt, which later
+    callers wait out, so the long-run rate holds whatever the request sizes.
+
+    Args:
+        rate (float): Tokens per second; 0 or None disables the limit.
+        burst (float): Bucket size; defaults to one second's worth.
+    """
+
+    def __init__(self, rate, burst=None):
+        self._lock = threading.Lock()
+        self._last = time.monotonic()
+        self.set_rate(rate, burst)
+        self._tokens = self.burst
+
+    def set_rate(self, rate, burst=None):
+        with self._lock:
+            self.rate = rate or 0
+            self.burst = burst if burst is not None else self.rate
+
+    def acquire(self, amount):
+        """
+        Takes amount tokens, blocking until the rate allows it.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        if not self.rate or amount <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class ThrottledReader:
+    """
+    Wraps a binary stream so that reading from it draws on a rate limiter.
+    """
+
+    def __init__(self, stream, limiter):
+        self.stream = stream
+        self.limiter = limiter
+
+    def readinto(self, buffer):
+        n = self.stream.readinto(buffer)
+        if n:
+            self.limiter.acquire(n)
+        return n
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.limiter.acquire(len(data))
+        return data
@@ -0,0 +1,154 @@
+import os
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# Connections kept open per upstream, attempts after the first, and the base
+# delay of the jittered exponential backoff between attempts (seconds)
+POOL_SIZE = int(os.getenv("DFS_HTTP_POOL_SIZE", "32"))
+RETRIES = int(os.getenv("DFS_HTTP_RETRIES", "2"))
+BACKOFF = float(os.getenv("DFS_HTTP_BACKOFF", "0.1"))
+BACKOFF_CAP = 2.0
+
+# Requests that can be sent twice without changing the outcome
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+# Answers from a proxy or an overloaded server worth another attempt
+RETRY_STATUSES = {502, 503, 504}
+
+
+def never_sent(error):
+    """
+    Tells whether a failed request certainly never reached the server
+    (connection refused, connect timeout), so retrying it cannot apply it twice.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def replayable(kwargs):
+    """
+    Tells whether a request body can be sent again: a stream or a generator
+    is consumed by the first attempt.
+    """
+    data = kwargs.get("data")
+    if data is not None and not isinstance(data, (bytes, bytearray, memoryview, str, dict, list, tuple)):
+        return False
+    for value in (kwargs.get("files") or {}).values():
+        content = value[1] if isinstance(value, tuple) else value
+        if hasattr(content, "read"):
+            return False
+    return True
+
+
+class Transport:
+    """
+    HTTP client for one hop of the system (client → balancer, balancer →
+    cluster manager, cluster manager → node, ...).
+
+    Each upstream (scheme://host:port) gets its own requests.Session with a
+    pool of keep-alive connections, so consecutive chunks to the same server
+    reuse an open connection instead of paying for a new TCP handshake. Every
+    call gets the hop's timeout unless it passes its own. Idempotent requests
+    are retried on connection errors, timeouts and 502/503/504 answers with
+    full-jitter exponential backoff; other requests (POST) are retried only
+    when they never reached the server, or when the caller passes
+    idempotent=True.
+
+    Args:
+        timeout (float | tuple): Default (connect, read) timeout of the hop.
+        retries (int): Attempts after the first one.
+        pool_size (int): Connections kept open per upstream.
+        backoff (float): Base delay between attempts in seconds.
+    """
+
+    def __init__(self, timeout, retries=RETRIES, pool_size=POOL_SIZE, backoff=BACKOFF):
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.backoff = backoff
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        """
+        Returns the pooled session for the upstream serving url.
+        """
+        parts = urlsplit(url)
+        upstream = f"{parts.scheme}://{parts.netloc}"
+        session = self._sessions.get(upstream)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(upstream)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[upstream] = session
+        return session
+
+    def request(self, method, url, timeout=None, retries=None, idempotent=None, **kwargs):
+        """
+        Sends a request through the upstream's pooled session, retrying as
+        described above. Accepts the keyword arguments of requests.request.
+
+        Args:
+            timeout (float | tuple): Overrides the hop timeout for this call.
+            retries (int): Overrides the number of retries for this call.
+            idempotent (bool): Overrides whether the method may be repeated.
+
+        Returns:
+            requests.Response: The last response received.
+
+        Raises:
+            requests.RequestException: If the last attempt failed.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        if retries is None:
+            retries = self.retries
+        if not replayable(kwargs):
+            retries = 0
+        timeout = self.timeout if timeout is None else timeout
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session(url).request(method, url, timeout=timeout, **kwargs)
+                if not (idempotent and attempt < retries and response.status_code in RETRY_STATUSES):
+                    return response
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= retries or not (idempotent or never_sent(e)):
+                    raise
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, self.backoff * 2 ** attempt)))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -6,11 +6,12 @@ import json
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-def start_process(cmd, cwd=None, env=None):
+def start_process(cmd, cwd=None, env=None, stdout=None):
     try:
         env = env or os.environ.copy()
         env["PYTHONPATH"] = BASE_DIR
-        return subprocess.Popen(cmd, cwd=cwd or BASE_DIR, env=env)
+        return subprocess.Popen(cmd, cwd=cwd or BASE_DIR, env=env, stdout=stdout,
+                                stderr=subprocess.STDOUT if stdout else None)
     except Exception as e:
         print(f"[ERROR] Failed to start process: {' '.join(cmd)} — {e}")
         return None
@@ -18,28 +19,34 @@ def start_process(cmd, cwd=None, env=None):
 def get_free_ports(start, count):
     return [start + i for i in range(count)]
 
-def launch_nodes(cluster_id, node_ports):
+def launch_nodes(cluster_id, node_ports, cluster_url=None, storage_root=None, stdout=None):
     processes = []
     for port in node_ports:
         print(f"Starting storage node on port {port}...")
-        p = start_process(["python", "nodes/node_storage.py", "--port", str(port)])
+        # Each node owns its own directory (and chunk index)
+        storage_dir = os.path.join(storage_root or os.path.join(BASE_DIR, "node_storage"), f"node_{port}")
+        cmd = ["python", "nodes/node_storage.py", "--port", str(port), "--storage-dir", storage_dir]
+        if cluster_url:
+            cmd += ["--cluster-manager", cluster_url]
+        p = start_process(cmd, stdout=stdout)
         if p: processes.append(p)
     return processes
 
-def launch_cluster_manager(cluster_port, node_ports):
+def launch_cluster_manager(cluster_port, node_ports, stdout=None):
     node_urls = json.dumps([f"http://localhost:{port}" for port in node_ports])
     env = os.environ.copy()
     env["NODES"] = node_urls
     env["PYTHONPATH"] = BASE_DIR
     print(f"Starting cluster manager on port {cluster_port}...")
-    return start_process(["python", "load_balancers/cluster_manager.py", "--port", str(cluster_port)], env=env)
+    return start_process(["python", "load_balancers/cluster_manager.py", "--port", str(cluster_port)], env=env,
+                         stdout=stdout)
 
-def launch_global_balancer(cluster_map):
+def launch_global_balancer(cluster_map, stdout=None):
     env = os.environ.copy()
     env["CLUSTERS"] = json.dumps(cluster_map)
     env["PYTHONPATH"] = BASE_DIR
     print("Starting global load balancer on port 6000...")
-    return start_process(["python", "load_balancers/global_balancer.py", "--port", "6000"], env=env)
+    return start_process(["python", "load_balancers/global_balancer.py", "--port", "6000"], env=env, stdout=stdout)
 
 def upload_file():
     file_path = input("Enter filename (from tests/input_files/): ").strip()
@@ -47,49 +54,53 @@ def upload_file():
     if not os.path.exists(full_path):
         print(f"[ERROR] File not found: {full_path}")
         return
+    cmd = ["python", "client/upload.py", file_path]
+    erasure = input("Erasure coding as K+M, e.g. 4+2 (press Enter to replicate instead): ").strip()
+    if erasure:
+        cmd += ["--ec", erasure]
+    else:
+        if input("Deduplicate with content-defined chunking? [y/N]: ").strip().lower() == 'y':
+            cmd.append("--cdc")
+        replicas = input("Replication factor (press Enter for cluster default): ").strip()
+        if replicas.isdigit():
+            cmd += ["--replicas", replicas]
     env = os.environ.copy()
     env["PYTHONPATH"] = BASE_DIR
-    subprocess.run(["python", "client/upload.py", file_path], env=env)
+    subprocess.run(cmd, env=env)
 
-def list_uploaded_files():
-    metadata_dir = os.path.join(BASE_DIR, "metadata")
-    if not os.path.exists(metadata_dir):
-        print("No metadata directory found.")
-        return
+def fetch_file_names():
+    from core.metadata import list_files
+    try:
+        return [f["name"] for f in list_files()]
+    except Exception as e:
+        print(f"[ERROR] Could not reach the metadata service: {e}")
+        return []
 
-    files = [f for f in os.listdir(metadata_dir) if f.endswith(".json")]
+def list_uploaded_files():
+    files = fetch_file_names()
     if not files:
         print("No uploaded files found.")
         return
 
     print("\nUploaded Files:")
     for i, f in enumerate(files):
-        print(f"[{i+1}] {f.replace('.json', '')}")
+        print(f"[{i+1}] {f}")
     choice = input("Enter file number to view metadata (or press Enter to cancel): ").strip()
     if choice.isdigit():
         index = int(choice) - 1
         if 0 <= index < len(files):
-            path = os.path.join(metadata_dir, files[index])
-            with open(path) as f:
-                data = json.load(f)
-                print(json.dumps(data, indent=2))
+            from core.metadata import load_metadata
+            print(json.dumps(load_metadata(files[index]), indent=2))
 
 def download_file():
-    import re
-    metadata_dir = os.path.join(BASE_DIR, "metadata")
-    output_dir = os.path.join(BASE_DIR, "tests", "output_files")
-    chunk_dir = os.path.join(BASE_DIR, "chunks")
-    os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(chunk_dir, exist_ok=True)
-
-    files = [f for f in os.listdir(metadata_dir) if f.endswith(".json")]
+    files = fetch_file_names()
     if not files:
         print("[INFO] No uploaded files found.")
         return
 
     print("\nAvailable uploaded files:")
     for i, f in enumerate(files):
-        print(f"[{i+1}] {f.replace('.json', '')}")
+        print(f"[{i+1}] {f}")
 
     choice = input("Enter file number to download: ").strip()
     if not choice.isdigit():
@@ -101,58 +112,29 @@ def download_file():
         print("[ERROR] Invalid file number.")
         return
 
-    file_basename = files[index].replace(".json", "")
-    metadata_path = os.path.join(metadata_dir, f"{file_basename}.json")
+    file_basename = files[index]
 
     try:
-        with open(metadata_path, "r") as f:
-            metadata = json.load(f)
-
-        def extract_chunk_index(chunk_id):
-            match = re.search(r'_chunk(\d+)$', chunk_id)
-            return int(match.group(1)) if match else -1
-
-        chunks = sorted(metadata.keys(), key=extract_chunk_index)
-
-        import requests
-        for chunk_id in chunks:
-            node_url = metadata[chunk_id]
-            chunk_path = os.path.join(chunk_dir, chunk_id)
-
-            r = requests.get(f"{node_url}/chunk/{chunk_id}", timeout=5)
-            r.raise_for_status()
-
-            with open(chunk_path, "wb") as f:
-                f.write(r.content)
-            print(f"[OK] Downloaded {chunk_id} from {node_url}")
-
-        from core.chunker import reconstruct_file
-        name, ext = os.path.splitext(file_basename)
-        output_path = os.path.join(output_dir, f"{name}_reconstructed{ext}")
-
-        if os.path.exists(output_path):
-            os.remove(output_path)
-
-        reconstruct_file(chunks, output_path)
-        print(f"\n[SUCCESS] File downloaded and reconstructed at: {output_path}")
-
+        from client.download import download_and_reconstruct
+        output_path = download_and_reconstruct(file_basename)
+        if output_path:
+            print(f"\n[SUCCESS] File downloaded and reconstructed at: {output_path}")
     except Exception as e:
         print(f"[ERROR] Download failed: {e}")
 
 
 def delete_distributed_file():
-    metadata_dir = os.path.join(BASE_DIR, "metadata")
     chunk_dir = os.path.join(BASE_DIR, "chunks")
     output_dir = os.path.join(BASE_DIR, "tests", "output_files")
-    files = [f for f in os.listdir(metadata_dir) if f.endswith(".json")]
-    
+    files = fetch_file_names()
+
     if not files:
         print("[INFO] No uploaded files found.")
         return
 
     print("\nUploaded Files:")
     for i, f in enumerate(files):
-        print(f"[{i+1}] {f.replace('.json', '')}")
+        print(f"[{i+1}] {f}")
 
     choice = input("Enter file number to delete: ").strip()
 
@@ -165,44 +147,19 @@ def delete_distributed_file():
         print("[ERROR] Invalid file number.")
         return
 
-    file_basename = files[index].replace(".json", "")
-    metadata_file = os.path.join(metadata_dir, f"{file_basename}.json")
+    file_basename = files[index]
 
     confirm = input(f"Are you sure you want to delete '{file_basename}'? [y/N]: ").strip().lower()
     if confirm != 'y':
         print("Deletion cancelled.")
         return
 
-    try:
-        with open(metadata_file, "r") as f:
-            metadata = json.load(f)
-    except Exception as e:
-        print(f"[ERROR] Could not read metadata: {e}")
-        return
-
-    failed = []
-    for chunk_id, node_url in metadata.items():
-        try:
-            import requests
-            r = requests.delete(f"{node_url}/chunk/{chunk_id}", timeout=5)
-            if r.status_code == 200:
-                print(f"[OK] Deleted {chunk_id} from {node_url}")
-            else:
-                failed.append(chunk_id)
-                print(f"[WARN] Chunk {chunk_id} deletion failed with status {r.status_code}")
-        except Exception as e:
-            failed.append(chunk_id)
-            print(f"[ERROR] Could not delete {chunk_id}: {e}")
-
-    if failed:
-        print(f"[FAIL] Some chunks could not be deleted: {failed}")
-    else:
-        os.remove(metadata_file)
-        print(f"[SUCCESS] Metadata for '{file_basename}' deleted.")
-
+    from client.delete import delete_file
+    metadata = delete_file(file_basename)
+    if metadata:
         # Delete local chunks
-        for chunk_id in metadata:
-            local_path = os.path.join(chunk_dir, chunk_id)
+        for chunk in metadata["chunks"]:
+            local_path = os.path.join(chunk_dir, chunk["id"])
             if os.path.exists(local_path):
                 os.remove(local_path)
 
@@ -241,7 +198,7 @@ def main():
         cluster_managers.append(cm_process)
 
         # Launch nodes for this cluster
-        node_processes = launch_nodes(c, node_ports)
+        node_processes = launch_nodes(c, node_ports, cluster_url=f"http://localhost:{cluster_port}")
         all_node_processes.extend(node_processes)
 
         # Register cluster
@@ -1,26 +1,149 @@
 import os
+import sys
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
 
 # ---------------- Configuration Constants ----------------
 
 DEFAULT_TIMEOUT = 5  # default HTTP timeout in seconds
-LOG_DIR = os.path.join(os.path.dirname(__file__), "logs")
+CHUNK_PENALTY = 50  # MB penalty per stored chunk
+LOG_DIR = os.getenv("DFS_LOG_DIR", os.path.join(os.path.dirname(__file__), "logs"))
+STATE_DIR = os.getenv("DFS_STATE_DIR", os.path.join(os.path.dirname(__file__), "state"))
 
-# Ensure log directory exists
+# Log lines are written by a background thread: seconds it gathers lines
+# before writing them in one go, and lines that may wait before new ones are
+# dropped rather than block a request
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.2"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "100000"))
+
+# Ensure log and state directories exist
 os.makedirs(LOG_DIR, exist_ok=True)
+os.makedirs(STATE_DIR, exist_ok=True)
 
 # ---------------- Shared Logging Function ----------------
 
+_log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_log_write_lock = threading.Lock()
+_log_writer = None
+_log_dropped = 0
+
+
 def log(message, context="GLOBAL"):
+    """
+    Queues a timestamped line for the context's log file and stdout. Never
+    waits for I/O; if the queue is full the line is dropped and counted.
+    """
+    global _log_dropped
     timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-    formatted = f"[{context}] {timestamp} {message}"
-    log_file = os.path.join(LOG_DIR, f"{context.lower()}.log")
+    try:
+        _log_queue.put_nowait((context, f"[{context}] {timestamp} {message}"))
+    except queue.Full:
+        _log_dropped += 1
+    if _log_writer is None:
+        _start_log_writer()
+
+
+def _start_log_writer():
+    global _log_writer
+    with _log_write_lock:
+        if _log_writer is None:
+            _log_writer = threading.Thread(target=_run_log_writer, name="log-writer", daemon=True)
+            _log_writer.start()
+            atexit.register(flush_logs)
+
+
+def _run_log_writer():
+    while True:
+        batch = [_log_queue.get()]
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(_log_queue.get(timeout=remaining) if remaining > 0 else _log_queue.get_nowait())
+            except queue.Empty:
+                break
+        _write_log_lines(batch)
+        for _ in batch:
+            _log_queue.task_done()
+
+
+def _write_log_lines(batch):
+    """
+    Appends a batch of lines with one write per log file and one to stdout.
+    """
+    global _log_dropped
+    with _log_write_lock:
+        if _log_dropped:
+            batch = batch + [("GLOBAL", f"[LOG] dropped {_log_dropped} lines, the log queue was full")]
+            _log_dropped = 0
+        by_context = {}
+        for context, line in batch:
+            by_context.setdefault(context, []).append(line)
+        for context, lines in by_context.items():
+            try:
+                with open(os.path.join(LOG_DIR, f"{context.lower()}.log"), "a") as f:
+                    f.write("\n".join(lines) + "\n")
+            except OSError as e:
+                print(f"[LOG] cannot write {context.lower()}.log: {e}", file=sys.stderr)
+        sys.stdout.write("".join(line + "\n" for _, line in batch))
+        sys.stdout.flush()
+
+
+def flush_logs():
+    """
+    Writes every queued line now, and waits for the lines the writer already
+    took, e.g. before exiting.
+    """
+    batch = []
+    while True:
+        try:
+            batch.append(_log_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        _write_log_lines(batch)
+        for _ in batch:
+            _log_queue.task_done()
+    _log_queue.join()
+
+# ---------------- Placement Scoring ----------------
+
+def compute_score(target):
+    """
+    Placement score of a node or cluster: free space, penalized by the number
+    of chunks it already holds so load spreads even when free space is equal.
+    """
+    return target["free_mb"] - (target["chunk_count"] * CHUNK_PENALTY)
+
+# ---------------- Request Validation ----------------
 
-    with open(log_file, "a") as f:
-        f.write(formatted + "\n")
+def invalid_placement(body):
+    """
+    Checks a /place request body: {"chunks": [{"id": str, "size": number}],
+    "replicas": positive int}, where size and replicas may be left out.
 
-    print(formatted)
+    Returns:
+        Optional[str]: What is wrong with it, or None if it is valid.
+    """
+    if not isinstance(body, dict):
+        return "body must be a JSON object"
+    chunks = body.get("chunks")
+    if not isinstance(chunks, list):
+        return "chunks must be a list"
+    for chunk in chunks:
+        if not isinstance(chunk, dict) or not isinstance(chunk.get("id"), str) or not chunk["id"]:
+            return "every chunk needs a string id"
+        if not isinstance(chunk.get("size", 0), (int, float)):
+            return f"size of {chunk['id']} must be a number"
+    replicas = body.get("replicas")
+    if replicas is not None and (not isinstance(replicas, int) or replicas < 1):
+        return "replicas must be a positive integer"
+    return None
 
 # ---------------- Public API ----------------
 
-__all__ = ["DEFAULT_TIMEOUT", "LOG_DIR", "log"]
+__all__ = ["DEFAULT_TIMEOUT", "CHUNK_PENALTY", "LOG_DIR", "STATE_DIR", "compute_score", "flush_logs",
+           "invalid_placement", "log"]
@@ -1,105 +1,476 @@
 import os
 import json
 import random
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify
-from load_balancers import log, DEFAULT_TIMEOUT
+from load_balancers import log, compute_score, invalid_placement, DEFAULT_TIMEOUT, STATE_DIR
+from load_balancers.dedup import DedupIndex
+from load_balancers.health import HealthMonitor
+from load_balancers.rebalance import Rebalancer
+from load_balancers.repair import RepairLoop
+from load_balancers.ring import RingPlacement
+from load_balancers.tombstones import TombstoneLog
+from core.deletion import DONE_STATUSES, delete_from_nodes, failed_deletes
+from core.hash_ring import VNODES
+from core.integrity import DIGEST_HEADER, chunk_digest
+from core.metadata import locate_objects
+from core.metrics import Metrics
+from core.throttle import BACKGROUND, PRIORITY_HEADER
+from core.transport import Transport
 
 app = Flask("cluster_manager")
 
+# Request latencies and bytes, node hop and poll times, placement time
+METRICS = Metrics()
+METRICS.instrument(app)
+
 # Dynamically load node list from environment variable
 NODES = json.loads(os.getenv("NODES", "[]"))
 
 if not NODES:
     log("⚠️ No nodes configured. Set NODES environment variable correctly.", context="CLUSTER")
 
-CHUNK_PENALTY = 50  # MB penalty per stored chunk
+# Node health polling: seconds between polls, seconds a cached status stays
+# valid, and the (short) timeout of a single status probe.
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "2"))
+HEALTH_TTL = float(os.getenv("HEALTH_TTL", "10"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "1"))
+
+# Repair of lost chunks and fragments: seconds between passes, and seconds
+# an object must be missing (or its node down) before it is repaired
+REPAIR_INTERVAL = float(os.getenv("REPAIR_INTERVAL", "60"))
+REPAIR_GRACE = float(os.getenv("REPAIR_GRACE", "300"))
+
+# Seconds a stored chunk must be referenced by no file (and not placed for
+# an upload) before it is deleted as an orphan; 0 keeps orphans
+ORPHAN_GRACE = float(os.getenv("ORPHAN_GRACE", "86400"))
+
+# Seconds between replays of deletes that a node missed while it was down
+# (replays also run as soon as the node is healthy again)
+TOMBSTONE_INTERVAL = float(os.getenv("TOMBSTONE_INTERVAL", "60"))
+
+# Number of distinct nodes each chunk is written to, unless a request asks
+# for another factor
+REPLICATION_FACTOR = int(os.getenv("REPLICATION_FACTOR", "1"))
+
+# How chunks are placed on nodes: 'score' picks the nodes with the most
+# free space and fewest chunks; 'hash' picks the nodes a consistent-hash
+# ring assigns the chunk ID, so anyone holding the ring (GET /ring) can
+# locate a chunk without a lookup
+PLACEMENT_STRATEGY = os.getenv("PLACEMENT_STRATEGY", "score")
+
+# Hash ring: points per unit of weight, node capacity worth a weight of 1,
+# and fixed weights by node URL (JSON) that override the capacities; a
+# weight of 0 drains a node
+RING_VNODES = int(os.getenv("RING_VNODES", str(VNODES)))
+RING_UNIT_MB = float(os.getenv("RING_UNIT_MB", "102400"))
+RING_WEIGHTS = json.loads(os.getenv("RING_WEIGHTS", "{}"))
+
+# Moving chunks to the nodes the ring assigns them (hash placement only):
+# seconds between passes (0 disables), and MB per second and objects per
+# pass moved at most
+REBALANCE_INTERVAL = float(os.getenv("REBALANCE_INTERVAL", "300"))
+REBALANCE_RATE_MB = float(os.getenv("REBALANCE_RATE_MB", "10"))
+REBALANCE_MAX_MOVES = int(os.getenv("REBALANCE_MAX_MOVES", "1000"))
+
+# Content-addressed chunks stored in this cluster, for deduplication
+DEDUP = DedupIndex()
+
+# Deletes still owed by nodes that were down or failed them
+TOMBSTONES = TombstoneLog(NODES, context="CLUSTER")
+
+# Writes replicas of a proxied chunk to their nodes in parallel
+REPLICA_POOL = ThreadPoolExecutor(max_workers=16)
+
+# Keep-alive connections to the nodes: chunk traffic, and status probes that
+# fail fast and leave retrying to the next poll
+NODE_HTTP = Transport(timeout=DEFAULT_TIMEOUT)
+PROBE_HTTP = Transport(timeout=HEALTH_TIMEOUT, retries=0)
+
+# Consistent-hash ring of the nodes, weighted by the capacity they report
+RING = RingPlacement(NODES, RING_UNIT_MB, overrides=RING_WEIGHTS, vnodes=RING_VNODES, context="CLUSTER")
 
 def get_node_status(node):
     try:
-        r = requests.get(f"{node}/status", timeout=DEFAULT_TIMEOUT)
+        r = PROBE_HTTP.get(f"{node}/status")
         r.raise_for_status()
-        return {
+        status = {
             "url": node,
             "free_mb": r.json().get("free_mb", 0),
+            "capacity_mb": r.json().get("capacity_mb"),
             "chunk_count": r.json().get("chunk_count", 9999)
         }
+        RING.learn(status)
+        return status
     except Exception as e:
         log(f"Node {node} unreachable: {e}", context="CLUSTER")
         return None
 
-def compute_score(node):
-    return node["free_mb"] - (node["chunk_count"] * CHUNK_PENALTY)
-
-def select_best_node():
-    statuses = [get_node_status(n) for n in NODES]
-    statuses = [s for s in statuses if s]
-
-    if not statuses:
-        return None
+# Cached node statuses, refreshed in the background and by node heartbeats
+HEALTH = HealthMonitor(NODES, METRICS.timed("poll.node.seconds", get_node_status), context="CLUSTER",
+                       interval=HEALTH_INTERVAL, ttl=HEALTH_TTL, on_recover=TOMBSTONES.wake)
 
+def pick_node(statuses):
     for node in statuses:
         node["score"] = compute_score(node)
 
     max_score = max(n["score"] for n in statuses)
     top_nodes = [n for n in statuses if abs(n["score"] - max_score) < 1e-3]
 
-    best = random.choice(top_nodes)
+    return random.choice(top_nodes)
+
+def healthy_nodes():
+    statuses = HEALTH.healthy()
+    if not statuses:
+        # Nothing fresh in the cache (e.g. right after startup): poll once
+        HEALTH.refresh(force=True)
+        statuses = HEALTH.healthy()
+    return statuses
+
+def charge(node, size_mb):
+    """
+    Charges a chunk to a node's status, and to its cache entry until the
+    next poll, so later picks see it.
+    """
+    node["chunk_count"] += 1
+    node["free_mb"] -= size_mb
+    HEALTH.adjust(node["url"], chunk_count=1, free_mb=-size_mb)
+
+def pick_nodes(statuses, count, size_mb=0):
+    """
+    Picks up to count distinct nodes by score, charging each pick to the
+    given statuses so later picks in the same batch see it.
+    """
+    candidates = list(statuses)
+    chosen = []
+    while candidates and len(chosen) < count:
+        node = pick_node(candidates)
+        candidates.remove(node)
+        charge(node, size_mb)
+        chosen.append(node)
+    if len(chosen) < count:
+        log(f"Only {len(chosen)} healthy nodes for replication factor {count}", context="CLUSTER")
+    return chosen
+
+def ring_nodes(statuses, chunk_id, count, size_mb=0):
+    """
+    Picks the nodes the hash ring assigns a chunk, the next ones clockwise
+    standing in for any that are not healthy, and charges them like
+    pick_nodes.
+    """
+    by_url = {s["url"]: s for s in statuses}
+    chosen = [by_url[url] for url in RING.place(chunk_id, count, by_url)]
+    for node in chosen:
+        charge(node, size_mb)
+    if len(chosen) < count:
+        log(f"Only {len(chosen)} healthy nodes on the ring for replication factor {count}", context="CLUSTER")
+    return chosen
+
+def place_nodes(statuses, chunk_id, count, size_mb=0):
+    """
+    Picks the nodes for one chunk with the configured placement strategy,
+    skipping nodes without room for it.
+    """
+    statuses = [s for s in statuses if s["free_mb"] >= size_mb]
+    if PLACEMENT_STRATEGY == "hash":
+        return ring_nodes(statuses, chunk_id, count, size_mb)
+    return pick_nodes(statuses, count, size_mb)
+
+def select_best_nodes(chunk_id, count=1, size_mb=0):
+    with METRICS.timer("placement.seconds"):
+        statuses = healthy_nodes()
+        if not statuses:
+            return []
+        chosen = place_nodes(statuses, chunk_id, count, size_mb)
+    for best in chosen:
+        log(
+            f"[SELECTED NODE] {best['url']} → Score: {best.get('score', '-')} | Free: {best['free_mb']} MB | Chunks: {best['chunk_count']}",
+            context="CLUSTER"
+        )
+
+    return [n["url"] for n in chosen]
+
+def pick_repair_target(exclude):
+    """
+    Picks the best healthy node outside exclude for a repaired copy.
+    """
+    chosen = pick_nodes([s for s in healthy_nodes() if s["url"] not in exclude], 1)
+    return chosen[0]["url"] if chosen else None
 
-    log(
-        f"[SELECTED NODE] {best['url']} → Score: {best['score']} | Free: {best['free_mb']} MB | Chunks: {best['chunk_count']}",
-        context="CLUSTER"
-    )
+# Restores chunks and fragments that nodes lost and deletes orphaned ones,
+# throttled by the nodes as background traffic
+REPAIR = RepairLoop(NODES, HEALTH, NODE_HTTP, pick_repair_target, on_relocate=DEDUP.relocate,
+                    interval=REPAIR_INTERVAL, grace=REPAIR_GRACE, orphan_grace=ORPHAN_GRACE,
+                    keep=DEDUP.__contains__)
 
-    return best["url"]
+# Moves chunks to the nodes the ring assigns them after nodes join, leave or
+# change weight, as throttled background traffic
+REBALANCE = Rebalancer(NODES, HEALTH, NODE_HTTP, RING, on_relocate=DEDUP.relocate, on_stale=TOMBSTONES.add,
+                       interval=REBALANCE_INTERVAL, rate=REBALANCE_RATE_MB * 1024 * 1024,
+                       max_moves=REBALANCE_MAX_MOVES)
+
+def store_on_node(node, chunk_id, data, digest):
+    with METRICS.timer("forward.node.put.seconds"):
+        r = NODE_HTTP.put(
+            f"{node}/chunk/{chunk_id}",
+            data=data,
+            headers={"Content-Type": "application/octet-stream", DIGEST_HEADER: digest}
+        )
+    r.raise_for_status()
+    METRICS.inc("forward.node.bytes_out", len(data))
 
 @app.route('/upload_chunk', methods=['POST'])
 def upload_chunk():
     chunk = request.files.get("chunk")
     chunk_id = request.form.get("chunk_id")
+    dedup = request.form.get("dedup") == "1"
+    replicas = int(request.form.get("replicas") or REPLICATION_FACTOR)
 
     if not chunk or not chunk_id:
         log("Missing chunk or chunk_id", context="CLUSTER")
         return jsonify({"error": "Missing chunk or chunk_id"}), 400
 
-    node = select_best_node()
-    if not node:
+    if dedup:
+        existing = DEDUP.lookup([chunk_id], add_ref=True).get(chunk_id)
+        if existing:
+            log(f"Deduplicated {chunk_id} → {existing}", context="CLUSTER")
+            return jsonify({"status": "stored", "node": existing[0], "nodes": existing,
+                            "chunk_id": chunk_id, "deduplicated": True}), 200
+
+    # The selected nodes are charged for the chunk until their next poll
+    REPAIR.placed([chunk_id])
+    TOMBSTONES.cancel([chunk_id])
+    nodes = select_best_nodes(chunk_id, replicas, (request.content_length or 0) / (1024 * 1024))
+    if not nodes:
         log("No available nodes to handle request", context="CLUSTER")
         return jsonify({"error": "No available nodes"}), 503
 
+    # Read once, then write every replica in parallel. Nodes check the
+    # sender's checksum, or this hop's when the sender gave none.
+    data = chunk.read()
+    digest = request.form.get("sha256") or chunk_digest(data)
+    futures = {node: REPLICA_POOL.submit(store_on_node, node, chunk_id, data, digest) for node in nodes}
+    failed = {}
+    for node, future in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            log(f"Upload to node {node} failed: {e}", context="CLUSTER")
+            HEALTH.mark_failed(node)
+            failed[node] = str(e)
+
+    if failed:
+        for node in nodes:
+            if node not in failed:
+                delete_from_node(node, chunk_id)
+        return jsonify({"error": f"Failed to upload to {', '.join(failed)}", "details": failed}), 500
+
+    log(f"Forwarded {chunk_id} to {', '.join(nodes)}", context="CLUSTER")
+    if dedup:
+        kept = DEDUP.record(chunk_id, nodes)
+        if kept != nodes:
+            # A concurrent upload stored the same content first; copies on
+            # nodes it also used are the ones the index now points to
+            for node in nodes:
+                if node not in kept:
+                    delete_from_node(node, chunk_id)
+            nodes = kept
+    return jsonify({"status": "stored", "node": nodes[0], "nodes": nodes, "chunk_id": chunk_id}), 200
+
+@app.route('/place', methods=['POST'])
+def place_chunks():
+    """
+    Assigns nodes to every chunk of a batch in one decision pass.
+
+    Expects JSON {"chunks": [{"id": ..., "size": ...}], "dedup": bool,
+    "replicas": int} and returns {"placements": {chunk_id: [nodes]}}. Each
+    assignment is charged to a local copy of the node table before the next
+    chunk is scored, so a batch spreads across nodes the same way a stream of
+    single uploads would; with hash placement each chunk goes to the nodes
+    the ring assigns its ID. Clients then upload directly to the nodes.
+    """
+    body = request.get_json(silent=True) or {}
+    error = invalid_placement(body)
+    if error:
+        return jsonify({"error": f"Invalid placement request: {error}"}), 400
+    chunks = body["chunks"]
+    dedup = bool(body.get("dedup"))
+    replicas = body.get("replicas") or REPLICATION_FACTOR
+
+    placements = {}
+    REPAIR.placed(c["id"] for c in chunks)
+    TOMBSTONES.cancel([c["id"] for c in chunks])
+    if dedup:
+        placements.update(DEDUP.lookup([c["id"] for c in chunks], add_ref=True))
+
+    with METRICS.timer("placement.batch.seconds"):
+        statuses = healthy_nodes()
+        pending = [c for c in chunks if c["id"] not in placements]
+        if pending and not statuses:
+            log("No available nodes to place batch", context="CLUSTER")
+            return jsonify({"error": "No available nodes"}), 503
+
+        for chunk in pending:
+            size_mb = chunk.get("size", 0) / (1024 * 1024)
+            nodes = [n["url"] for n in place_nodes(statuses, chunk["id"], replicas, size_mb)]
+            placements[chunk["id"]] = DEDUP.reserve(chunk["id"], nodes) if dedup else nodes
+
+    used = {node for c in pending for node in placements[c["id"]]}
+    log(f"Placed {len(pending)} chunks ×{replicas} across {len(used)} nodes", context="CLUSTER")
+    return jsonify({"placements": placements})
+
+def delete_from_node(node, chunk_id):
     try:
-        r = requests.post(
-            f"{node}/store",
-            files={"chunk": (chunk.filename, chunk.stream, chunk.mimetype)},
-            data={"chunk_id": chunk_id},
-            timeout=DEFAULT_TIMEOUT
-        )
+        r = NODE_HTTP.delete(f"{node}/chunk/{chunk_id}")
         r.raise_for_status()
-        log(f"Forwarded {chunk_id} to {node}", context="CLUSTER")
-        return jsonify({"status": "stored", "node": node, "chunk_id": chunk_id}), 200
+        return True
     except Exception as e:
-        log(f"Upload to node {node} failed: {e}", context="CLUSTER")
-        return jsonify({"error": f"Failed to upload to {node}", "details": str(e)}), 500
+        log(f"Delete of {chunk_id} on {node} failed: {e}", context="CLUSTER")
+        TOMBSTONES.add(node, [chunk_id])
+        return False
+
+def delete_on_nodes(by_node):
+    """
+    Deletes chunks from their nodes in concurrent batches, recording a
+    tombstone for every delete that failed so it is replayed later.
+
+    Returns:
+        Dict[str, List[str]]: Node URL → chunk IDs still to be deleted there.
+    """
+    with METRICS.timer("forward.node.delete.seconds"):
+        failed = failed_deletes(delete_from_nodes(NODE_HTTP, by_node))
+    for node, chunk_ids in failed.items():
+        log(f"Delete of {len(chunk_ids)} chunks on {node} failed, recorded as tombstones", context="CLUSTER")
+        TOMBSTONES.add(node, chunk_ids)
+    return failed
+
+def replay_tombstones(node, chunk_ids):
+    """
+    Deletes the chunks a node still owes, as background traffic, skipping
+    any a file or the dedup index references again.
+
+    Returns:
+        List[str]: Chunk IDs that are gone from the node.
+    """
+    if HEALTH.down_for(node) is not None:
+        return []
+    # Only the tombstoned IDs are looked up, not everything on the node
+    located = locate_objects(chunk_ids)
+    chunk_ids = [c for c in chunk_ids if node not in located.get(c, ()) and c not in DEDUP]
+    results = delete_from_nodes(NODE_HTTP, {node: chunk_ids}, headers={PRIORITY_HEADER: BACKGROUND})[node]
+    return [c for c, status in results.items() if status in DONE_STATUSES]
+
+@app.route('/tombstones', methods=['GET'])
+def tombstone_status():
+    """
+    Reports the number of pending deletes per node.
+    """
+    return jsonify({"pending": TOMBSTONES.pending()})
+
+@app.route('/tombstones', methods=['POST'])
+def add_tombstones():
+    """
+    Records deletes a client could not carry out, given as JSON
+    {"tombstones": {node: [chunk_ids]}}. Nodes of other clusters are ignored.
+    """
+    body = request.get_json(silent=True) or {}
+    recorded = sum(TOMBSTONES.add(node, chunk_ids) for node, chunk_ids in body.get("tombstones", {}).items())
+    if recorded:
+        log(f"Recorded {recorded} tombstones", context="CLUSTER")
+    return jsonify({"recorded": recorded})
+
+@app.route('/dedup/lookup', methods=['POST'])
+def dedup_lookup():
+    """
+    Reports which content-addressed chunks this cluster already stores.
+    With add_ref, each chunk found gains a reference for the caller's file.
+    """
+    body = request.get_json(silent=True) or {}
+    found = DEDUP.lookup(body.get("chunk_ids", []), add_ref=bool(body.get("add_ref")))
+    return jsonify({"found": found})
+
+@app.route('/dedup/confirm', methods=['POST'])
+def dedup_confirm():
+    """
+    Marks content-addressed chunks placed for an upload as stored, once the
+    upload has committed its file.
+    """
+    body = request.get_json(silent=True) or {}
+    return jsonify({"confirmed": DEDUP.confirm(body.get("chunk_ids", []))})
+
+@app.route('/dedup/release', methods=['POST'])
+def dedup_release():
+    """
+    Drops a file's references to content-addressed chunks and deletes the
+    chunks no other file refers to. Chunks are given as {"chunk_ids": [...]},
+    or as {"chunks": {chunk_id: nodes}} with the nodes the file stores them
+    on, in which case only those stored in this cluster are released.
+    """
+    body = request.get_json(silent=True) or {}
+    chunk_ids = body.get("chunk_ids", [])
+    chunk_ids += [chunk_id for chunk_id, nodes in body.get("chunks", {}).items()
+                  if any(node in NODES for node in nodes)]
+    released = DEDUP.release(chunk_ids)
+    by_node = {}
+    for chunk_id, nodes in released:
+        for node in nodes:
+            by_node.setdefault(node, []).append(chunk_id)
+    failed = {chunk_id for chunk_ids in delete_on_nodes(by_node).values() for chunk_id in chunk_ids}
+    deleted = [chunk_id for chunk_id, _ in released if chunk_id not in failed]
+    return jsonify({"deleted": deleted, "failed": sorted(failed)})
 
 @app.route('/status', methods=['GET'])
 def cluster_status():
-    total_free = 0
-    total_chunks = 0
-    active_nodes = 0
-
-    for node in NODES:
-        status = get_node_status(node)
-        if status:
-            total_free += status["free_mb"]
-            total_chunks += status["chunk_count"]
-            active_nodes += 1
+    statuses = HEALTH.healthy()
 
     return jsonify({
-        "cluster_free_mb": total_free,
-        "cluster_chunk_count": total_chunks,
-        "active_nodes": active_nodes
+        "cluster_free_mb": sum(s["free_mb"] for s in statuses),
+        "cluster_chunk_count": sum(s["chunk_count"] for s in statuses),
+        "active_nodes": len(statuses),
+        "capacity_mb": RING.capacity_mb(),
+        "nodes": HEALTH.snapshot()
     })
 
+@app.route('/repair', methods=['GET'])
+def repair_status():
+    """
+    Reports the repair loop's passes and recently repaired objects.
+    """
+    return jsonify(REPAIR.stats())
+
+@app.route('/ring', methods=['GET'])
+def ring_status():
+    """
+    Returns the placement strategy and the hash ring's members, weights and
+    points per weight, from which HashRing.from_dict rebuilds the ring.
+    """
+    return jsonify(dict(RING.snapshot(), strategy=PLACEMENT_STRATEGY))
+
+@app.route('/rebalance', methods=['GET'])
+def rebalance_status():
+    """
+    Reports the rebalancer's passes and the objects it moved.
+    """
+    return jsonify(REBALANCE.stats())
+
+@app.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    """
+    Receives a status push from a node, refreshing its cache entry.
+    """
+    body = request.get_json(silent=True) or {}
+    node = body.get("url")
+    status = {
+        "url": node,
+        "free_mb": body.get("free_mb", 0),
+        "capacity_mb": body.get("capacity_mb"),
+        "chunk_count": body.get("chunk_count", 9999)
+    }
+    if not HEALTH.report(node, status):
+        return jsonify({"error": f"Unknown node {node}"}), 404
+    RING.learn(status)
+    return jsonify({"status": "ok"})
+
 @app.route('/')
 def index():
     return "Cluster Manager is running", 200
@@ -108,5 +479,24 @@ if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--port', type=int, default=7001)
+    parser.add_argument('--server', choices=['dev', 'pooled'], default='pooled',
+                        help='dev: Flask development server; '
+                             'pooled: fixed thread pool server with keep-alive')
+    parser.add_argument('--threads', type=int, default=64, help='Worker threads of the pooled server')
     args = parser.parse_args()
-    app.run(host='0.0.0.0', port=args.port)
+    DEDUP.load(os.path.join(STATE_DIR, f"cluster_{args.port}_dedup.json"))
+    DEDUP.start_flusher()
+    TOMBSTONES.load(os.path.join(STATE_DIR, f"cluster_{args.port}_tombstones.log"))
+    RING.load(os.path.join(STATE_DIR, f"cluster_{args.port}_ring.json"))
+    HEALTH.start()
+    if TOMBSTONE_INTERVAL > 0:
+        TOMBSTONES.start(replay_tombstones, TOMBSTONE_INTERVAL)
+    if REPAIR_INTERVAL > 0:
+        REPAIR.start()
+    if PLACEMENT_STRATEGY == "hash" and REBALANCE_INTERVAL > 0:
+        REBALANCE.start()
+    if args.server == 'pooled':
+        from core.server import serve
+        serve(app, args.port, threads=args.threads)
+    else:
+        app.run(host='0.0.0.0', port=args.port)
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import atexit
+import threading
+from load_balancers import log
+
+
+class DedupIndex:
+    """
+    Reference-counted index of content-addressed chunks held by a cluster.
+
+    Maps chunk_id → the node URLs holding its replicas, the number of
+    files referencing the chunk, and whether it is still pending: placed for
+    an upload that has not confirmed it stored the chunk yet. Pending chunks
+    are never reported as stored, so a concurrent upload of the same
+    content sends it again (to the same nodes) rather than rely on an
+    upload that may fail.
+    The index lives in memory and is snapshotted to a JSON file by a
+    background thread whenever it changes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}  # chunk_id -> [nodes, refs, pending]
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._entries
+
+    def load(self, path=None):
+        self.path = path or self.path
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                self._entries = json.load(f)
+            # Snapshots written before replication hold a single node URL,
+            # and those written before pending entries only stored chunks
+            for entry in self._entries.values():
+                if isinstance(entry[0], str):
+                    entry[0] = [entry[0]]
+                if len(entry) < 3:
+                    entry.append(False)
+            log(f"Loaded dedup index with {len(self._entries)} chunks", context="CLUSTER")
+
+    def lookup(self, chunk_ids, add_ref=False):
+        """
+        Returns {chunk_id: nodes} for the chunks already stored, optionally
+        taking a new reference on each of them. Pending chunks are left out.
+        """
+        found = {}
+        with self._lock:
+            for chunk_id in chunk_ids:
+                entry = self._entries.get(chunk_id)
+                if entry and not entry[2]:
+                    found[chunk_id] = entry[0]
+                    if add_ref:
+                        entry[1] += 1
+                        self._dirty = True
+        return found
+
+    def reserve(self, chunk_id, nodes):
+        """
+        Records a chunk placed on nodes for an upload, as pending until
+        confirm(), and returns the nodes to store it on. If another upload
+        placed or stored it first, its nodes win and gain a reference.
+        """
+        with self._lock:
+            entry = self._entries.get(chunk_id)
+            if entry:
+                entry[1] += 1
+            else:
+                entry = self._entries[chunk_id] = [list(nodes), 1, True]
+            self._dirty = True
+            return entry[0]
+
+    def record(self, chunk_id, nodes):
+        """
+        Records a chunk this cluster just stored on nodes and returns the
+        nodes that hold it. If a concurrent upload stored it first, the
+        existing nodes win and gain a reference; if one only placed it, the
+        stored copies replace the placement.
+        """
+        with self._lock:
+            entry = self._entries.get(chunk_id)
+            if entry:
+                entry[1] += 1
+                if entry[2]:
+                    entry[0], entry[2] = list(nodes), False
+            else:
+                entry = self._entries[chunk_id] = [list(nodes), 1, False]
+            self._dirty = True
+            return entry[0]
+
+    def confirm(self, chunk_ids):
+        """
+        Marks pending chunks as stored, once the upload that placed them
+        committed its file.
+
+        Returns:
+            int: Number of chunks that were pending.
+        """
+        confirmed = 0
+        with self._lock:
+            for chunk_id in chunk_ids:
+                entry = self._entries.get(chunk_id)
+                if entry and entry[2]:
+                    entry[2] = False
+                    confirmed += 1
+            if confirmed:
+                self._dirty = True
+        return confirmed
+
+    def release(self, chunk_ids):
+        """
+        Drops one reference from each chunk.
+
+        Returns:
+            List[Tuple[str, List[str]]]: (chunk_id, nodes) of chunks no longer
+            referenced by any file, removed from the index.
+        """
+        unreferenced = []
+        with self._lock:
+            for chunk_id in chunk_ids:
+                entry = self._entries.get(chunk_id)
+                if not entry:
+                    continue
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._entries[chunk_id]
+                    unreferenced.append((chunk_id, entry[0]))
+                self._dirty = True
+        return unreferenced
+
+    def relocate(self, chunk_id, old, new):
+        """
+        Records that a chunk's replica moved from node old to node new.
+        """
+        with self._lock:
+            entry = self._entries.get(chunk_id)
+            if entry and old in entry[0]:
+                entry[0] = list(dict.fromkeys(new if node == old else node for node in entry[0]))
+                self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not (self.path and self._dirty):
+                return
+            snapshot = json.dumps(self._entries, separators=(",", ":"))
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(snapshot)
+        os.replace(tmp_path, self.path)
+
+    def start_flusher(self, interval=5):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except OSError as e:
+                    log(f"Failed to persist dedup index: {e}", context="CLUSTER")
+
+        threading.Thread(target=run, name="dedup-flusher", daemon=True).start()
+        atexit.register(self.flush)
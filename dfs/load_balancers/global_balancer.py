@@ -2,10 +2,22 @@ from flask import Flask, request, jsonify
 import os
 import requests
 import json
-from load_balancers import log, DEFAULT_TIMEOUT
+from concurrent.futures import ThreadPoolExecutor
+from load_balancers import log, compute_score, invalid_placement, DEFAULT_TIMEOUT, STATE_DIR
+from load_balancers.health import HealthMonitor
+from load_balancers.metadata_store import MetadataStore
+from load_balancers.ring import RingPlacement
+from core.hash_ring import VNODES
+from core.metadata import iter_stored_objects
+from core.metrics import Metrics
+from core.transport import Transport
 
 app = Flask("global_balancer")
 
+# Request latencies and bytes, cluster hop and poll times, placement time
+METRICS = Metrics()
+METRICS.instrument(app)
+
 # Load clusters from environment
 CLUSTERS = json.loads(os.getenv("CLUSTERS", "{}"))
 
@@ -14,22 +26,88 @@ if not CLUSTERS:
 
 log(f"Clusters configured: {list(CLUSTERS.keys())}", context="GLOBAL")
 
+# Reverse lookup of cluster names by URL
+CLUSTER_NAMES = {url: name for name, url in CLUSTERS.items()}
+
+# Capacity polling: seconds between polls, seconds a cached capacity stays
+# valid, and the timeout of a single status probe.
+CAPACITY_INTERVAL = float(os.getenv("CAPACITY_INTERVAL", "2"))
+CAPACITY_TTL = float(os.getenv("CAPACITY_TTL", "10"))
+CAPACITY_TIMEOUT = float(os.getenv("CAPACITY_TIMEOUT", "2"))
+
+# How chunks are split between clusters: 'score' by free space and chunk
+# count, 'hash' by a consistent-hash ring of the clusters, weighted by the
+# capacity of their own rings
+PLACEMENT_STRATEGY = os.getenv("PLACEMENT_STRATEGY", "score")
+
+# Clusters' ring: points per unit of weight, cluster capacity worth a weight
+# of 1, and fixed weights by cluster name (JSON); weight 0 stops placing
+# new chunks on a cluster
+RING_VNODES = int(os.getenv("RING_VNODES", str(VNODES)))
+RING_UNIT_MB = float(os.getenv("RING_UNIT_MB", "102400"))
+CLUSTER_RING_WEIGHTS = json.loads(os.getenv("CLUSTER_RING_WEIGHTS", "{}"))
+
+# File metadata, served to clients from an indexed store. Per-file JSON left
+# in the old metadata directory is imported on startup.
+METADATA_DB = os.getenv("METADATA_DB", os.path.join(STATE_DIR, "metadata.db"))
+LEGACY_METADATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "metadata")
+METADATA = MetadataStore(METADATA_DB)
+
+# Keep-alive connections to the cluster managers: forwarded requests, and
+# status probes that fail fast and leave retrying to the next poll
+CLUSTER_HTTP = Transport(timeout=DEFAULT_TIMEOUT)
+PROBE_HTTP = Transport(timeout=CAPACITY_TIMEOUT, retries=0)
+
+# Consistent-hash ring of the clusters
+CLUSTER_RING = RingPlacement(CLUSTERS.values(), RING_UNIT_MB, vnodes=RING_VNODES, context="GLOBAL",
+                             overrides={CLUSTERS[name]: w for name, w in CLUSTER_RING_WEIGHTS.items() if name in CLUSTERS})
+
 def get_cluster_status(url):
     try:
-        r = requests.get(f"{url}/status", timeout=DEFAULT_TIMEOUT)
+        r = PROBE_HTTP.get(f"{url}/status")
         r.raise_for_status()
-        return {
+        data = r.json()
+        status = {
             "url": url,
-            "free_mb": r.json().get("cluster_free_mb", 0),
-            "name": [k for k, v in CLUSTERS.items() if v == url][0]
+            "free_mb": data.get("cluster_free_mb", 0),
+            "capacity_mb": data.get("capacity_mb"),
+            "chunk_count": data.get("cluster_chunk_count", 0),
+            "active_nodes": data.get("active_nodes", 0),
+            "name": CLUSTER_NAMES[url]
         }
+        CLUSTER_RING.learn(status)
+        return status
     except Exception as e:
         log(f"Cluster {url} unreachable: {e}", context="GLOBAL")
         return None
 
-def select_cluster():
-    statuses = [get_cluster_status(url) for url in CLUSTERS.values()]
-    statuses = [s for s in statuses if s]
+# Capacity table, refreshed concurrently in the background
+CAPACITY = HealthMonitor(CLUSTERS.values(), METRICS.timed("poll.cluster.seconds", get_cluster_status),
+                         context="GLOBAL", interval=CAPACITY_INTERVAL, ttl=CAPACITY_TTL)
+
+def active_clusters():
+    statuses = [s for s in CAPACITY.healthy() if s["active_nodes"] > 0]
+    if not statuses:
+        CAPACITY.refresh(force=True)
+        statuses = [s for s in CAPACITY.healthy() if s["active_nodes"] > 0]
+    return statuses
+
+def ring_cluster(statuses, chunk_id):
+    """
+    Returns the status of the cluster the ring assigns a chunk, the next one
+    clockwise standing in if it is not active.
+    """
+    by_url = {s["url"]: s for s in statuses}
+    chosen = CLUSTER_RING.place(chunk_id, 1, by_url)
+    return by_url[chosen[0]] if chosen else None
+
+def select_cluster(chunk_id):
+    statuses = active_clusters()
+    if statuses and PLACEMENT_STRATEGY == "hash":
+        best = ring_cluster(statuses, chunk_id)
+        if best:
+            log(f"Cluster selected: {best['name']} by the hash ring", context="GLOBAL")
+            return best
     if statuses:
         best = max(statuses, key=lambda x: x["free_mb"])
         log(f"Cluster selected: {best['name']} with {best['free_mb']} MB free", context="GLOBAL")
@@ -40,35 +118,363 @@ def select_cluster():
 def upload_chunk():
     chunk = request.files.get("chunk")
     chunk_id = request.form.get("chunk_id")
+    dedup = request.form.get("dedup", "0")
+    replicas = request.form.get("replicas", "")
 
     if not chunk or not chunk_id:
         return jsonify({"error": "Missing chunk or chunk_id"}), 400
 
-    cluster = select_cluster()
+    with METRICS.timer("placement.seconds"):
+        cluster = select_cluster(chunk_id)
     if not cluster:
         log("No active clusters available", context="GLOBAL")
         return jsonify({"error": "No available clusters"}), 503
 
     try:
-        r = requests.post(
-            f"{cluster['url']}/upload_chunk",
-            files={"chunk": (chunk.filename, chunk.stream, chunk.mimetype)},
-            data={"chunk_id": chunk_id},
-            timeout=DEFAULT_TIMEOUT
-        )
+        with METRICS.timer("forward.cluster.upload_chunk.seconds"):
+            r = CLUSTER_HTTP.post(
+                f"{cluster['url']}/upload_chunk",
+                files={"chunk": (chunk.filename, chunk.stream, chunk.mimetype)},
+                data={"chunk_id": chunk_id, "dedup": dedup, "replicas": replicas,
+                      "sha256": request.form.get("sha256", "")}
+            )
         r.raise_for_status()
+        METRICS.inc("forward.cluster.bytes_out", request.content_length or 0)
         response_data = r.json()
         log(f"Forwarded {chunk_id} to {cluster['name']}", context="GLOBAL")
+        # Charge the forwarded bytes to the cluster until its next poll
+        if not response_data.get("deduplicated"):
+            CAPACITY.adjust(cluster['url'], free_mb=-(request.content_length or 0) / (1024 * 1024), chunk_count=1)
         return jsonify({
             "status": "stored",
             "cluster": cluster['name'],
             "node": response_data["node"],
+            "nodes": response_data["nodes"],
             "chunk_id": chunk_id
         }), 200
     except requests.exceptions.RequestException as e:
         log(f"Upload to cluster {cluster['name']} failed: {e}", context="GLOBAL")
+        if not isinstance(e, requests.exceptions.HTTPError):
+            CAPACITY.mark_failed(cluster['url'])
         return jsonify({"error": f"Upload failed to cluster {cluster['name']}", "details": str(e)}), 500
 
+def post_each(calls, path):
+    """
+    POSTs a JSON payload per cluster concurrently.
+
+    Args:
+        calls (Dict[str, dict]): Cluster URL → payload.
+
+    Returns:
+        Dict[str, dict]: Cluster URL → JSON reply, for clusters that answered.
+    """
+    def call(item):
+        url, payload = item
+        try:
+            with METRICS.timer(f"forward.cluster{path.replace('/', '.')}.seconds"):
+                r = CLUSTER_HTTP.post(f"{url}{path}", json=payload)
+            r.raise_for_status()
+            return url, r.json()
+        except requests.exceptions.RequestException as e:
+            log(f"{path} on cluster {CLUSTER_NAMES[url]} failed: {e}", context="GLOBAL")
+            return url, None
+
+    if not calls:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return {url: reply for url, reply in pool.map(call, calls.items()) if reply is not None}
+
+def broadcast(path, payload):
+    """
+    POSTs the same JSON payload to every cluster concurrently.
+
+    Returns:
+        Dict[str, dict]: Cluster name → JSON reply, for clusters that answered.
+    """
+    replies = post_each({url: payload for url in CLUSTERS.values()}, path)
+    return {CLUSTER_NAMES[url]: reply for url, reply in replies.items()}
+
+def assign_clusters(chunks, replicas=1):
+    """
+    Splits a batch of chunks between clusters by placement score (or by the
+    hash ring), charging each assignment to a local copy of the capacity
+    table as it goes.
+
+    Returns:
+        Dict[str, list]: Cluster URL → chunks assigned to it.
+    """
+    statuses = active_clusters()
+    if not statuses:
+        return {}
+
+    batches = {}
+    for chunk in chunks:
+        if PLACEMENT_STRATEGY == "hash":
+            best = ring_cluster(statuses, chunk["id"])
+        else:
+            best = max(statuses, key=compute_score)
+        best["free_mb"] -= replicas * chunk.get("size", 0) / (1024 * 1024)
+        best["chunk_count"] += replicas
+        batches.setdefault(best["url"], []).append(chunk)
+    return batches
+
+def find_deduplicated(chunk_ids, add_ref=False):
+    """
+    Finds the clusters that store content-addressed chunks.
+
+    With add_ref, each chunk found gains a reference in exactly one cluster
+    (the first to report it), so that a file's references can be released
+    again; a chunk that cluster no longer has by then is left out.
+
+    Returns:
+        Dict[str, dict]: chunk_id → {"cluster", "nodes"}.
+    """
+    found = {}
+    for name, reply in broadcast("/dedup/lookup", {"chunk_ids": chunk_ids}).items():
+        for chunk_id, nodes in reply["found"].items():
+            found.setdefault(chunk_id, {"cluster": name, "nodes": nodes})
+    if not add_ref:
+        return found
+
+    by_cluster = {}
+    for chunk_id, entry in found.items():
+        by_cluster.setdefault(CLUSTERS[entry["cluster"]], []).append(chunk_id)
+    replies = post_each({url: {"chunk_ids": ids, "add_ref": True} for url, ids in by_cluster.items()}, "/dedup/lookup")
+    return {
+        chunk_id: {"cluster": CLUSTER_NAMES[url], "nodes": nodes}
+        for url, reply in replies.items() for chunk_id, nodes in reply["found"].items()
+    }
+
+def release_references(by_cluster):
+    """
+    Gives back the references a failed placement took, given as cluster
+    URL → chunk IDs.
+    """
+    if not by_cluster:
+        return
+    replies = post_each({url: {"chunk_ids": ids} for url, ids in by_cluster.items()}, "/dedup/release")
+    released = sum(len(ids) for url, ids in by_cluster.items() if url in replies)
+    log(f"Released {released} references taken by a failed placement", context="GLOBAL")
+
+@app.route('/place', methods=['POST'])
+def place_chunks():
+    """
+    Places a whole batch of chunks in one round trip.
+
+    Expects JSON {"chunks": [{"id": ..., "size": ...}], "dedup": bool,
+    "replicas": int} and returns
+    {"placements": {chunk_id: {"cluster", "nodes", "existing"}}}.
+    Chunks are split between clusters here and each cluster picks nodes for
+    its share; the client then uploads straight to the nodes, keeping the
+    balancers off the data path. If the placement fails, the dedup
+    references it took are released before the error is returned.
+    """
+    body = request.get_json(silent=True) or {}
+    error = invalid_placement(body)
+    if error:
+        return jsonify({"error": f"Invalid placement request: {error}"}), 400
+    chunks = body["chunks"]
+    dedup = bool(body.get("dedup"))
+    replicas = body.get("replicas")
+
+    placements = {}
+    if dedup:
+        for chunk_id, entry in find_deduplicated([c["id"] for c in chunks], add_ref=True).items():
+            placements[chunk_id] = dict(entry, existing=True)
+        chunks = [c for c in chunks if c["id"] not in placements]
+
+    def referenced():
+        by_cluster = {}
+        if dedup:
+            for chunk_id, placement in placements.items():
+                by_cluster.setdefault(CLUSTERS[placement["cluster"]], []).append(chunk_id)
+        return by_cluster
+
+    with METRICS.timer("placement.batch.seconds"):
+        batches = assign_clusters(chunks, int(replicas or 1))
+    if chunks and not batches:
+        log("No active clusters available", context="GLOBAL")
+        release_references(referenced())
+        return jsonify({"error": "No available clusters"}), 503
+
+    replies = post_each({url: {"chunks": batch, "dedup": dedup, "replicas": replicas}
+                         for url, batch in batches.items()}, "/place")
+    for url, batch in batches.items():
+        if url not in replies:
+            continue
+        assigned = replies[url]["placements"]
+        stored = sum(c.get("size", 0) * len(assigned[c["id"]]) for c in batch)
+        CAPACITY.adjust(url, free_mb=-stored / (1024 * 1024),
+                        chunk_count=sum(len(nodes) for nodes in assigned.values()))
+        for chunk_id, nodes in assigned.items():
+            placements[chunk_id] = {"cluster": CLUSTER_NAMES[url], "nodes": nodes, "existing": False}
+    failed = [CLUSTER_NAMES[url] for url in batches if url not in replies]
+    if failed:
+        log(f"Batch placement failed on {', '.join(failed)}", context="GLOBAL")
+        release_references(referenced())
+        return jsonify({"error": "Batch placement failed", "details": f"No placement from {', '.join(failed)}"}), 502
+
+    log(f"Placed {len(chunks)} chunks across {len(batches)} clusters", context="GLOBAL")
+    return jsonify({"placements": placements})
+
+@app.route('/dedup/lookup', methods=['POST'])
+def dedup_lookup():
+    body = request.get_json(silent=True) or {}
+    found = find_deduplicated(body.get("chunk_ids", []), add_ref=bool(body.get("add_ref")))
+    return jsonify({"found": found})
+
+@app.route('/dedup/release', methods=['POST'])
+def dedup_release():
+    """
+    Releases a file's references to content-addressed chunks, given as
+    {"chunks": {chunk_id: nodes}} so that only the cluster storing each
+    chunk for the file releases it.
+    """
+    body = request.get_json(silent=True) or {}
+    deleted, failed = [], []
+    for reply in broadcast("/dedup/release", body).values():
+        deleted.extend(reply["deleted"])
+        failed.extend(reply["failed"])
+    return jsonify({"deleted": deleted, "failed": failed})
+
+@app.route('/tombstones', methods=['POST'])
+def add_tombstones():
+    """
+    Hands deletes a client could not carry out to the clusters, which replay
+    them once the nodes are back. Expects JSON {"tombstones": {node: [chunk_ids]}}.
+    """
+    body = request.get_json(silent=True) or {}
+    replies = broadcast("/tombstones", body)
+    return jsonify({"recorded": sum(reply["recorded"] for reply in replies.values())})
+
+@app.route('/files', methods=['GET'])
+def list_files():
+    """
+    Lists stored files by name, a page at a time: pass the last name of a
+    page as ?after= to get the next one.
+    """
+    limit = min(request.args.get("limit", 1000, type=int), 10000)
+    files = METADATA.list_files(after=request.args.get("after", ""), limit=limit)
+    return jsonify({"files": files, "next": files[-1]["name"] if len(files) == limit else None})
+
+@app.route('/files/<path:file_name>', methods=['GET'])
+def get_file(file_name):
+    metadata = METADATA.get_file(file_name)
+    if metadata is None:
+        return jsonify({"error": "File not found"}), 404
+    return jsonify(metadata)
+
+def release_replaced(previous, metadata):
+    """
+    Frees what the replaced version of a re-uploaded file stored, as
+    delete_file does for a deleted one. A content-defined version releases
+    all its chunk references, since the new version took its own; otherwise
+    every copy the new version does not store on the same node becomes a
+    tombstone, which its cluster replays.
+    """
+    if previous.get("chunking") == "cdc":
+        chunks = {chunk["id"]: chunk["nodes"] for chunk in previous["chunks"]}
+        broadcast("/dedup/release", {"chunks": chunks})
+        log(f"Released {len(chunks)} chunks of the replaced {metadata['file_name']}", context="GLOBAL")
+        return
+
+    kept = {(object_id, node) for object_id, nodes in iter_stored_objects(metadata) for node in nodes}
+    stale = {}
+    for object_id, nodes in iter_stored_objects(previous):
+        for node in nodes:
+            if (object_id, node) not in kept:
+                stale.setdefault(node, []).append(object_id)
+    if stale:
+        broadcast("/tombstones", {"tombstones": stale})
+        count = sum(len(ids) for ids in stale.values())
+        log(f"Recorded {count} copies of the replaced {metadata['file_name']} as tombstones", context="GLOBAL")
+
+@app.route('/files/<path:file_name>', methods=['PUT'])
+def put_file(file_name):
+    metadata = request.get_json(silent=True)
+    if not metadata or not isinstance(metadata.get("chunks"), list):
+        return jsonify({"error": "Missing metadata"}), 400
+    metadata["file_name"] = file_name
+    previous = METADATA.put_file(metadata)
+    if metadata.get("chunking") == "cdc":
+        # The file is committed: its chunks placed as pending are stored
+        broadcast("/dedup/confirm", {"chunk_ids": sorted({c["id"] for c in metadata["chunks"]})})
+    if previous:
+        release_replaced(previous, metadata)
+    log(f"Metadata saved for {file_name} ({len(metadata['chunks'])} chunks)", context="GLOBAL")
+    return jsonify({"status": "saved", "file_name": file_name})
+
+@app.route('/files/<path:file_name>', methods=['DELETE'])
+def delete_file(file_name):
+    if not METADATA.delete_file(file_name):
+        return jsonify({"error": "File not found"}), 404
+    log(f"Metadata deleted for {file_name}", context="GLOBAL")
+    return jsonify({"status": "deleted", "file_name": file_name})
+
+@app.route('/objects', methods=['GET'])
+def node_objects():
+    """
+    Lists the chunks and fragments stored on a node (?node=<url>) with the
+    file each belongs to, a page at a time like /files.
+    """
+    node = request.args.get("node")
+    if not node:
+        return jsonify({"error": "Missing node"}), 400
+    limit = min(request.args.get("limit", 1000, type=int), 10000)
+    objects = METADATA.objects_on_node(node, after=request.args.get("after", ""), limit=limit)
+    return jsonify({"objects": objects, "next": objects[-1]["id"] if len(objects) == limit else None})
+
+@app.route('/objects/<object_id>', methods=['GET'])
+def locate_object(object_id):
+    return jsonify({"id": object_id, "nodes": METADATA.locate(object_id)})
+
+@app.route('/objects/locate', methods=['POST'])
+def locate_objects():
+    """
+    Looks up the nodes of many chunks and fragments at once. Expects JSON
+    {"ids": [object_id]} and returns {"nodes": {object_id: [nodes]}} for
+    those some file references.
+    """
+    body = request.get_json(silent=True) or {}
+    ids = body.get("ids") if isinstance(body, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        return jsonify({"error": "ids must be a list of strings"}), 400
+    return jsonify({"nodes": METADATA.locate_many(ids)})
+
+@app.route('/objects/<object_id>/relocate', methods=['POST'])
+def relocate_object(object_id):
+    """
+    Records that a chunk or fragment moved from one node to another (after
+    a repair), in every file that references it.
+    """
+    body = request.get_json(silent=True) or {}
+    if not body.get("from") or not body.get("to"):
+        return jsonify({"error": "Missing from or to"}), 400
+    updated = METADATA.relocate(object_id, body["from"], body["to"])
+    if updated:
+        log(f"Relocated {object_id} from {body['from']} to {body['to']} in {updated} files", context="GLOBAL")
+    return jsonify({"id": object_id, "files": updated})
+
+@app.route('/ring', methods=['GET'])
+def ring_status():
+    """
+    Returns the placement strategy and the clusters' hash ring, from which
+    HashRing.from_dict rebuilds it; each cluster serves its nodes' ring.
+    """
+    return jsonify(dict(CLUSTER_RING.snapshot(), strategy=PLACEMENT_STRATEGY))
+
+@app.route('/status', methods=['GET'])
+def global_status():
+    statuses = CAPACITY.healthy()
+    return jsonify({
+        "free_mb": sum(s["free_mb"] for s in statuses),
+        "chunk_count": sum(s["chunk_count"] for s in statuses),
+        "active_nodes": sum(s["active_nodes"] for s in statuses),
+        "clusters": {
+            CLUSTER_NAMES[url]: health for url, health in CAPACITY.snapshot().items()
+        }
+    })
+
 @app.route('/')
 def index():
     return "🌍 Global Load Balancer is running", 200
@@ -77,5 +483,17 @@ if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--port', type=int, default=6000)
+    parser.add_argument('--server', choices=['dev', 'pooled'], default='pooled',
+                        help='dev: Flask development server; pooled: fixed thread pool server with keep-alive')
+    parser.add_argument('--threads', type=int, default=64, help='Worker threads of the pooled server')
     args = parser.parse_args()
-    app.run(host='0.0.0.0', port=args.port)
+    imported = METADATA.import_legacy(LEGACY_METADATA_DIR)
+    if imported:
+        log(f"Imported metadata of {imported} files from {LEGACY_METADATA_DIR}", context="GLOBAL")
+    CLUSTER_RING.load(os.path.join(STATE_DIR, "global_ring.json"))
+    CAPACITY.start()
+    if args.server == 'pooled':
+        from core.server import serve
+        serve(app, args.port, threads=args.threads)
+    else:
+        app.run(host='0.0.0.0', port=args.port)
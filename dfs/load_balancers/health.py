@@ -0,0 +1,165 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from load_balancers import log
+
+
+class HealthMonitor:
+    """
+    Keeps a TTL-bounded cache of upstream status, refreshed in the background.
+
+    Every target is probed concurrently on a fixed interval. A failed probe
+    marks the target unhealthy and backs it off exponentially before the next
+    attempt, so dead upstreams cost one short timeout per backoff period
+    instead of one per request. Upstreams may also push their status
+    (heartbeats), which refreshes their entry without waiting for a poll.
+
+    Args:
+        targets (List[str]): Upstream base URLs.
+        probe (Callable[[str], Optional[dict]]): Returns the status of a
+            target, or None when it is unreachable.
+        context (str): Log context.
+        interval (float): Seconds between polls of a healthy target.
+        ttl (float): Seconds after which a cached status is considered stale.
+        max_backoff (float): Upper bound on the retry delay of a failing target.
+        on_recover (Optional[Callable[[str], None]]): Called with the URL of
+            a target that is healthy again after failing.
+        clock (Callable[[], float]): Monotonic time source, in seconds.
+    """
+
+    def __init__(self, targets, probe, context, interval=2.0, ttl=10.0, max_backoff=60.0, on_recover=None,
+                 clock=time.monotonic):
+        self.targets = list(targets)
+        self.probe = probe
+        self.context = context
+        self.interval = interval
+        self.ttl = ttl
+        self.max_backoff = max_backoff
+        self.on_recover = on_recover
+        self.clock = clock
+        self._entries = {
+            url: {"status": None, "updated": 0.0, "healthy": False, "failures": 0, "retry_at": 0.0}
+            for url in self.targets
+        }
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=min(32, max(1, len(self.targets))))
+        self._started = False
+        self._created = clock()
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        self.refresh()
+        threading.Thread(target=self._run, name=f"{self.context.lower()}-health", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval / 2)
+            try:
+                self.refresh()
+            except Exception as e:
+                log(f"Health refresh failed: {e}", context=self.context)
+
+    def refresh(self, force=False):
+        """
+        Probes every target that is due (or all of them with force)
+        concurrently and updates the cache.
+        """
+        now = self.clock()
+        with self._lock:
+            due = [url for url, e in self._entries.items() if force or now >= e["retry_at"]]
+        for url, status in zip(due, self._pool.map(self.probe, due)):
+            if status is None:
+                self._mark_failed(url)
+            else:
+                self.report(url, status)
+
+    def report(self, url, status):
+        """
+        Stores a fresh status for a target, from a poll or a heartbeat.
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return False
+            recovered = not entry["healthy"] and entry["failures"]
+            if recovered:
+                log(f"{url} is healthy again", context=self.context)
+            entry.update(status=dict(status), updated=now, healthy=True, failures=0,
+                         retry_at=now + self.interval)
+        if recovered and self.on_recover:
+            self.on_recover(url)
+        return True
+
+    def _mark_failed(self, url):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries[url]
+            entry["failures"] += 1
+            if entry["healthy"]:
+                log(f"{url} marked unhealthy", context=self.context)
+            entry["healthy"] = False
+            backoff = min(self.interval * 2 ** (entry["failures"] - 1), self.max_backoff)
+            entry["retry_at"] = now + backoff
+
+    def mark_failed(self, url):
+        """
+        Marks a target unhealthy after a failed request on the data path.
+        """
+        self._mark_failed(url)
+
+    def adjust(self, url, **deltas):
+        """
+        Applies local, optimistic updates to a cached status (e.g. one more
+        chunk stored) until the next poll replaces it.
+        """
+        with self._lock:
+            status = self._entries.get(url, {}).get("status")
+            if status:
+                for key, delta in deltas.items():
+                    status[key] = status.get(key, 0) + delta
+
+    def healthy(self):
+        """
+        Returns:
+            List[dict]: Copies of the statuses of healthy targets whose cache
+            entry is fresher than the TTL, each with its 'url'.
+        """
+        now = self.clock()
+        with self._lock:
+            return [
+                dict(e["status"], url=url)
+                for url, e in self._entries.items()
+                if e["healthy"] and now - e["updated"] <= self.ttl
+            ]
+
+    def down_for(self, url):
+        """
+        Returns:
+            Optional[float]: Seconds since a target's last good status (or
+            since monitoring began, if it never had one) while it is
+            unhealthy; None while it is healthy.
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries[url]
+            if entry["healthy"] and now - entry["updated"] <= self.ttl:
+                return None
+            return now - (entry["updated"] or self._created)
+
+    def snapshot(self):
+        """
+        Returns the health of every target, for status endpoints.
+        """
+        now = self.clock()
+        with self._lock:
+            return {
+                url: {
+                    "healthy": e["healthy"] and now - e["updated"] <= self.ttl,
+                    "age_s": round(now - e["updated"], 2) if e["updated"] else None,
+                    "failures": e["failures"],
+                }
+                for url, e in self._entries.items()
+            }
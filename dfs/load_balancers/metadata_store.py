@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name    TEXT PRIMARY KEY,
+    size    INTEGER,
+    info    TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    file_name TEXT NOT NULL,
+    seq       INTEGER NOT NULL,
+    chunk_id  TEXT NOT NULL,
+    info      TEXT NOT NULL,
+    PRIMARY KEY (file_name, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chunks_by_id ON chunks (chunk_id);
+CREATE TABLE IF NOT EXISTS locations (
+    node      TEXT NOT NULL,
+    object_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    PRIMARY KEY (node, object_id, file_name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS locations_by_object ON locations (object_id);
+"""
+
+
+class MetadataStore:
+    """
+    Indexed metadata store backed by SQLite in WAL mode.
+
+    Holds file → ordered chunk list (with replica or fragment locations) and
+    the reverse node → stored objects index. Every lookup goes through a
+    B-tree index, and WAL lets readers proceed while a writer commits. Each
+    thread gets its own connection.
+
+    Args:
+        path (str): Database file path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put_file(self, metadata):
+        """
+        Stores (or replaces) a file's metadata in one transaction.
+
+        Returns:
+            Optional[dict]: The metadata it replaced, if the file existed.
+        """
+        from core.metadata import iter_stored_objects
+
+        name = metadata["file_name"]
+        info = {k: v for k, v in metadata.items() if k != "chunks"}
+        with self._conn() as conn:
+            # Take the write lock first, so the version read is the one replaced
+            conn.execute("BEGIN IMMEDIATE")
+            previous = self._get(conn, name)
+            self._delete(conn, name)
+            conn.execute(
+                "INSERT INTO files (name, size, info, updated) VALUES (?, ?, ?, ?)",
+                (name, metadata.get("file_size"), json.dumps(info), time.time())
+            )
+            conn.executemany(
+                "INSERT INTO chunks (file_name, seq, chunk_id, info) VALUES (?, ?, ?, ?)",
+                [(name, seq, chunk["id"], json.dumps(chunk)) for seq, chunk in enumerate(metadata["chunks"])]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO locations (node, object_id, file_name) VALUES (?, ?, ?)",
+                [(node, object_id, name) for object_id, nodes in iter_stored_objects(metadata) for node in nodes]
+            )
+        return previous
+
+    def get_file(self, name):
+        """
+        Returns a file's metadata with its chunks in file order, or None.
+        """
+        return self._get(self._conn(), name)
+
+    def _get(self, conn, name):
+        row = conn.execute("SELECT info FROM files WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        metadata = json.loads(row[0])
+        metadata["chunks"] = [
+            json.loads(info) for (info,) in
+            conn.execute("SELECT info FROM chunks WHERE file_name = ? ORDER BY seq", (name,))
+        ]
+        return metadata
+
+    def has_file(self, name):
+        return self._conn().execute("SELECT 1 FROM files WHERE name = ?", (name,)).fetchone() is not None
+
+    def list_files(self, after="", limit=1000):
+        """
+        Returns up to limit files sorted by name, starting after the given name.
+        """
+        rows = self._conn().execute(
+            "SELECT name, size, updated FROM files WHERE name > ? ORDER BY name LIMIT ?",
+            (after, limit)
+        )
+        return [{"name": name, "size": size, "updated": updated} for name, size, updated in rows]
+
+    def delete_file(self, name):
+        with self._conn() as conn:
+            return self._delete(conn, name)
+
+    def _delete(self, conn, name):
+        conn.execute("DELETE FROM locations WHERE file_name = ?", (name,))
+        conn.execute("DELETE FROM chunks WHERE file_name = ?", (name,))
+        return conn.execute("DELETE FROM files WHERE name = ?", (name,)).rowcount > 0
+
+    def objects_on_node(self, node, after="", limit=1000):
+        """
+        Returns up to limit objects stored on a node, sorted by object ID and
+        starting after the given ID, each with the files that reference it.
+        """
+        rows = self._conn().execute(
+            "SELECT object_id, json_group_array(file_name) FROM locations "
+            "WHERE node = ? AND object_id > ? GROUP BY object_id ORDER BY object_id LIMIT ?",
+            (node, after, limit)
+        )
+        return [{"id": object_id, "files": json.loads(files)} for object_id, files in rows]
+
+    def relocate(self, object_id, old, new):
+        """
+        Moves a chunk or fragment from node old to node new in every file
+        that references it, in one transaction.
+
+        Returns:
+            int: Number of files updated.
+        """
+        from core.metadata import parse_fragment_id
+
+        fragment = parse_fragment_id(object_id)
+        chunk_id = fragment[0] if fragment else object_id
+        with self._conn() as conn:
+            files = [name for (name,) in conn.execute(
+                "SELECT file_name FROM locations WHERE node = ? AND object_id = ?", (old, object_id)
+            )]
+            for name in files:
+                rows = conn.execute(
+                    "SELECT seq, info FROM chunks WHERE file_name = ? AND chunk_id = ?", (name, chunk_id)
+                ).fetchall()
+                for seq, info in rows:
+                    chunk = json.loads(info)
+                    if fragment:
+                        entries = [f for f in chunk.get("fragments", []) if f["id"] == object_id]
+                    else:
+                        entries = [chunk]
+                    for entry in entries:
+                        entry["nodes"] = [new if node == old else node for node in entry["nodes"]]
+                        entry["nodes"] = list(dict.fromkeys(entry["nodes"]))
+                    conn.execute("UPDATE chunks SET info = ? WHERE file_name = ? AND seq = ?",
+                                 (json.dumps(chunk), name, seq))
+                conn.execute("DELETE FROM locations WHERE node = ? AND object_id = ? AND file_name = ?",
+                             (old, object_id, name))
+                conn.execute("INSERT OR IGNORE INTO locations (node, object_id, file_name) VALUES (?, ?, ?)",
+                             (new, object_id, name))
+            return len(files)
+
+    def locate(self, object_id):
+        """
+        Returns the nodes holding a chunk or fragment.
+        """
+        rows = self._conn().execute(
+            "SELECT DISTINCT node FROM locations WHERE object_id = ?", (object_id,)
+        )
+        return [node for (node,) in rows]
+
+    def locate_many(self, object_ids):
+        """
+        Returns object ID → nodes holding it, for the given chunks and
+        fragments that some file references.
+        """
+        object_ids = list(object_ids)
+        conn = self._conn()
+        located = {}
+        # Within SQLite's limit on the number of query parameters
+        for start in range(0, len(object_ids), 500):
+            batch = object_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT DISTINCT object_id, node FROM locations WHERE object_id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for object_id, node in rows:
+                located.setdefault(object_id, []).append(node)
+        return located
+
+    def import_legacy(self, directory):
+        """
+        Imports per-file JSON metadata written before the metadata service
+        existed (or by a client that could not reach it). Imported files are
+        renamed to *.json.imported so they are not imported twice.
+
+        Returns:
+            int: Number of files imported.
+        """
+        from core.metadata import normalize_metadata
+
+        if not os.path.isdir(directory):
+            return 0
+        imported = 0
+        for entry in sorted(os.listdir(directory)):
+            if not entry.endswith(".json"):
+                continue
+            path = os.path.join(directory, entry)
+            with open(path) as f:
+                metadata = normalize_metadata(json.load(f), file_name=entry[:-len(".json")])
+            self.put_file(metadata)
+            os.replace(path, path + ".imported")
+            imported += 1
+        return imported
@@ -0,0 +1,210 @@
+import time
+import threading
+from collections import deque
+from requests import RequestException
+from load_balancers import log
+from load_balancers.repair import BACKGROUND_HEADERS
+from core.integrity import DIGEST_HEADER, chunk_digest, verify
+from core.metadata import iter_node_objects, load_metadata, parse_fragment_id, relocate_object, stored_digest
+from core.throttle import RateLimiter
+
+
+class Rebalancer:
+    """
+    Moves chunks and fragments to the nodes the hash ring assigns them, in
+    clusters that place chunks by consistent hashing.
+
+    Copies end up away from home when nodes join the ring, leave it or
+    change weight, and when a node was down as a chunk was placed (its copy
+    then went to the next node clockwise). Only the ranges next to changed
+    ring points change hands, so adding or removing one of N nodes moves
+    about 1/N of the chunks.
+
+    Each pass walks, node by node, the objects the metadata lists for the
+    node. A chunk with r replicas belongs on the first r members of its ID's
+    ring lookup; fragment i of a stripe of n belongs on member i (round
+    robin) of its chunk ID's n-member lookup, as clients spread a stripe
+    over its placement. A misplaced copy is read from its node and checked
+    against its recorded SHA-256, written to its home node, the metadata is
+    pointed at it, and the old copy is deleted. A copy whose home node is
+    down, or already holds the chunk, waits for a later pass.
+
+    Moves are background traffic for the nodes, and are also limited to
+    rate bytes per second and max_moves per pass, so rebalancing after a
+    membership change is spread over several passes.
+
+    Args:
+        nodes (List[str]): Node URLs of the cluster.
+        health (HealthMonitor): Health of those nodes.
+        http (Transport): Connections to the nodes.
+        ring (RingPlacement): Where chunks belong.
+        on_relocate (Callable): Called with (object_id, old, new) after an
+            object moved.
+        on_stale (Callable): Called with (node, [object_id]) when the old
+            copy of a moved object could not be deleted.
+        interval (float): Seconds between the starts of two passes.
+        rate (float): Bytes per second moved at most; 0 for no limit.
+        max_moves (int): Objects moved per pass at most.
+        context (str): Log context.
+    """
+
+    def __init__(self, nodes, health, http, ring, on_relocate=None, on_stale=None, interval=300.0, rate=0,
+                 max_moves=1000, context="CLUSTER"):
+        self.nodes = nodes
+        self.health = health
+        self.http = http
+        self.ring = ring
+        self.on_relocate = on_relocate
+        self.on_stale = on_stale
+        self.interval = interval
+        self.limiter = RateLimiter(rate)
+        self.max_moves = max_moves
+        self.context = context
+        self.passes = 0
+        self.moved = 0
+        self.moved_bytes = 0
+        self.last_pass = None
+        self.failed = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name="rebalance", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_pass()
+            except Exception as e:
+                log(f"Rebalance pass failed: {e}", context=self.context)
+
+    def misplaced(self, node, obj, files):
+        """
+        Looks up where an object listed on node belongs.
+
+        Args:
+            node (str): Node the object is listed on.
+            obj (dict): {'id', 'files'} as iter_node_objects yields it.
+            files (dict): (metadata, chunk by ID) of the files already loaded
+                in this pass, by name.
+
+        Returns:
+            Optional[Tuple[dict, str]]: The object's metadata entry and its
+            home node, if it must move there from node.
+        """
+        object_id = obj["id"]
+        fragment = parse_fragment_id(object_id)
+        chunk_id = fragment[0] if fragment else object_id
+        for name in obj["files"]:
+            if name not in files:
+                metadata = load_metadata(name) or {}
+                files[name] = metadata, {c["id"]: c for c in metadata.get("chunks", [])}
+            metadata, chunks = files[name]
+            chunk = chunks.get(chunk_id)
+            if chunk is None:
+                continue
+            if fragment:
+                members = self.ring.home(chunk_id, metadata["erasure"]["k"] + metadata["erasure"]["m"])
+                entry = next((f for f in chunk.get("fragments", []) if f["id"] == object_id), None)
+                wanted = [members[fragment[1] % len(members)]] if members else []
+            else:
+                entry = chunk
+                wanted = self.ring.home(chunk_id, len(chunk["nodes"]))
+            if entry is None or node not in entry["nodes"] or not wanted or node in wanted:
+                return None
+            targets = [n for n in wanted if n not in entry["nodes"] and self.health.down_for(n) is None]
+            return (entry, targets[0]) if targets else None
+        return None  # Deleted since it was listed
+
+    def move(self, object_id, entry, source, target):
+        """
+        Moves one object from source to target.
+
+        Returns:
+            int: Bytes moved.
+        """
+        expected = stored_digest(entry)
+        r = self.http.get(f"{source}/chunk/{object_id}", headers=BACKGROUND_HEADERS)
+        r.raise_for_status()
+        data = r.content
+        verify(f"{object_id} on {source}", chunk_digest(data), expected)
+        self.limiter.acquire(len(data))
+        r = self.http.put(
+            f"{target}/chunk/{object_id}",
+            data=data,
+            headers={"Content-Type": "application/octet-stream",
+                     DIGEST_HEADER: expected or chunk_digest(data), **BACKGROUND_HEADERS}
+        )
+        r.raise_for_status()
+        relocate_object(object_id, source, target)
+        # Later objects of the pass may read the same (cached) entry
+        entry["nodes"] = [target if node == source else node for node in entry["nodes"]]
+        if self.on_relocate:
+            self.on_relocate(object_id, source, target)
+        try:
+            r = self.http.delete(f"{source}/chunk/{object_id}", headers=BACKGROUND_HEADERS)
+            if r.status_code != 404:
+                r.raise_for_status()
+        except RequestException as e:
+            log(f"Deleting moved {object_id} on {source} failed: {e}", context=self.context)
+            if self.on_stale:
+                self.on_stale(source, [object_id])
+        return len(data)
+
+    def run_pass(self):
+        """
+        Moves misplaced objects home, up to max_moves of them.
+
+        Returns:
+            int: Number of objects moved.
+        """
+        started = time.time()
+        moved = moved_bytes = misplaced = 0
+        files = {}
+        for node in self.nodes:
+            if moved >= self.max_moves:
+                break
+            if self.health.down_for(node) is not None:
+                continue
+            try:
+                objects = list(iter_node_objects(node))
+            except RequestException as e:
+                log(f"Rebalance: cannot list the objects on {node}: {e}", context=self.context)
+                continue
+            for obj in objects:
+                if moved >= self.max_moves:
+                    break
+                try:
+                    found = self.misplaced(node, obj, files)
+                    if found is None:
+                        continue
+                    misplaced += 1
+                    entry, target = found
+                    moved_bytes += self.move(obj["id"], entry, node, target)
+                    moved += 1
+                except (RequestException, ValueError) as e:
+                    log(f"Moving {obj['id']} from {node} failed: {e}", context=self.context)
+                    with self._lock:
+                        self.failed.append({"id": obj["id"], "node": node, "error": str(e), "at": time.time()})
+        with self._lock:
+            self.passes += 1
+            self.moved += moved
+            self.moved_bytes += moved_bytes
+            self.last_pass = {
+                "started": started, "seconds": round(time.time() - started, 2),
+                "misplaced": misplaced, "moved": moved, "moved_bytes": moved_bytes
+            }
+        if misplaced:
+            log(f"Rebalance pass: {moved}/{misplaced} misplaced objects moved ({moved_bytes} bytes)",
+                context=self.context)
+        return moved
+
+    def stats(self):
+        with self._lock:
+            return {
+                "passes": self.passes,
+                "moved": self.moved,
+                "moved_bytes": self.moved_bytes,
+                "last_pass": self.last_pass,
+                "failed": list(self.failed),
+            }
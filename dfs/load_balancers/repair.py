@@ -0,0 +1,350 @@
+import time
+import threading
+from collections import deque
+from requests import RequestException
+from load_balancers import log
+from core.erasure import ReedSolomon
+from core.integrity import DIGEST_HEADER, ChecksumMismatch, chunk_digest, verify
+from core.metadata import (iter_node_objects, load_metadata, parse_fragment_id, relocate_object, stored_digest,
+                           stored_size)
+from core.throttle import PRIORITY_HEADER, BACKGROUND
+
+# Requests made by the repair loop are throttled by the nodes as background
+# traffic
+BACKGROUND_HEADERS = {PRIORITY_HEADER: BACKGROUND}
+
+
+class RepairLoop:
+    """
+    Finds chunks and fragments that the metadata places on a node but the
+    node no longer holds (deleted by its scrubber as corrupt, lost with a
+    disk, or on a node that stays down), and stores a good copy again. It
+    also deletes orphans: chunks a node holds that no file references, left
+    behind by uploads that were abandoned or replaced.
+
+    Each pass compares, node by node, the objects the metadata service lists
+    for the node with the node's own chunk listing. An object is repaired
+    once it has been missing for the grace period, so uploads and deletes in
+    flight are not mistaken for losses; all objects of a node count as
+    missing while it is down. A replica is copied from another replica and a
+    fragment is rebuilt from k others of its stripe, and both are checked
+    against their recorded SHA-256 before they are stored. The copy goes back
+    to the same node if it is healthy, otherwise to the best healthy node
+    not already holding part of the chunk, and the metadata is updated.
+
+    An orphan is deleted once it has been unreferenced for orphan_grace,
+    which must outlast any upload still in progress (its chunks are stored
+    before its metadata). Chunks placed within orphan_grace are never
+    collected either, since chunk IDs are reused when a file is uploaded
+    again. Content-addressed chunks known to the dedup index are kept:
+    their references decide when they go.
+
+    Every request carries the background priority header, so the nodes
+    throttle repair traffic to their background share of I/O.
+
+    Args:
+        nodes (List[str]): Node URLs of the cluster.
+        health (HealthMonitor): Health of those nodes.
+        http (Transport): Connections to the nodes.
+        pick_target (Callable): Takes the nodes to avoid and returns the URL
+            of the node to store a copy on, or None.
+        on_relocate (Callable): Called with (object_id, old, new) after an
+            object moved to another node.
+        interval (float): Seconds between the starts of two passes.
+        grace (float): Seconds an object must be missing to be repaired.
+        orphan_grace (float): Seconds a stored object must be unreferenced
+            to be deleted; 0 disables orphan collection.
+        keep (Callable): Takes an object ID and returns True if it must not
+            be collected even when no file references it.
+        context (str): Log context.
+    """
+
+    def __init__(self, nodes, health, http, pick_target, on_relocate=None, interval=60.0, grace=120.0,
+                 orphan_grace=0.0, keep=None, context="CLUSTER"):
+        self.nodes = nodes
+        self.health = health
+        self.http = http
+        self.pick_target = pick_target
+        self.on_relocate = on_relocate
+        self.interval = interval
+        self.grace = grace
+        self.orphan_grace = orphan_grace
+        self.keep = keep or (lambda object_id: False)
+        self.context = context
+        self.passes = 0
+        self.repaired = deque(maxlen=100)
+        self.failed = deque(maxlen=100)
+        self.collected = 0
+        self.last_pass = None
+        self._missing_since = {}
+        self._orphan_since = {}
+        self._placed = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name="repair", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_pass()
+            except Exception as e:
+                log(f"Repair pass failed: {e}", context=self.context)
+
+    def placed(self, chunk_ids):
+        """
+        Notes chunks just placed for an upload, so their copies are not
+        collected while it is in progress.
+        """
+        if not self.orphan_grace:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._placed.update((chunk_id, now) for chunk_id in chunk_ids)
+
+    def recently_placed(self, object_id, now):
+        fragment = parse_fragment_id(object_id)
+        placed = self._placed.get(fragment[0] if fragment else object_id)
+        return placed is not None and now - placed < self.orphan_grace
+
+    def stored_ids(self, node):
+        """
+        Returns the IDs of every chunk and fragment a node holds.
+        """
+        ids, after = set(), ""
+        while after is not None:
+            r = self.http.get(f"{node}/chunks", params={"after": after, "limit": 10000})
+            r.raise_for_status()
+            page = r.json()
+            ids.update(chunk["id"] for chunk in page["chunks"])
+            after = page["next"]
+        return ids
+
+    def reconcile(self):
+        """
+        Compares every node with the metadata.
+
+        Returns:
+            Tuple[list, list]: (node, object) pairs for the objects missing
+            from their node for at least the grace period, where objects are
+            {'id', 'files'}; and (node, object_id) pairs for the orphans
+            unreferenced for at least orphan_grace.
+        """
+        now = time.monotonic()
+        lost, seen = [], set()
+        orphans, unreferenced = [], set()
+        with self._lock:
+            self._placed = {key: at for key, at in self._placed.items() if now - at < self.orphan_grace}
+        for node in self.nodes:
+            down = self.health.down_for(node)
+            try:
+                # List the metadata first: everything it lists was stored
+                # before its metadata was saved, so it is also in a later
+                # listing of the node
+                expected = list(iter_node_objects(node))
+                present = self.stored_ids(node) if down is None else set()
+            except RequestException as e:
+                log(f"Repair: cannot compare {node} with the metadata: {e}", context=self.context)
+                seen.update(key for key in self._missing_since if key[0] == node)
+                unreferenced.update(key for key in self._orphan_since if key[0] == node)
+                continue
+            for obj in expected:
+                if obj["id"] in present:
+                    continue
+                key = (node, obj["id"])
+                seen.add(key)
+                missing_for = now - self._missing_since.setdefault(key, now)
+                if max(missing_for, down or 0) >= self.grace:
+                    lost.append((node, obj))
+
+            # A node the metadata places nothing on is left alone, in case
+            # the metadata service lost its database
+            if not self.orphan_grace or not expected:
+                continue
+            referenced = {obj["id"] for obj in expected}
+            for object_id in present:
+                if object_id in referenced or self.keep(object_id) or self.recently_placed(object_id, now):
+                    continue
+                key = (node, object_id)
+                unreferenced.add(key)
+                if now - self._orphan_since.setdefault(key, now) >= self.orphan_grace:
+                    orphans.append(key)
+        self._missing_since = {key: since for key, since in self._missing_since.items() if key in seen}
+        self._orphan_since = {key: since for key, since in self._orphan_since.items() if key in unreferenced}
+        return lost, orphans
+
+    def run_pass(self):
+        """
+        Repairs every object lost for the grace period, and deletes the
+        orphans due for collection.
+
+        Returns:
+            int: Number of objects repaired.
+        """
+        started = time.time()
+        lost, orphans = self.reconcile()
+        repaired = 0
+        files = {}
+        for node, obj in lost:
+            if self.repair(node, obj, files):
+                repaired += 1
+                self._missing_since.pop((node, obj["id"]), None)
+        collected = sum(self.collect(node, object_id) for node, object_id in orphans)
+        with self._lock:
+            self.passes += 1
+            self.collected += collected
+            self.last_pass = {
+                "started": started, "seconds": round(time.time() - started, 2),
+                "lost": len(lost), "repaired": repaired, "orphans": len(orphans), "collected": collected
+            }
+        if lost:
+            log(f"Repair pass: {repaired}/{len(lost)} lost objects repaired", context=self.context)
+        if orphans:
+            log(f"Repair pass: {collected}/{len(orphans)} orphans deleted", context=self.context)
+        return repaired
+
+    def collect(self, node, object_id):
+        """
+        Deletes an orphan from its node.
+
+        Returns:
+            bool: True if it was deleted (or already gone).
+        """
+        try:
+            r = self.http.delete(f"{node}/chunk/{object_id}", headers=BACKGROUND_HEADERS)
+            if r.status_code != 404:
+                r.raise_for_status()
+        except RequestException as e:
+            log(f"Deleting orphan {object_id} on {node} failed: {e}", context=self.context)
+            return False
+        self._orphan_since.pop((node, object_id), None)
+        return True
+
+    def repair(self, node, obj, files):
+        """
+        Stores a good copy of one object that node lost.
+
+        Args:
+            node (str): Node that lost the object.
+            obj (dict): {'id', 'files'} as reconcile lists it.
+            files (dict): (metadata, chunk by ID) of the files already loaded
+                in this pass, by name.
+
+        Returns:
+            bool: True if the object was repaired.
+        """
+        object_id = obj["id"]
+        fragment = parse_fragment_id(object_id)
+        chunk_id = fragment[0] if fragment else object_id
+
+        try:
+            # Any file referencing the object will do: they all store the
+            # same contents under the same ID
+            metadata = chunk = None
+            for name in obj["files"]:
+                if name not in files:
+                    loaded = load_metadata(name) or {}
+                    files[name] = loaded, {c["id"]: c for c in loaded.get("chunks", [])}
+                metadata, chunks = files[name]
+                chunk = chunks.get(chunk_id)
+                if chunk is not None:
+                    break
+            if chunk is None:
+                return False  # Deleted since the pass started
+            if fragment:
+                entry = next((f for f in chunk.get("fragments", []) if f["id"] == object_id), None)
+                holders = {n for f in chunk.get("fragments", []) for n in f["nodes"]}
+            else:
+                entry = chunk
+                holders = set(chunk["nodes"])
+            if entry is None or node not in entry["nodes"]:
+                return False  # Moved since the pass started
+
+            if fragment:
+                data = self.rebuild_fragment(metadata["erasure"], chunk, entry)
+            else:
+                data = self.copy_replica(object_id, entry, node)
+
+            target = node if self.health.down_for(node) is None else self.pick_target(holders)
+            if target is None:
+                raise ValueError("no healthy node to store it on")
+            r = self.http.put(
+                f"{target}/chunk/{object_id}",
+                data=data,
+                headers={"Content-Type": "application/octet-stream",
+                         DIGEST_HEADER: stored_digest(entry) or chunk_digest(data), **BACKGROUND_HEADERS}
+            )
+            r.raise_for_status()
+            if target != node:
+                relocate_object(object_id, node, target)
+                # Later objects of the pass may read the same (cached) entry
+                entry["nodes"] = [target if n == node else n for n in entry["nodes"]]
+                if self.on_relocate:
+                    self.on_relocate(object_id, node, target)
+        except (RequestException, ValueError) as e:
+            log(f"Repair of {object_id} (lost on {node}) failed: {e}", context=self.context)
+            with self._lock:
+                self.failed.append({"id": object_id, "node": node, "error": str(e), "at": time.time()})
+            return False
+
+        moved = "" if target == node else f" (moved from {node})"
+        log(f"Repaired {object_id} on {target}{moved}", context=self.context)
+        with self._lock:
+            self.repaired.append({"id": object_id, "node": target, "lost_on": node, "at": time.time()})
+        return True
+
+    def fetch(self, object_id, nodes, expected):
+        """
+        Returns an object's contents from the first of nodes that serves a
+        copy matching its checksum.
+        """
+        error = ValueError(f"no other copy of {object_id}")
+        for node in nodes:
+            if self.health.down_for(node) is not None:
+                continue
+            try:
+                r = self.http.get(f"{node}/chunk/{object_id}", headers=BACKGROUND_HEADERS)
+                r.raise_for_status()
+                verify(f"{object_id} on {node}", chunk_digest(r.content), expected)
+                return r.content
+            except (RequestException, ChecksumMismatch) as e:
+                error = e
+        raise error
+
+    def copy_replica(self, object_id, entry, lost_on):
+        return self.fetch(object_id, [n for n in entry["nodes"] if n != lost_on], stored_digest(entry))
+
+    def rebuild_fragment(self, erasure, chunk, entry):
+        """
+        Decodes a chunk from k other fragments of its stripe and re-encodes
+        the lost fragment.
+        """
+        codec = ReedSolomon(erasure["k"], erasure["m"])
+        received = {}
+        for other in chunk["fragments"]:
+            if len(received) == codec.k:
+                break
+            if other["id"] == entry["id"]:
+                continue
+            try:
+                received[other["index"]] = self.fetch(other["id"], other["nodes"], other.get("sha256"))
+            except (RequestException, ValueError):
+                continue
+        data = codec.decode(received, stored_size(chunk))
+        verify(chunk["id"], chunk_digest(data), stored_digest(chunk))
+        fragment = codec.encode(data)[entry["index"]]
+        verify(entry["id"], chunk_digest(fragment), entry.get("sha256"))
+        return fragment
+
+    def stats(self):
+        with self._lock:
+            return {
+                "passes": self.passes,
+                "missing": len(self._missing_since),
+                "unreferenced": len(self._orphan_since),
+                "collected": self.collected,
+                "last_pass": self.last_pass,
+                "repaired": list(self.repaired),
+                "failed": list(self.failed),
+            }
@@ -0,0 +1,130 @@
+import os
+import json
+import threading
+from load_balancers import log
+from core.hash_ring import VNODES, HashRing
+
+# Relative change in a member's reported capacity that replaces the learned
+# one (and so moves chunks); smaller changes are ignored
+CAPACITY_TOLERANCE = 0.1
+
+
+class RingPlacement:
+    """
+    Consistent-hash placement over a fixed set of members (the nodes of a
+    cluster, or the clusters), weighted by capacity.
+
+    A member's weight is its capacity over unit_mb. Capacities are learned
+    from the capacity_mb the members report and saved, so the ring, and
+    with it the place of every chunk, survives restarts and stays put while
+    a member is down. A learned capacity is only replaced when the member
+    reports one that differs by more than CAPACITY_TOLERANCE, e.g. after a
+    disk was grown. A member whose capacity is not known yet gets the mean
+    weight of the others.
+
+    Weights given as overrides are used as they are. An override of 0 drains
+    a member: it owns no part of the ring, so it gets no new chunks and the
+    rebalancer moves its chunks away, after which it can be removed.
+
+    Args:
+        members (Iterable[str]): Member URLs.
+        unit_mb (float): Capacity worth a weight of 1.
+        overrides (Dict[str, float]): Member URL → fixed weight.
+        vnodes (int): Ring points per unit of weight.
+        context (str): Log context.
+    """
+
+    def __init__(self, members, unit_mb, overrides=None, vnodes=VNODES, context="CLUSTER"):
+        self.members = list(members)
+        self.unit_mb = unit_mb
+        self.overrides = {m: w for m, w in (overrides or {}).items() if m in self.members}
+        self.vnodes = vnodes
+        self.context = context
+        self.path = None
+        self.capacities = {}
+        self._lock = threading.Lock()
+        self.ring = self._build()
+
+    def load(self, path):
+        """
+        Loads the capacities learned by an earlier run.
+        """
+        self.path = path
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            saved = json.load(f)
+        with self._lock:
+            self.capacities = {m: c for m, c in saved.items() if m in self.members}
+            self.ring = self._build()
+        log(f"Loaded ring capacities of {len(self.capacities)} members", context=self.context)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            snapshot = json.dumps(self.capacities)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(snapshot)
+        os.replace(tmp_path, self.path)
+
+    def weights(self):
+        known = {m: c / self.unit_mb for m, c in self.capacities.items()}
+        default = sum(known.values()) / len(known) if known else 1.0
+        return {m: self.overrides.get(m, known.get(m, default)) for m in self.members}
+
+    def _build(self):
+        return HashRing(self.weights(), self.vnodes)
+
+    def learn(self, status):
+        """
+        Folds in the capacity_mb of a member's status, rebuilding the ring if
+        it changed.
+
+        Returns:
+            bool: The ring changed.
+        """
+        member, capacity = status.get("url"), status.get("capacity_mb")
+        if not capacity or member not in self.members:
+            return False
+        with self._lock:
+            known = self.capacities.get(member)
+            if known is not None and abs(capacity - known) <= CAPACITY_TOLERANCE * known:
+                return False
+            self.capacities[member] = capacity
+            self.ring = self._build()
+        log(f"Ring weight of {member} set from its capacity of {capacity:.0f} MB", context=self.context)
+        try:
+            self.save()
+        except OSError as e:
+            log(f"Could not save ring capacities: {e}", context=self.context)
+        return True
+
+    def place(self, key, count, healthy):
+        """
+        Returns the members to store a new chunk on: the ones it belongs to,
+        where any not in healthy is replaced by the next member clockwise.
+        The rebalancer moves such copies home later.
+        """
+        return self.ring.lookup(key, count, skip=lambda member: member not in healthy)
+
+    def home(self, key, count):
+        """
+        Returns the members a chunk belongs on, whatever their health.
+        """
+        return self.ring.lookup(key, count)
+
+    def capacity_mb(self):
+        """
+        Returns the capacity the ring's weights stand for, which is what a
+        cluster reports as its own weight in the clusters' ring, or None
+        until some member's capacity is known.
+        """
+        if not self.capacities:
+            return None
+        return round(sum(self.ring.weights.values()) * self.unit_mb, 2)
+
+    def snapshot(self):
+        return dict(self.ring.to_dict(), unit_mb=self.unit_mb, capacities_mb=dict(self.capacities))
@@ -0,0 +1,146 @@
+import os
+import json
+import threading
+from load_balancers import log
+
+
+class TombstoneLog:
+    """
+    Durable record of chunk deletions that could not be carried out because
+    their node was down or failed, so the node catches up once it is back
+    instead of keeping the chunks forever.
+
+    The log is an append-only file of JSON lines: tombstones added for a
+    node, tombstones done (deleted on the node), and tombstones cancelled
+    because their chunk ID was placed again by a new upload. It is compacted
+    to the pending tombstones on load.
+
+    Pending tombstones are replayed by a background thread every interval
+    seconds, and right away for a node the health monitor saw recover (see
+    wake()).
+
+    Args:
+        nodes (List[str]): Node URLs tombstones are kept for; others are
+            ignored.
+        context (str): Log context.
+    """
+
+    def __init__(self, nodes, context="CLUSTER"):
+        self.nodes = set(nodes)
+        self.context = context
+        self.path = None
+        self._pending = {}  # node -> set of chunk IDs
+        self._lock = threading.Lock()
+        self._file = None
+        self._wake = threading.Event()
+
+    def load(self, path):
+        """
+        Loads the log, keeping only pending tombstones, and opens it for
+        appending.
+        """
+        self.path = path
+        pending = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line
+                    self._apply(pending, record)
+        with self._lock:
+            self._pending = {node: ids for node, ids in pending.items() if ids and node in self.nodes}
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                for node, ids in self._pending.items():
+                    f.write(json.dumps({"node": node, "add": sorted(ids)}) + "\n")
+            os.replace(tmp_path, path)
+            self._file = open(path, "a")
+        count = sum(len(ids) for ids in self._pending.values())
+        if count:
+            log(f"Loaded {count} pending tombstones for {len(self._pending)} nodes", context=self.context)
+
+    @staticmethod
+    def _apply(pending, record):
+        if "cancel" in record:
+            for ids in pending.values():
+                ids.difference_update(record["cancel"])
+        elif "add" in record:
+            pending.setdefault(record["node"], set()).update(record["add"])
+        elif "done" in record:
+            pending.get(record["node"], set()).difference_update(record["done"])
+
+    def _record(self, record):
+        self._apply(self._pending, record)
+        if self._file:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    def add(self, node, chunk_ids):
+        """
+        Records chunks still to be deleted from a node.
+
+        Returns:
+            int: Number of tombstones recorded (0 for a node not kept here).
+        """
+        chunk_ids = list(chunk_ids)
+        if node not in self.nodes or not chunk_ids:
+            return 0
+        with self._lock:
+            self._record({"node": node, "add": chunk_ids})
+        return len(chunk_ids)
+
+    def done(self, node, chunk_ids):
+        with self._lock:
+            self._record({"node": node, "done": list(chunk_ids)})
+
+    def cancel(self, chunk_ids):
+        """
+        Drops the tombstones of chunk IDs that are being stored again.
+        """
+        with self._lock:
+            chunk_ids = [c for c in chunk_ids if any(c in ids for ids in self._pending.values())]
+            if chunk_ids:
+                self._record({"cancel": chunk_ids})
+
+    def pending(self, node=None):
+        """
+        Returns the chunk IDs pending for a node, or {node: count} for all.
+        """
+        with self._lock:
+            if node is not None:
+                return sorted(self._pending.get(node, ()))
+            return {n: len(ids) for n, ids in self._pending.items() if ids}
+
+    def wake(self, node=None):
+        """
+        Triggers a replay now, e.g. when a node comes back.
+        """
+        self._wake.set()
+
+    def start(self, replay, interval=60.0):
+        """
+        Replays pending tombstones in the background.
+
+        Args:
+            replay (Callable[[str, List[str]], Iterable[str]]): Deletes chunks
+                from a node and returns the IDs that are done.
+            interval (float): Seconds between replays.
+        """
+        def run():
+            while True:
+                self._wake.wait(interval)
+                self._wake.clear()
+                for node, count in self.pending().items():
+                    try:
+                        done = list(replay(node, self.pending(node)))
+                    except Exception as e:
+                        log(f"Replaying {count} tombstones on {node} failed: {e}", context=self.context)
+                        continue
+                    if done:
+                        self.done(node, done)
+                        log(f"Replayed {len(done)}/{count} tombstones on {node}", context=self.context)
+
+        threading.Thread(target=run, name="tombstones", daemon=True).start()
@@ -0,0 +1,216 @@
+import os
+import bisect
+import threading
+from core.metadata import parse_fragment_id
+
+# Version 2 adds each chunk's SHA-256; version 1 snapshots still load
+SNAPSHOT_MAGIC = "dfs-chunk-index 2"
+SNAPSHOT_MAGIC_V1 = "dfs-chunk-index 1"
+
+
+class ChunkIndex:
+    """
+    In-memory index of the chunks a node stores: chunk ID → size, SHA-256
+    when known (and, for packed storage, where the chunk lives), the IDs in
+    sorted order for paging, and running totals, so status and listing
+    requests never touch the disk.
+
+    The index is saved as a snapshot next to the storage directory, stamped
+    with a fingerprint its storage engine takes. On startup the snapshot is
+    used only if the fingerprint still matches; otherwise the index is
+    rebuilt with one scan. Every change to the storage
+    goes through put(), remove() or relocate(), which apply it under the
+    index lock so a snapshot never misses a change made before its
+    fingerprint was taken. A rescan cannot recover checksums; the scrubber
+    learns them again.
+
+    Args:
+        storage_dir (str): Directory holding the chunks.
+        scan (Callable): Yields (chunk_id, size, location) for every stored
+            chunk.
+        stamp (Callable): Returns the storage fingerprint as a string.
+    """
+
+    def __init__(self, storage_dir, scan, stamp):
+        self.storage_dir = storage_dir
+        self.snapshot_path = storage_dir.rstrip(os.sep) + ".index"
+        self._scan = scan
+        self._stamp = stamp
+        self._lock = threading.Lock()
+        self._sizes = {}
+        self._locations = {}
+        self._digests = {}
+        self._ids = []
+        self.total_bytes = 0
+        self.fragment_count = 0
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._sizes
+
+    def size(self, chunk_id):
+        return self._sizes.get(chunk_id)
+
+    def location(self, chunk_id):
+        return self._locations.get(chunk_id)
+
+    def digest(self, chunk_id):
+        return self._digests.get(chunk_id)
+
+    def learn_digest(self, chunk_id, digest):
+        """
+        Records the checksum of a stored chunk whose checksum was unknown.
+        Chunks stored since then already have theirs and are left alone.
+        """
+        with self._lock:
+            if chunk_id in self._sizes and chunk_id not in self._digests:
+                self._digests[chunk_id] = digest
+                self._dirty = True
+
+    def items(self):
+        """
+        Returns a list of (chunk_id, size, location) for every chunk.
+        """
+        with self._lock:
+            return [(chunk_id, size, self._locations.get(chunk_id)) for chunk_id, size in self._sizes.items()]
+
+    def load(self):
+        """
+        Loads the snapshot if it is still valid, otherwise rescans.
+
+        Returns:
+            str: 'snapshot' or 'scan', whichever was used.
+        """
+        current = self._stamp()
+        try:
+            with open(self.snapshot_path) as f:
+                magic, stamp = f.readline().rstrip("\n").split("\t")
+                if magic in (SNAPSHOT_MAGIC, SNAPSHOT_MAGIC_V1) and stamp == current:
+                    entries, locations, digests = {}, {}, {}
+                    for line in f:
+                        chunk_id, size, *rest = line.rstrip("\n").split("\t")
+                        entries[chunk_id] = int(size)
+                        if magic == SNAPSHOT_MAGIC:
+                            location, digest = rest
+                        else:
+                            location, digest = (rest[0] if rest else "-"), "-"
+                        if location != "-":
+                            locations[chunk_id] = tuple(int(x) for x in location.split(","))
+                        if digest != "-":
+                            digests[chunk_id] = digest
+                    self._reset(entries, locations, digests)
+                    return "snapshot"
+        except (OSError, ValueError):
+            pass
+
+        entries, locations = {}, {}
+        for chunk_id, size, location in self._scan():
+            # A chunk found twice (e.g. copied by compaction before a crash):
+            # the later copy wins
+            entries[chunk_id] = size
+            if location is not None:
+                locations[chunk_id] = location
+        self._reset(entries, locations, {})
+        self._dirty = True
+        return "scan"
+
+    def _reset(self, entries, locations, digests):
+        with self._lock:
+            self._sizes = entries
+            self._locations = locations
+            self._digests = digests
+            self._ids = sorted(entries)
+            self.total_bytes = sum(entries.values())
+            self.fragment_count = sum(1 for chunk_id in entries if parse_fragment_id(chunk_id))
+
+    def put(self, chunk_id, size, publish, location=None, digest=None):
+        """
+        Runs publish() (which makes the chunk visible in storage) and records
+        the chunk, replacing any previous copy.
+        """
+        with self._lock:
+            publish()
+            if location is not None:
+                self._locations[chunk_id] = location
+            if digest is not None:
+                self._digests[chunk_id] = digest
+            else:
+                self._digests.pop(chunk_id, None)
+            previous = self._sizes.get(chunk_id)
+            if previous is None:
+                bisect.insort(self._ids, chunk_id)
+                if parse_fragment_id(chunk_id):
+                    self.fragment_count += 1
+            else:
+                self.total_bytes -= previous
+            self._sizes[chunk_id] = size
+            self.total_bytes += size
+            self._dirty = True
+
+    def remove(self, chunk_id, unlink):
+        """
+        Runs unlink() (which deletes the chunk file) and forgets the chunk.
+
+        Returns:
+            bool: False if the chunk was not stored.
+        """
+        with self._lock:
+            if chunk_id not in self._sizes:
+                return False
+            unlink()
+            self._locations.pop(chunk_id, None)
+            self._digests.pop(chunk_id, None)
+            self.total_bytes -= self._sizes.pop(chunk_id)
+            del self._ids[bisect.bisect_left(self._ids, chunk_id)]
+            if parse_fragment_id(chunk_id):
+                self.fragment_count -= 1
+            self._dirty = True
+            return True
+
+    def relocate(self, chunk_id, old, new, publish):
+        """
+        Moves a chunk's location from old to new, running publish() first,
+        unless the chunk was replaced or removed in the meantime.
+
+        Returns:
+            bool: True if the chunk was moved.
+        """
+        with self._lock:
+            if self._locations.get(chunk_id) != old:
+                return False
+            publish()
+            self._locations[chunk_id] = new
+            self._dirty = True
+            return True
+
+    def page(self, after="", limit=1000):
+        """
+        Returns up to limit (chunk_id, size) pairs in ID order, starting after
+        the given ID.
+        """
+        with self._lock:
+            start = bisect.bisect_right(self._ids, after)
+            return [(chunk_id, self._sizes[chunk_id]) for chunk_id in self._ids[start:start + limit]]
+
+    def save(self):
+        """
+        Writes the snapshot if the index changed since the last one.
+        """
+        if not self._dirty:
+            return
+        temp_path = self.snapshot_path + ".tmp"
+        with self._lock:
+            stamp = self._stamp()
+            lines = []
+            for chunk_id, size in self._sizes.items():
+                location = self._locations.get(chunk_id)
+                location = "-" if location is None else ",".join(map(str, location))
+                lines.append(f"{chunk_id}\t{size}\t{location}\t{self._digests.get(chunk_id, '-')}\n")
+            self._dirty = False
+        with open(temp_path, "w") as f:
+            f.write(f"{SNAPSHOT_MAGIC}\t{stamp}\n")
+            f.writelines(lines)
+        os.replace(temp_path, self.snapshot_path)
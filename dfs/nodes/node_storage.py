@@ -1,20 +1,103 @@
 import shutil
 import os
+import sys
+import time
+import atexit
+import signal
+import threading
 import traceback
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, Response, request, jsonify
+from werkzeug.datastructures import Range
+from core.integrity import DIGEST_HEADER, ChecksumMismatch, DigestReader, verify
+from core.metrics import Metrics
+from core.server import FileRange
+from core.throttle import BACKGROUND, PRIORITY_HEADER, RateLimiter, ThrottledReader
+from core.transport import Transport
+from nodes.scrubber import Scrubber
+from nodes.storage_engine import open_engine
 
 app = Flask(__name__)
 
+# Request latencies and bytes, store times and outcomes
+METRICS = Metrics()
+METRICS.instrument(app)
+
 # Directory where chunks will be stored
 STORAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'node_storage'))
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
+# Chunk storage: "flat" (one file per chunk), "sharded" (one file per
+# chunk in hash-prefix subdirectories) or "segment" (chunks packed into
+# append-only segment files). With NODE_FSYNC=batch a chunk is acknowledged
+# only once it is on stable storage, syncs being shared by every chunk that
+# finishes within NODE_FSYNC_WINDOW seconds; NODE_FSYNC=off skips syncing.
+STORAGE_ENGINE = os.getenv("NODE_ENGINE", "flat")
+FSYNC_MODE = os.getenv("NODE_FSYNC", "batch")
+FSYNC_WINDOW = float(os.getenv("NODE_FSYNC_WINDOW", "0.002"))
+
+# Seconds between snapshots of the chunk index (when it changed) and
+# compaction passes
+MAINTENANCE_INTERVAL = float(os.getenv("NODE_MAINTENANCE_INTERVAL", "30"))
+
+# Background work (scrubbing, and repair traffic from the cluster manager)
+# shares NODE_BACKGROUND_SHARE of the node's I/O budget of NODE_IO_MBPS.
+# A scrub pass over every chunk starts every NODE_SCRUB_INTERVAL seconds
+# (0 disables scrubbing).
+IO_MBPS = float(os.getenv("NODE_IO_MBPS", "200"))
+BACKGROUND_SHARE = float(os.getenv("NODE_BACKGROUND_SHARE", "0.2"))
+SCRUB_INTERVAL = float(os.getenv("NODE_SCRUB_INTERVAL", "86400"))
+BACKGROUND_IO = RateLimiter(IO_MBPS * BACKGROUND_SHARE * 1024 * 1024)
+
+# Most chunks a single batch delete request may name
+MAX_DELETE_BATCH = 10000
+
+
+def create_engine(name, root):
+    return open_engine(name, root, fsync=FSYNC_MODE != "off", fsync_window=FSYNC_WINDOW)
+
+
+ENGINE = create_engine(STORAGE_ENGINE, STORAGE_DIR)
+SCRUBBER = Scrubber(ENGINE, BACKGROUND_IO, SCRUB_INTERVAL)
+
+
+def background_limiter():
+    """
+    Returns the background I/O limiter if the current request is background
+    traffic, otherwise None.
+    """
+    return BACKGROUND_IO if request.headers.get(PRIORITY_HEADER) == BACKGROUND else None
+
+
+def store(chunk_id, stream, length=None, expected=None):
+    """
+    Streams a chunk into storage, hashing it on the way. When the sender gave
+    its SHA-256, a chunk that does not match is discarded before it replaces
+    anything.
+
+    Returns:
+        Tuple[int, str]: Bytes stored, and the chunk's SHA-256.
+
+    Raises:
+        ChecksumMismatch: The chunk does not match the expected checksum.
+    """
+    limiter = background_limiter()
+    reader = DigestReader(ThrottledReader(stream, limiter) if limiter else stream)
+    try:
+        with METRICS.timer("store.seconds"):
+            size = ENGINE.put(chunk_id, reader, length, verify=lambda: verify(chunk_id, reader.hexdigest(), expected))
+    except ChecksumMismatch:
+        METRICS.inc("store.checksum_mismatches")
+        raise
+    METRICS.inc("store.bytes", size)
+    return size, reader.hexdigest()
+
 
 @app.route('/store', methods=['POST'])
 def store_chunk():
     """
     Receives and stores a chunk.
-    Expects 'chunk_id' as form field and the file as 'chunk'.
+    Expects 'chunk_id' as form field and the file as 'chunk', and optionally
+    the chunk's SHA-256 as 'sha256' to verify it against.
     """
     chunk_id = request.form.get('chunk_id')
     chunk = request.files.get('chunk')
@@ -22,8 +105,38 @@ def store_chunk():
     if not chunk_id or not chunk:
         return jsonify({"error": "Missing chunk_id or chunk"}), 400
 
-    chunk.save(os.path.join(STORAGE_DIR, chunk_id))
-    return jsonify({"status": "stored", "chunk_id": chunk_id})
+    expected = request.form.get('sha256') or request.headers.get(DIGEST_HEADER)
+    try:
+        _, digest = store(chunk_id, chunk.stream, expected=expected)
+    except ChecksumMismatch as e:
+        return jsonify({"error": str(e)}), 422
+    return jsonify({"status": "stored", "chunk_id": chunk_id, "sha256": digest})
+
+
+@app.route('/chunk/<chunk_id>', methods=['PUT'])
+def put_chunk(chunk_id):
+    """
+    Stores a chunk sent as the raw request body, streamed straight to disk
+    without multipart parsing or spooling. The chunk is verified against the
+    SHA-256 in the X-Chunk-SHA256 header, if any.
+    """
+    try:
+        size, digest = store(chunk_id, request.stream, request.content_length, request.headers.get(DIGEST_HEADER))
+    except ChecksumMismatch as e:
+        return jsonify({"error": str(e)}), 422
+    return jsonify({"status": "stored", "chunk_id": chunk_id, "size": size, "sha256": digest})
+
+
+def collect_status():
+    total, used, free = shutil.disk_usage(STORAGE_DIR)
+    return {
+        "free_mb": round(free / (1024 * 1024), 2),
+        "capacity_mb": round(total / (1024 * 1024), 2),
+        "chunk_count": len(ENGINE.index),
+        "fragment_count": ENGINE.index.fragment_count,
+        "stored_mb": round(ENGINE.index.total_bytes / (1024 * 1024), 2),
+        "engine": ENGINE.name
+    }
 
 
 @app.route('/status', methods=['GET'])
@@ -32,29 +145,91 @@ def node_status():
     Returns current free disk space and number of stored chunks.
     """
     try:
-        total, used, free = shutil.disk_usage(STORAGE_DIR)
-        chunks = [
-            name for name in os.listdir(STORAGE_DIR)
-            if os.path.isfile(os.path.join(STORAGE_DIR, name))
-        ]
-        return jsonify({
-            "free_mb": round(free / (1024 * 1024), 2),
-            "chunk_count": len(chunks)
-        })
+        return jsonify(collect_status())
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"Failed to retrieve status: {str(e)}"}), 500
 
 
+@app.route('/chunks', methods=['GET'])
+def list_chunks():
+    """
+    Lists stored chunks with their sizes in ID order, a page at a time: pass
+    the last ID of a page as ?after= to get the next one.
+    """
+    limit = min(request.args.get("limit", 1000, type=int), 10000)
+    page = ENGINE.index.page(after=request.args.get("after", ""), limit=limit)
+    return jsonify({
+        "chunks": [{"id": chunk_id, "size": size} for chunk_id, size in page],
+        "next": page[-1][0] if len(page) == limit else None
+    })
+
+
 @app.route('/chunk/<chunk_id>', methods=['GET'])
 def get_chunk(chunk_id):
     """
-    Serves a chunk back to the client.
+    Serves a chunk, or the single byte range of it asked for with a Range
+    header. The bytes are sent with sendfile(2) straight from the page cache.
+    The chunk's SHA-256, when known, is sent in the X-Chunk-SHA256 header; a
+    HEAD request gets only the headers, so a client can check that a chunk
+    is stored intact without reading it.
     """
-    chunk_path = os.path.join(STORAGE_DIR, chunk_id)
-    if not os.path.exists(chunk_path):
+    if request.method == "HEAD":
+        size = ENGINE.index.size(chunk_id)
+        if size is None:
+            return Response(status=404)
+        headers = {"Accept-Ranges": "bytes", "Content-Length": str(size)}
+        digest = ENGINE.index.digest(chunk_id)
+        if digest:
+            headers[DIGEST_HEADER] = digest
+        return Response(status=200, headers=headers, mimetype="application/octet-stream")
+
+    # Retried once in case compaction moved the chunk between lookup and open
+    for _ in range(2):
+        location = ENGINE.locate(chunk_id)
+        if location is None:
+            return jsonify({"error": "Chunk not found"}), 404
+        path, offset, size = location
+        try:
+            file = open(path, "rb")
+            break
+        except FileNotFoundError:
+            continue
+    else:
         return jsonify({"error": "Chunk not found"}), 404
-    return send_file(chunk_path, as_attachment=True)
+
+    start, length, status = 0, size, 200
+    headers = {"Accept-Ranges": "bytes"}
+    digest = ENGINE.index.digest(chunk_id)
+    if digest:
+        headers[DIGEST_HEADER] = digest
+    # Multi-range requests, and ranges in other units, are answered with the
+    # whole chunk
+    byte_range = request.range
+    if byte_range and byte_range.units == "bytes" and len(byte_range.ranges) == 1:
+        first, _ = byte_range.ranges[0]
+        if first < 0 and size:
+            # A suffix longer than the chunk asks for all of it
+            byte_range = Range("bytes", [(max(first, -size), None)])
+        window = byte_range.range_for_length(size)
+        if window is None:
+            file.close()
+            return Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+        start, stop = window
+        length, status = stop - start, 206
+        headers["Content-Range"] = byte_range.to_content_range_header(size)
+    headers["Content-Length"] = str(length)
+    body = FileRange(file, offset + start, length, request.environ, limiter=background_limiter())
+    return Response(body, status=status, headers=headers, mimetype="application/octet-stream",
+                    direct_passthrough=True)
+
+
+@app.route('/scrub', methods=['GET'])
+def scrub_status():
+    """
+    Reports scrubbing progress and the corrupt chunks found recently.
+    """
+    return jsonify(SCRUBBER.stats())
 
 
 @app.route('/chunk/<chunk_id>', methods=['DELETE'])
@@ -62,17 +237,108 @@ def delete_chunk(chunk_id):
     """
     Deletes a chunk from local storage.
     """
-    chunk_path = os.path.join(STORAGE_DIR, chunk_id)
-    if os.path.exists(chunk_path):
-        os.remove(chunk_path)
+    if ENGINE.delete(chunk_id):
         return jsonify({"status": "deleted", "chunk_id": chunk_id})
     return jsonify({"error": "Chunk not found"}), 404
 
 
+@app.route('/chunks', methods=['DELETE'])
+def delete_chunks():
+    """
+    Deletes a batch of chunks, given as JSON {"chunk_ids": [...]}.
+
+    Returns {"results": {chunk_id: status}} where status is 'deleted',
+    'missing' (nothing to delete, which callers may treat as done) or an
+    error message, so a caller can retry just the chunks that failed.
+    """
+    body = request.get_json(silent=True) or {}
+    chunk_ids = body.get("chunk_ids")
+    if not isinstance(chunk_ids, list):
+        return jsonify({"error": "Missing chunk_ids"}), 400
+    if len(chunk_ids) > MAX_DELETE_BATCH:
+        return jsonify({"error": f"At most {MAX_DELETE_BATCH} chunks per request"}), 413
+
+    results = {}
+    for chunk_id in chunk_ids:
+        try:
+            results[chunk_id] = "deleted" if ENGINE.delete(chunk_id) else "missing"
+        except OSError as e:
+            results[chunk_id] = f"error: {e}"
+    return jsonify({"results": results})
+
+
+def heartbeat_loop(cluster_manager_url, node_url, interval):
+    """
+    Pushes this node's status to its cluster manager every interval seconds,
+    so placement decisions never have to wait on a status poll.
+    """
+    # A missed heartbeat is simply sent again next interval
+    transport = Transport(timeout=2, retries=0, pool_size=1)
+    while True:
+        try:
+            transport.post(
+                f"{cluster_manager_url}/heartbeat",
+                json=dict(collect_status(), url=node_url)
+            )
+        except Exception as e:
+            print(f"[WARN] Heartbeat to {cluster_manager_url} failed: {e}")
+        time.sleep(interval)
+
+
+def maintenance_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            ENGINE.index.save()
+            ENGINE.maintain()
+        except OSError as e:
+            print(f"[WARN] Storage maintenance failed: {e}")
+
+
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--port', type=int, default=5001, help='Port for this node to run on')
+    parser.add_argument('--cluster-manager', help='Cluster manager URL to send heartbeats to')
+    parser.add_argument('--heartbeat-interval', type=float, default=2.0, help='Seconds between heartbeats')
+    parser.add_argument('--advertise-url',
+                        help='URL the cluster manager reaches this node at (default: http://localhost:PORT)')
+    parser.add_argument('--storage-dir', help='Directory to store chunks in (default: node_storage/)')
+    parser.add_argument('--engine', choices=['flat', 'sharded', 'segment'], default=STORAGE_ENGINE,
+                        help='On-disk layout of the chunks')
+    parser.add_argument('--server', choices=['dev', 'pooled'], default='pooled',
+                        help='dev: Flask development server; pooled: fixed thread pool server')
+    parser.add_argument('--threads', type=int, default=256, help='Worker threads of the pooled server')
     args = parser.parse_args()
 
-    app.run(host='0.0.0.0', port=args.port)
+    if args.storage_dir or args.engine != ENGINE.name:
+        STORAGE_DIR = os.path.abspath(args.storage_dir or STORAGE_DIR)
+        os.makedirs(STORAGE_DIR, exist_ok=True)
+        ENGINE = create_engine(args.engine, STORAGE_DIR)
+        SCRUBBER = Scrubber(ENGINE, BACKGROUND_IO, SCRUB_INTERVAL)
+
+    started = time.monotonic()
+    source = ENGINE.load()
+    print(f"[OK] Indexed {len(ENGINE.index)} chunks ({ENGINE.name} storage) from {source} "
+          f"in {time.monotonic() - started:.2f}s")
+
+    # Save the index on shutdown, including on terminate() from the launcher
+    atexit.register(ENGINE.close)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    threading.Thread(target=maintenance_loop, args=(MAINTENANCE_INTERVAL,), daemon=True).start()
+    if SCRUB_INTERVAL > 0:
+        SCRUBBER.start()
+
+    if args.cluster_manager:
+        threading.Thread(
+            target=heartbeat_loop,
+            args=(args.cluster_manager, args.advertise_url or f"http://localhost:{args.port}",
+                  args.heartbeat_interval),
+            daemon=True
+        ).start()
+
+    if args.server == 'pooled':
+        from core.server import serve
+        serve(app, args.port, threads=args.threads)
+    else:
+        app.run(host='0.0.0.0', port=args.port)
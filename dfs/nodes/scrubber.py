@@ -0,0 +1,144 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import deque
+
+# Block size of scrub reads
+SCRUB_BLOCK_SIZE = 256 * 1024
+
+# Content-addressed (deduplicated) chunks are named by their SHA-256
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}$")
+
+
+class Scrubber:
+    """
+    Re-reads every stored chunk in the background and checks it against its
+    SHA-256, so bit rot is found before a reader trips over it.
+
+    Reads draw on a rate limiter (shared with other background traffic), so
+    scrubbing never takes more than its share of the disk. A corrupt chunk
+    is deleted: it then shows up as missing and the cluster manager's repair
+    loop stores a good copy again. Chunks whose checksum is unknown (stored
+    before checksums, or after the index was rebuilt by a scan) have it
+    learned on their first scrub, except content-addressed chunks, which are
+    checked against their name.
+
+    Args:
+        engine: Storage engine of the node.
+        limiter (RateLimiter): Limits scrub reads, in bytes per second.
+        interval (float): Seconds between the starts of two passes.
+    """
+
+    def __init__(self, engine, limiter, interval):
+        self.engine = engine
+        self.limiter = limiter
+        self.interval = interval
+        self.passes = 0
+        self.scanned = 0
+        self.scanned_bytes = 0
+        self.learned = 0
+        self.corrupt = deque(maxlen=100)
+        self.last_pass = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name="scrubber", daemon=True).start()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.run_pass()
+            except Exception as e:
+                print(f"[WARN] Scrub pass failed: {e}")
+            time.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+    def run_pass(self):
+        """
+        Verifies every chunk once, in ID order.
+
+        Returns:
+            List[str]: IDs of the corrupt chunks found (and deleted).
+        """
+        started = time.time()
+        found = []
+        after = ""
+        while True:
+            page = self.engine.index.page(after=after, limit=1000)
+            for chunk_id, _ in page:
+                if not self.check(chunk_id):
+                    found.append(chunk_id)
+            if not page:
+                break
+            after = page[-1][0]
+        with self._lock:
+            self.passes += 1
+            self.last_pass = {"started": started, "seconds": round(time.time() - started, 2), "corrupt": len(found)}
+        return found
+
+    def check(self, chunk_id):
+        """
+        Verifies one chunk, deleting it if it is corrupt.
+
+        Returns:
+            bool: False if the chunk was corrupt.
+        """
+        index = self.engine.index
+        location = self.engine.locate(chunk_id)
+        if location is None:
+            return True
+        expected = index.digest(chunk_id)
+        if expected is None and CONTENT_ADDRESSED.match(chunk_id):
+            expected = chunk_id
+
+        digest = self._hash(*location)
+        if digest is None or self.engine.locate(chunk_id) != location:
+            # Moved, replaced or deleted while it was being read
+            return True
+        with self._lock:
+            self.scanned += 1
+            self.scanned_bytes += location[2]
+
+        if expected is None:
+            index.learn_digest(chunk_id, digest)
+            with self._lock:
+                self.learned += 1
+            return True
+        if digest == expected or index.digest(chunk_id) not in (None, expected):
+            return True
+
+        print(f"[ERROR] Scrub: {chunk_id} is corrupt (SHA-256 {digest}, expected {expected}); deleting it")
+        self.engine.delete(chunk_id)
+        with self._lock:
+            self.corrupt.append({"id": chunk_id, "found": time.time()})
+        return False
+
+    def _hash(self, path, offset, size):
+        hasher = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                position, end = offset, offset + size
+                while position < end:
+                    n = min(SCRUB_BLOCK_SIZE, end - position)
+                    self.limiter.acquire(n)
+                    block = os.pread(f.fileno(), n, position)
+                    if not block:
+                        return None
+                    hasher.update(block)
+                    position += len(block)
+        except FileNotFoundError:
+            return None
+        return hasher.hexdigest()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "passes": self.passes,
+                "scanned": self.scanned,
+                "scanned_mb": round(self.scanned_bytes / (1024 * 1024), 2),
+                "learned": self.learned,
+                "last_pass": self.last_pass,
+                "corrupt": list(self.corrupt),
+            }
@@ -0,0 +1,529 @@
+import os
+import re
+import time
+import struct
+import hashlib
+import tempfile
+import threading
+from collections import defaultdict
+from core.chunker import write_at
+from nodes.chunk_index import ChunkIndex
+
+# Incoming chunks are copied to disk through a buffer of this size
+STREAM_BUFFER_SIZE = 256 * 1024
+
+# Hex digits of the chunk ID's hash used as the shard directory name
+# (3 → 4096 directories, about 250 files each at a million chunks)
+SHARD_PREFIX = 3
+
+# Packed segments: a new segment is started once the active one reaches
+# SEGMENT_SIZE, and a sealed segment is compacted once this fraction of it
+# is deleted or superseded records.
+SEGMENT_SIZE = 256 * 1024 * 1024
+COMPACT_THRESHOLD = 0.5
+
+# Segment record: magic, state, chunk ID length, data length, then the
+# chunk ID and the data. The state byte is flipped in place.
+RECORD = struct.Struct("<4sBHQ")
+RECORD_MAGIC = b"DFSR"
+PENDING, LIVE, DELETED = 0, 1, 2
+STATE_OFFSET = 4
+SEGMENT_NAME = re.compile(r"^seg_(\d{8})\.dat$")
+
+
+def read_blocks(stream, buffer_size=STREAM_BUFFER_SIZE):
+    """
+    Yields the contents of a stream through one reused buffer. Each block is
+    only valid until the next one is requested.
+    """
+    buffer = memoryview(bytearray(buffer_size))
+    while True:
+        n = stream.readinto(buffer)
+        if not n:
+            return
+        yield buffer[:n]
+
+
+class GroupSync:
+    """
+    Group commit for fsync.
+
+    A writer calls sync(path) and blocks until an fsync of that path that
+    started after its call has finished. One background thread runs the
+    fsyncs, waiting a short window first so that every writer finishing
+    meanwhile is covered by the same sync.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._cond = threading.Condition()
+        self._pending = set()
+        self._requested = 0
+        self._completed = 0
+        self._thread = None
+
+    def sync(self, path):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._pending.add(path)
+            self._requested += 1
+            ticket = self._requested
+            self._cond.notify_all()
+            while self._completed < ticket:
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._requested == self._completed:
+                    self._cond.wait()
+            time.sleep(self.window)
+            with self._cond:
+                target, paths, self._pending = self._requested, self._pending, set()
+            for path in paths:
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                except OSError as e:
+                    print(f"[WARN] Could not sync {path}: {e}")
+            with self._cond:
+                self._completed = target
+                self._cond.notify_all()
+
+
+class FlatStore:
+    """
+    One file per chunk, all directly in the storage directory.
+
+    A chunk is written to .incoming/ and renamed into place once complete,
+    so readers never see a partial chunk. With fsync enabled a chunk is
+    acknowledged only after its data and the rename are on stable storage;
+    the directory sync is shared by every chunk finishing within
+    fsync_window seconds.
+
+    Args:
+        root (str): Storage directory.
+        fsync (bool): Sync chunks to stable storage before acknowledging.
+        fsync_window (float): Seconds a directory sync waits for company.
+    """
+
+    name = "flat"
+    # Each chunk is a whole file of its own
+    whole_files = True
+
+    def __init__(self, root, fsync=True, fsync_window=0.002):
+        self.root = root
+        self.fsync = fsync
+        self.incoming = os.path.join(root, ".incoming")
+        os.makedirs(self.incoming, exist_ok=True)
+        self.syncer = GroupSync(fsync_window)
+        self.index = ChunkIndex(root, scan=self.scan, stamp=self.stamp)
+
+    def path(self, chunk_id):
+        return os.path.join(self.root, chunk_id)
+
+    def scan(self):
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if not entry.name.startswith(".") and entry.is_file():
+                    yield entry.name, entry.stat().st_size, None
+
+    def stamp(self):
+        return str(os.stat(self.root).st_mtime_ns)
+
+    def load(self):
+        return self.index.load()
+
+    def put(self, chunk_id, stream, length=None, verify=None):
+        """
+        Stores a chunk read from a stream, replacing any previous copy.
+
+        Args:
+            verify (Callable): Called once the whole body is written and
+                before it replaces anything; raising aborts the put. What
+                it returns is recorded as the chunk's checksum.
+
+        Returns:
+            int: Number of bytes stored.
+        """
+        path = self.path(chunk_id)
+        temp_path = os.path.join(self.incoming, f"{chunk_id}.{threading.get_ident()}")
+        size = 0
+        digest = None
+        try:
+            with open(temp_path, "wb") as f:
+                for block in read_blocks(stream):
+                    f.write(block)
+                    size += len(block)
+                if verify:
+                    digest = verify()
+                if self.fsync:
+                    f.flush()
+                    os.fdatasync(f.fileno())
+            self.index.put(chunk_id, size, lambda: os.replace(temp_path, path), digest=digest)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if self.fsync:
+            self.syncer.sync(os.path.dirname(path))
+        return size
+
+    def locate(self, chunk_id):
+        """
+        Returns (path, offset, size) of a stored chunk, or None.
+        """
+        size = self.index.size(chunk_id)
+        return None if size is None else (self.path(chunk_id), 0, size)
+
+    def delete(self, chunk_id):
+        path = self.path(chunk_id)
+        return self.index.remove(chunk_id, lambda: os.remove(path))
+
+    def maintain(self):
+        pass
+
+    def close(self):
+        self.index.save()
+
+
+class ShardedStore(FlatStore):
+    """
+    One file per chunk, fanned out over 16^SHARD_PREFIX subdirectories named
+    by a prefix of the SHA-256 of the chunk ID, so no directory grows past a
+    few hundred entries. Chunks left in the top level by the flat layout are
+    moved into their shards on the first startup.
+    """
+
+    name = "sharded"
+
+    def path(self, chunk_id):
+        shard = hashlib.sha256(chunk_id.encode()).hexdigest()[:SHARD_PREFIX]
+        return os.path.join(self.root, shard, chunk_id)
+
+    def shards(self):
+        with os.scandir(self.root) as it:
+            return sorted(entry.path for entry in it if not entry.name.startswith(".") and entry.is_dir())
+
+    def scan(self):
+        for name, _, _ in list(super().scan()):
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(os.path.join(self.root, name), path)
+        for shard in self.shards():
+            with os.scandir(shard) as it:
+                for entry in it:
+                    if entry.is_file():
+                        yield entry.name, entry.stat().st_size, None
+
+    def stamp(self):
+        digest = hashlib.sha256()
+        for directory in [self.root] + self.shards():
+            digest.update(f"{directory}:{os.stat(directory).st_mtime_ns};".encode())
+        return digest.hexdigest()
+
+    def put(self, chunk_id, stream, length=None, verify=None):
+        os.makedirs(os.path.dirname(self.path(chunk_id)), exist_ok=True)
+        return super().put(chunk_id, stream, length, verify)
+
+
+class SegmentStore:
+    """
+    Packs many chunks into large append-only segment files.
+
+    Each chunk is a record (header, chunk ID, data) appended to the active
+    segment; the index maps the chunk ID to (segment, data offset). Writers
+    reserve their record's space under a short lock and then write it
+    concurrently. A record is written as PENDING and flipped to LIVE once its
+    data is synced; deleting flips it to DELETED. Sealed segments whose dead
+    space passes compact_threshold are compacted by copying their live
+    records to the active segment and removing the old file.
+
+    Args:
+        root (str): Storage directory.
+        fsync (bool): Sync chunks to stable storage before acknowledging.
+        fsync_window (float): Seconds a segment sync waits for company.
+        segment_size (int): Size at which a new segment is started.
+        compact_threshold (float): Dead fraction that triggers compaction.
+    """
+
+    name = "segment"
+    whole_files = False
+
+    def __init__(self, root, fsync=True, fsync_window=0.002, segment_size=SEGMENT_SIZE,
+                 compact_threshold=COMPACT_THRESHOLD):
+        self.root = root
+        self.fsync = fsync
+        self.segment_size = segment_size
+        self.compact_threshold = compact_threshold
+        self.incoming = os.path.join(root, ".incoming")
+        os.makedirs(self.incoming, exist_ok=True)
+        self.syncer = GroupSync(fsync_window)
+        self.index = ChunkIndex(root, scan=self.scan, stamp=self.stamp)
+        self._lock = threading.Lock()
+        self._fds = {}
+        self._ends = {}
+        self._dead = defaultdict(int)
+        self._active = None
+        self._retired = []
+
+    def segment_path(self, segment):
+        return os.path.join(self.root, f"seg_{segment:08d}.dat")
+
+    def segments(self):
+        return sorted(int(m.group(1)) for m in map(SEGMENT_NAME.match, os.listdir(self.root)) if m)
+
+    def records(self, segment):
+        """
+        Yields (chunk_id, state, record offset, data offset, size) for every
+        record in a segment, stopping at a torn record at its end.
+        """
+        with open(self.segment_path(segment), "rb") as f:
+            pos = 0
+            while True:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                magic, state, id_length, size = RECORD.unpack(header)
+                if magic != RECORD_MAGIC:
+                    return
+                chunk_id = f.read(id_length).decode()
+                data_offset = pos + RECORD.size + id_length
+                yield chunk_id, state, pos, data_offset, size
+                pos = data_offset + size
+                f.seek(pos)
+
+    def scan(self):
+        for segment in self.segments():
+            for chunk_id, state, _, data_offset, size in self.records(segment):
+                if state == LIVE:
+                    yield chunk_id, size, (segment, data_offset)
+
+    def stamp(self):
+        digest = hashlib.sha256()
+        for segment in self.segments():
+            st = os.stat(self.segment_path(segment))
+            digest.update(f"{segment}:{st.st_size}:{st.st_mtime_ns};".encode())
+        return digest.hexdigest()
+
+    def load(self):
+        source = self.index.load()
+        live = defaultdict(int)
+        for chunk_id, size, (segment, _) in self.index.items():
+            live[segment] += RECORD.size + len(chunk_id.encode()) + size
+        with self._lock:
+            for segment in self.segments():
+                fd = os.open(self.segment_path(segment), os.O_RDWR)
+                self._fds[segment] = fd
+                self._ends[segment] = os.fstat(fd).st_size
+                self._dead[segment] = self._ends[segment] - live[segment]
+            # Appends never continue a segment from a previous run, whose
+            # tail may be torn; a new one is started on the first write
+            self._active = None
+        return source
+
+    def _new_segment(self):
+        segment = max(self._fds, default=0) + 1
+        fd = os.open(self.segment_path(segment), os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        self._fds[segment] = fd
+        self._ends[segment] = 0
+        return segment
+
+    def _reserve(self, chunk_id, size):
+        """
+        Reserves space for a record in the active segment and writes its
+        PENDING header.
+
+        Returns:
+            Tuple[int, int, int]: Segment, record offset and data offset.
+        """
+        key = chunk_id.encode()
+        length = RECORD.size + len(key) + size
+        with self._lock:
+            end = self._ends.get(self._active, 0)
+            if self._active is None or (end and end + length > self.segment_size):
+                self._active = self._new_segment()
+            segment = self._active
+            pos = self._ends[segment]
+            self._ends[segment] += length
+            fd = self._fds[segment]
+        write_at(fd, RECORD.pack(RECORD_MAGIC, PENDING, len(key), size) + key, pos)
+        return segment, pos, pos + RECORD.size + len(key)
+
+    def _set_state(self, segment, record_offset, state):
+        write_at(self._fds[segment], bytes([state]), record_offset + STATE_OFFSET)
+
+    def _discard(self, chunk_id, segment, size):
+        with self._lock:
+            if segment in self._ends:
+                self._dead[segment] += RECORD.size + len(chunk_id.encode()) + size
+
+    def _kill(self, chunk_id, location):
+        """
+        Marks the record at location DELETED. Called under the index lock.
+        """
+        segment, data_offset = location
+        record_offset = data_offset - RECORD.size - len(chunk_id.encode())
+        with self._lock:
+            alive = segment in self._fds
+        if alive:
+            self._set_state(segment, record_offset, DELETED)
+        self._discard(chunk_id, segment, self.index.size(chunk_id))
+
+    def put(self, chunk_id, stream, length=None, verify=None):
+        """
+        Stores a chunk read from a stream, replacing any previous copy.
+
+        Args:
+            length (int): Size of the chunk if known up front; otherwise the
+                stream is spooled to a temporary file first to measure it.
+            verify (Callable): Called once the whole body is written and
+                before it replaces anything; raising aborts the put. What
+                it returns is recorded as the chunk's checksum.
+
+        Returns:
+            int: Number of bytes stored.
+        """
+        if length is None:
+            spool = tempfile.TemporaryFile(dir=self.incoming)
+            for block in read_blocks(stream):
+                spool.write(block)
+            length = spool.tell()
+            spool.seek(0)
+            stream = spool
+
+        segment, record_offset, data_offset = self._reserve(chunk_id, length)
+        written = 0
+        digest = None
+        try:
+            for block in read_blocks(stream):
+                if written + len(block) > length:
+                    raise ValueError(f"{chunk_id}: body longer than its declared {length} bytes")
+                write_at(self._fds[segment], block, data_offset + written)
+                written += len(block)
+            if written != length:
+                raise ValueError(f"{chunk_id}: body ended after {written} of {length} bytes")
+            if verify:
+                digest = verify()
+        except BaseException:
+            self._discard(chunk_id, segment, length)
+            raise
+
+        if self.fsync:
+            self.syncer.sync(self.segment_path(segment))
+
+        def publish():
+            previous = self.index.location(chunk_id)
+            self._set_state(segment, record_offset, LIVE)
+            if previous is not None:
+                self._kill(chunk_id, previous)
+
+        self.index.put(chunk_id, length, publish, location=(segment, data_offset), digest=digest)
+        if self.fsync:
+            self.syncer.sync(self.segment_path(segment))
+        return length
+
+    def locate(self, chunk_id):
+        """
+        Returns (path, offset, size) of a stored chunk, or None.
+        """
+        location, size = self.index.location(chunk_id), self.index.size(chunk_id)
+        if location is None or size is None:
+            return None
+        segment, data_offset = location
+        return self.segment_path(segment), data_offset, size
+
+    def read(self, chunk_id):
+        """
+        Returns the contents of a chunk with one positioned read, or None.
+        """
+        # A chunk moved by compaction between the lookup and the read is
+        # looked up again
+        for _ in range(2):
+            location, size = self.index.location(chunk_id), self.index.size(chunk_id)
+            if location is None or size is None:
+                return None
+            segment, data_offset = location
+            fd = self._fds.get(segment)
+            if fd is not None:
+                return os.pread(fd, size, data_offset)
+        return None
+
+    def delete(self, chunk_id):
+        return self.index.remove(chunk_id, lambda: self._kill(chunk_id, self.index.location(chunk_id)))
+
+    def maintain(self):
+        """
+        Compacts sealed segments with too much dead space.
+        """
+        with self._lock:
+            candidates = [
+                segment for segment, end in self._ends.items()
+                if segment != self._active and end and self._dead[segment] / end >= self.compact_threshold
+            ]
+            # Segments retired by the previous pass can no longer be in use
+            retired, self._retired = self._retired, []
+        for fd in retired:
+            os.close(fd)
+        for segment in candidates:
+            self.compact(segment)
+
+    def compact(self, segment):
+        """
+        Copies a segment's live records to the active segment and removes it.
+
+        Returns:
+            int: Number of chunks moved.
+        """
+        source = self._fds[segment]
+        touched = set()
+        moved = 0
+        for chunk_id, state, _, data_offset, size in self.records(segment):
+            if state != LIVE or self.index.location(chunk_id) != (segment, data_offset):
+                continue
+            new_segment, new_record, new_data = self._reserve(chunk_id, size)
+            copied = 0
+            while copied < size:
+                block = os.pread(source, min(STREAM_BUFFER_SIZE, size - copied), data_offset + copied)
+                write_at(self._fds[new_segment], block, new_data + copied)
+                copied += len(block)
+            touched.add(new_segment)
+            if self.fsync:
+                self.syncer.sync(self.segment_path(new_segment))
+            if self.index.relocate(chunk_id, (segment, data_offset), (new_segment, new_data),
+                                   lambda: self._set_state(new_segment, new_record, LIVE)):
+                moved += 1
+            else:
+                self._discard(chunk_id, new_segment, size)
+
+        if self.fsync:
+            for new_segment in touched:
+                self.syncer.sync(self.segment_path(new_segment))
+        with self._lock:
+            self._fds.pop(segment)
+            self._ends.pop(segment)
+            self._dead.pop(segment, None)
+            self._retired.append(source)
+        os.remove(self.segment_path(segment))
+        return moved
+
+    def close(self):
+        self.index.save()
+
+
+ENGINES = {engine.name: engine for engine in (FlatStore, ShardedStore, SegmentStore)}
+
+
+def open_engine(name, root, **options):
+    """
+    Creates the storage engine called name ('flat', 'sharded' or 'segment')
+    over root.
+    """
+    if name not in ENGINES:
+        raise ValueError(f"unknown storage engine {name!r}, expected one of {sorted(ENGINES)}")
+    return ENGINES[name](root, **options)
@@ -0,0 +1,78 @@
+import sys
+import os
+import tempfile
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.chunker import GEAR, ContentDefinedChunkReader, cdc_boundaries
+
+MIN_SIZE, AVG_SIZE, MAX_SIZE = 4 * 1024, 16 * 1024, 64 * 1024
+
+
+def split(data):
+    chunks, start = [], 0
+    for end in cdc_boundaries(data, MIN_SIZE, AVG_SIZE, MAX_SIZE):
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+def reference_boundaries(data, min_size, avg_size, max_size):
+    # Byte-at-a-time Gear scan the vectorised one must match exactly, so
+    # chunks stored before keep deduplicating
+    bits = avg_size.bit_length() - 1
+    mask_strict = ((1 << (bits + 1)) - 1) << (32 - bits - 1)
+    mask_loose = ((1 << (bits - 1)) - 1) << (32 - bits + 1)
+    start = 0
+    while start < len(data):
+        end = min(start + max_size, len(data))
+        if end - start <= min_size:
+            yield end
+            return
+        h, cut = 0, end
+        for i in range(start + min_size, end):
+            h = ((h << 1) + GEAR[data[i]]) & 0xFFFFFFFF
+            if not h & (mask_strict if i < start + avg_size else mask_loose):
+                cut = i + 1
+                break
+        yield cut
+        start = cut
+
+
+def test_chunk_sizes_are_bounded():
+    data = os.urandom(1024 * 1024)
+    chunks = split(data)
+    assert b"".join(chunks) == data
+    assert all(MIN_SIZE < len(c) <= MAX_SIZE for c in chunks[:-1])
+
+
+def test_insertion_only_changes_nearby_chunks():
+    data = os.urandom(1024 * 1024)
+    edited = data[:500000] + b"inserted" + data[500000:]
+    before, after = split(data), split(edited)
+    shared = set(before) & set(after)
+    # Only the chunk(s) around the edit should differ
+    assert len(shared) >= len(before) - 2
+
+
+def test_boundaries_match_the_byte_at_a_time_scan():
+    # Low-entropy runs make the loose mask and max_size cuts happen too
+    data = os.urandom(300000) + bytes(200000) + os.urandom(300000)
+    assert list(cdc_boundaries(data, MIN_SIZE, AVG_SIZE, MAX_SIZE)) == \
+        list(reference_boundaries(data, MIN_SIZE, AVG_SIZE, MAX_SIZE))
+    assert list(cdc_boundaries(data[:1000], MIN_SIZE, AVG_SIZE, MAX_SIZE)) == [1000]
+    # Scans longer than one hashing block
+    sizes = (1024, 128 * 1024, 512 * 1024)
+    assert list(cdc_boundaries(data, *sizes)) == list(reference_boundaries(data, *sizes))
+
+
+def test_reader_can_stop_early():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.bin")
+        with open(path, "wb") as f:
+            f.write(os.urandom(256 * 1024))
+        with ContentDefinedChunkReader(path, AVG_SIZE) as reader:
+            chunks = iter(reader)
+            next(chunks)
+            chunks.close()  # Releases the mapping while the scan is mid-file
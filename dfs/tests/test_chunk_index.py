@@ -0,0 +1,43 @@
+import sys
+import os
+import tempfile
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from nodes.storage_engine import FlatStore
+
+
+def write(directory, name, data):
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(data)
+
+
+def test_index_snapshot_and_rescan():
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = os.path.join(tmp, "node")
+        os.makedirs(storage)
+        write(storage, "a_chunk00000", b"x" * 10)
+        write(storage, "a_chunk00001_frag02", b"y" * 5)
+
+        index = FlatStore(storage, fsync=False).index
+        assert index.load() == "scan"
+        assert (len(index), index.total_bytes, index.fragment_count) == (2, 15, 1)
+
+        index.put("b", 3, lambda: write(storage, "b", b"zzz"))
+        index.remove("a_chunk00000", lambda: os.remove(os.path.join(storage, "a_chunk00000")))
+        assert index.page() == [("a_chunk00001_frag02", 5), ("b", 3)]
+        assert index.page(after="a_chunk00001_frag02", limit=1) == [("b", 3)]
+        index.save()
+
+        # An unchanged directory is loaded from the snapshot
+        reloaded = FlatStore(storage, fsync=False).index
+        assert reloaded.load() == "snapshot"
+        assert reloaded.page() == index.page()
+
+        # A change made behind the index's back invalidates the snapshot
+        os.remove(os.path.join(storage, "b"))
+        rescanned = FlatStore(storage, fsync=False).index
+        assert rescanned.load() == "scan"
+        assert rescanned.page() == [("a_chunk00001_frag02", 5)]
+
@@ -0,0 +1,46 @@
+import sys
+import os
+import tempfile
+
+# Add core/ and client/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.chunker import MAX_CHUNK_SIZE, MAX_CHUNKS, MIN_CHUNK_SIZE, choose_chunk_size
+from client.throughput import ThroughputEstimate
+
+MB = 1024 * 1024
+
+
+def test_chunk_size_follows_file_size_nodes_and_throughput():
+    sizes = [choose_chunk_size(size) for size in (0, 100 * 1024, 2 * MB, 100 * MB, 1024 * MB, 100 * 1024 * MB)]
+    assert sizes == sorted(sizes)
+    for size in sizes:
+        assert MIN_CHUNK_SIZE <= size <= MAX_CHUNK_SIZE and size & (size - 1) == 0
+
+    # Small files go in one chunk; huge ones stay under MAX_CHUNKS chunks
+    assert choose_chunk_size(2 * MB) >= MB
+    assert 10 * 1024 * MB / choose_chunk_size(10 * 1024 * MB) <= MAX_CHUNKS
+
+    # More nodes spread a file over more chunks
+    assert choose_chunk_size(1024 * MB, nodes=64) < choose_chunk_size(1024 * MB, nodes=2)
+
+    # A slow round trip on a fast link makes small chunks not worth it
+    fast_rtt = choose_chunk_size(8 * MB, rtt=0.0002, bandwidth=100 * MB)
+    slow_rtt = choose_chunk_size(8 * MB, rtt=0.05, bandwidth=100 * MB)
+    assert fast_rtt == MIN_CHUNK_SIZE and slow_rtt > 4 * MB
+
+
+def test_throughput_estimate_persists():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "throughput.json")
+        estimate = ThroughputEstimate(path)
+        assert estimate.rtt is None and estimate.bandwidth is None
+        estimate.observe_rtt(0.01)
+        estimate.observe_transfers([(MB, 0.02), (MB, 0.02)])
+        assert abs(estimate.bandwidth - 2 * MB / 0.02) < 1
+        estimate.observe_rtt(0.02)
+        assert 0.01 < estimate.rtt < 0.02
+        estimate.save()
+
+        reloaded = ThroughputEstimate(path)
+        assert (reloaded.rtt, reloaded.bandwidth) == (estimate.rtt, estimate.bandwidth)
@@ -0,0 +1,118 @@
+import sys
+import os
+import io
+import json
+import threading
+
+# Add load_balancers/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+NODES = ["http://localhost:5001", "http://localhost:5002", "http://localhost:5003"]
+os.environ["NODES"] = json.dumps(NODES)
+
+import load_balancers
+from load_balancers import cluster_manager
+from load_balancers.dedup import DedupIndex
+
+
+def test_concurrent_dedup_upload_keeps_shared_copies(monkeypatch, tmp_path):
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(cluster_manager, "DEDUP", DedupIndex())
+    monkeypatch.setattr(cluster_manager, "select_best_nodes", lambda chunk_id, count=1, size_mb=0: NODES[:2])
+    deleted = []
+    monkeypatch.setattr(cluster_manager, "delete_from_node", lambda node, chunk_id: deleted.append(node))
+
+    # Another upload of the same content stores it on an overlapping set of
+    # nodes while this one is writing its replicas
+    lock = threading.Lock()
+
+    def store_on_node(node, chunk_id, data, digest):
+        with lock:
+            if chunk_id not in cluster_manager.DEDUP:
+                cluster_manager.DEDUP.record(chunk_id, NODES[1:])
+
+    monkeypatch.setattr(cluster_manager, "store_on_node", store_on_node)
+
+    r = cluster_manager.app.test_client().post("/upload_chunk", data={
+        "chunk": (io.BytesIO(b"content"), "c1"), "chunk_id": "c1", "dedup": "1", "replicas": "2"
+    })
+    assert r.status_code == 200
+    assert r.get_json()["nodes"] == NODES[1:]
+    # Only the copy the index does not point to is deleted
+    assert deleted == [NODES[0]]
+    load_balancers.flush_logs()
+
+
+def test_invalid_placements_are_rejected_before_any_state_changes(monkeypatch, tmp_path):
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    touched = []
+    monkeypatch.setattr(cluster_manager.REPAIR, "placed", touched.append)
+    monkeypatch.setattr(cluster_manager.TOMBSTONES, "cancel", touched.append)
+
+    client = cluster_manager.app.test_client()
+    for body in ([], {"chunks": "c1"}, {"chunks": [{"size": 1}]}, {"chunks": ["c1"]},
+                 {"chunks": [{"id": "c1", "size": "big"}]}, {"chunks": [{"id": "c1"}], "replicas": "2"}):
+        assert client.post("/place", json=body).status_code == 400
+    assert touched == []
+    load_balancers.flush_logs()
+
+
+def test_tombstone_replay_skips_chunks_referenced_again(monkeypatch, tmp_path):
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(cluster_manager, "DEDUP", DedupIndex())
+    monkeypatch.setattr(cluster_manager.HEALTH, "down_for", lambda node: None)
+    cluster_manager.DEDUP.record("deduplicated", NODES[1:])
+    looked_up = []
+
+    def locate_objects(object_ids):
+        looked_up.append(list(object_ids))
+        return {"reuploaded": [NODES[0]], "moved": [NODES[1]]}
+
+    monkeypatch.setattr(cluster_manager, "locate_objects", locate_objects)
+    deleted = []
+
+    def delete_from_nodes(http, by_node, headers=None):
+        deleted.append(by_node)
+        return {node: {c: "deleted" for c in ids} for node, ids in by_node.items()}
+
+    monkeypatch.setattr(cluster_manager, "delete_from_nodes", delete_from_nodes)
+
+    chunk_ids = ["gone", "reuploaded", "moved", "deduplicated"]
+    assert cluster_manager.replay_tombstones(NODES[0], chunk_ids) == ["gone", "moved"]
+    # Only the tombstoned IDs are looked up
+    assert looked_up == [chunk_ids]
+    assert deleted == [{NODES[0]: ["gone", "moved"]}]
+    load_balancers.flush_logs()
+
+def statuses(*free_mb):
+    return [{"url": url, "free_mb": free, "chunk_count": 0} for url, free in zip(NODES, free_mb)]
+
+
+def test_nodes_without_room_are_skipped(monkeypatch, tmp_path):
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    for strategy in ("score", "hash"):
+        monkeypatch.setattr(cluster_manager, "PLACEMENT_STRATEGY", strategy)
+        chosen = cluster_manager.place_nodes(statuses(1000, 30, 1000), "c1", 3, size_mb=50)
+        assert sorted(n["url"] for n in chosen) == [NODES[0], NODES[2]]
+    load_balancers.flush_logs()
+
+
+def test_placement_follows_free_space(monkeypatch, tmp_path):
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(cluster_manager, "PLACEMENT_STRATEGY", "score")
+    table = statuses(2000, 1000, 1000)
+    placed = {url: 0 for url in NODES}
+    for i in range(40):
+        for node in cluster_manager.place_nodes(table, f"c{i}", 1, size_mb=50):
+            placed[node["url"]] += 1
+    # Twice the free space takes twice the chunks, and the free space left
+    # keeps its proportions
+    assert list(placed.values()) == [20, 10, 10]
+    assert [n["free_mb"] for n in table] == [1000, 500, 500]
+
+    # Nodes fill up until none has room for another chunk
+    for i in range(200):
+        cluster_manager.place_nodes(table, f"d{i}", 1, size_mb=50)
+    assert all(0 <= n["free_mb"] < 50 for n in table)
+    assert cluster_manager.place_nodes(table, "last", 1, size_mb=50) == []
+    load_balancers.flush_logs()
@@ -0,0 +1,36 @@
+import sys
+import os
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.compression import CODECS, DecompressionError, choose_codec, compress, decompress, register_codec
+
+
+def log_lines(n):
+    return "".join(f"2024-05-01T12:00:{i % 60:02d}Z INFO request id={i} path=/api/v1/items/{i % 97} status=200\n"
+                   for i in range(n)).encode()
+
+
+def test_codec_roundtrip_and_choice():
+    text = log_lines(20000)
+    noise = os.urandom(len(text))
+    for codec in CODECS:
+        packed = compress(memoryview(text), codec)
+        assert len(packed) < len(text) // 4, codec
+        assert decompress(packed, codec) == text
+
+    assert choose_codec(text, "zlib") == "zlib"
+    assert choose_codec(noise, "zlib") is None
+    assert choose_codec(text[:100], "zlib") is None
+    assert choose_codec(text, None) is None
+
+    try:
+        decompress(b"not compressed", "zlib")
+        assert False
+    except DecompressionError:
+        pass
+
+    register_codec("reverse", lambda data: bytes(data)[::-1], lambda data: bytes(data)[::-1])
+    assert decompress(compress(b"abc", "reverse"), "reverse") == b"abc"
+    del CODECS["reverse"]
@@ -0,0 +1,50 @@
+import sys
+import os
+import json
+
+# Add load_balancers/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import load_balancers
+from load_balancers.dedup import DedupIndex
+
+NODES = ["http://localhost:5001", "http://localhost:5002", "http://localhost:5003"]
+
+
+def test_pending_chunks_are_not_reported_as_stored():
+    index = DedupIndex()
+    assert index.reserve("c1", NODES[:2]) == NODES[:2]
+    assert index.lookup(["c1"], add_ref=True) == {}
+
+    # A concurrent upload of the same content is placed on the same nodes
+    assert index.reserve("c1", NODES[1:]) == NODES[:2]
+    assert index.confirm(["c1", "unknown"]) == 1
+    assert index.lookup(["c1"]) == {"c1": NODES[:2]}
+
+    # Both uploads hold a reference
+    assert index.release(["c1"]) == []
+    assert index.release(["c1"]) == [("c1", NODES[:2])]
+
+
+def test_stored_copies_replace_a_placement():
+    index = DedupIndex()
+    index.reserve("c1", NODES[:2])
+    assert index.record("c1", NODES[2:]) == NODES[2:]
+    assert index.lookup(["c1"]) == {"c1": NODES[2:]}
+    # Stored chunks win over later uploads
+    assert index.record("c1", NODES[:1]) == NODES[2:]
+
+
+def test_old_snapshots_load_as_stored(monkeypatch, tmp_path):
+    # Loading logs; keep its lines and state out of the tree
+    monkeypatch.setenv("DFS_LOG_DIR", str(tmp_path))
+    monkeypatch.setenv("DFS_STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(load_balancers, "STATE_DIR", str(tmp_path))
+    path = os.path.join(tmp_path, "dedup.json")
+    with open(path, "w") as f:
+        json.dump({"c1": [NODES[0], 2], "c2": [NODES[1:], 1]}, f)
+    index = DedupIndex()
+    index.load(path)
+    assert index.lookup(["c1", "c2"]) == {"c1": [NODES[0]], "c2": NODES[1:]}
+    load_balancers.flush_logs()
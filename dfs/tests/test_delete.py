@@ -0,0 +1,15 @@
+import sys
+import os
+
+# Add client/ and core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from client import delete
+
+
+def test_deleting_a_missing_file_fails_cleanly(monkeypatch):
+    monkeypatch.setattr(delete, "load_metadata", lambda file_name: None)
+    deleted = []
+    monkeypatch.setattr(delete, "delete_metadata", deleted.append)
+    assert delete.delete_file("missing.bin") is None
+    assert deleted == []
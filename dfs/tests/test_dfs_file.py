@@ -0,0 +1,92 @@
+import sys
+import os
+import io
+import threading
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.metadata import build_metadata
+from client.dfs_file import DFSFile
+
+
+class LocalDFSFile(DFSFile):
+    """
+    Serves chunks from memory instead of the nodes, counting fetches.
+    """
+
+    def __init__(self, data, chunk_size, **kwargs):
+        self.data = data
+        self.fetched = []
+        chunks = [
+            {"id": f"f_chunk{i:05d}", "offset": offset, "size": min(chunk_size, len(data) - offset), "nodes": []}
+            for i, offset in enumerate(range(0, len(data), chunk_size))
+        ]
+        super().__init__(build_metadata("f", len(data), chunk_size, chunks), **kwargs)
+
+    def _fetch(self, index):
+        self.fetched.append(index)
+        chunk = self._chunks[index]
+        return self.data[chunk["offset"]:chunk["offset"] + chunk["size"]]
+
+
+def test_seek_and_read_touch_only_needed_chunks():
+    data = os.urandom(10 * 1000 + 123)
+    with LocalDFSFile(data, 1000, cache_chunks=3, readahead=0) as f:
+        f.seek(-50, io.SEEK_END)
+        assert f.read() == data[-50:]
+        assert f.fetched == [10]
+
+        f.seek(4990)
+        assert f.read(20) == data[4990:5010]
+        assert f.tell() == 5010
+        assert f.fetched == [10, 4, 5]
+        assert f.read(0) == b""
+        f.seek(len(data) + 10)
+        assert f.read(5) == b""
+
+    with LocalDFSFile(data, 1000, cache_chunks=4, readahead=2) as f:
+        assert io.BufferedReader(f).read() == data
+        assert sorted(set(f.fetched)) == list(range(11))
+        assert len(f._cache) <= 4
+
+
+class SlowPrefetchDFSFile(LocalDFSFile):
+    """
+    Serves chunks like LocalDFSFile, except that background fetches wait
+    for a gate.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.gate = threading.Event()
+        super().__init__(*args, **kwargs)
+
+    def _fetch(self, index):
+        if threading.current_thread().name.startswith("dfs-read"):
+            self.gate.wait(10)
+        return super()._fetch(index)
+
+
+def test_reads_do_not_wait_for_prefetches():
+    data = os.urandom(10 * 1000)
+    with SlowPrefetchDFSFile(data, 1000, readahead=1) as f:
+        # Reading chunk 0 starts the prefetch of chunk 1, which hangs, and
+        # chunk 2 is queued behind it
+        assert f.read(1000) == data[:1000]
+        f._cache[2] = f._pool.submit(f._fetch, 2)
+
+        reads = []
+
+        def read_elsewhere():
+            f.seek(5500)
+            reads.append(f.read(1000))
+            # A prefetch that has not started is taken over by the read
+            f.seek(2000)
+            reads.append(f.read(10))
+
+        reader = threading.Thread(target=read_elsewhere)
+        reader.start()
+        reader.join(2)
+        assert reads == [data[5500:6500], data[2000:2010]]
+        f.gate.set()
+        assert f.read() == data[2010:]
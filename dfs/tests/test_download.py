@@ -0,0 +1,190 @@
+import sys
+import os
+import threading
+import requests
+from werkzeug.http import parse_range_header
+
+# Add client/ and core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from client import download
+from core.integrity import chunk_digest
+from core.metadata import build_metadata
+
+NODES = ["http://localhost:5001", "http://localhost:5002", "http://localhost:5003"]
+
+
+class Response:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}")
+
+    def iter_content(self, block_size):
+        for i in range(0, len(self.content), block_size):
+            yield self.content[i:i + block_size]
+
+
+class NodesHTTP:
+    """
+    Nodes serving chunks from memory. A node listed in down refuses every
+    request; serve(node, chunk_id) may override what a node sends.
+    """
+
+    def __init__(self, stored, down=(), serve=None):
+        self.stored = stored
+        self.down = set(down)
+        self.serve = serve
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, stream=False):
+        node, _, chunk_id = url.rpartition("/chunk/")
+        with self._lock:
+            self.requests.append((node, chunk_id, (headers or {}).get("Range")))
+        if node in self.down:
+            raise requests.ConnectionError(f"{node} is down")
+        data = self.serve(node, chunk_id) if self.serve else None
+        data = self.stored[chunk_id] if data is None else data
+        if headers and "Range" in headers:
+            window = parse_range_header(headers["Range"]).range_for_length(len(data))
+            if window is None:
+                return Response(b"", status_code=416)
+            return Response(data[slice(*window)], status_code=206)
+        return Response(data)
+
+
+def chunk_entries(parts, nodes=NODES):
+    entries, offset = [], 0
+    for i, data in enumerate(parts):
+        entries.append({"id": f"f_chunk{i:05d}", "offset": offset, "size": len(data),
+                        "sha256": chunk_digest(data), "nodes": list(nodes)})
+        offset += len(data)
+    return entries
+
+
+def test_download_fails_over_to_the_next_replica(monkeypatch, tmp_path):
+    parts = [b"a" * 1000, b"b" * 500]
+    metadata = build_metadata("f", 1500, 1000, chunk_entries(parts))
+    stored = {c["id"]: data for c, data in zip(metadata["chunks"], parts)}
+
+    # The first node is down; the second serves a corrupt copy
+    def serve(node, chunk_id):
+        return b"x" * len(stored[chunk_id]) if node == NODES[1] else None
+
+    http = NodesHTTP(stored, down=[NODES[0]], serve=serve)
+    monkeypatch.setattr(download, "NODE_HTTP", http)
+    path = os.path.join(tmp_path, "f")
+    assert download.download_to_path(metadata, path, workers=1)
+    with open(path, "rb") as f:
+        assert f.read() == b"".join(parts)
+
+    assert http.requests == [
+        (NODES[0], "f_chunk00000", None),
+        # Fetched whole again after the bad copy, not resumed
+        (NODES[1], "f_chunk00000", None),
+        (NODES[2], "f_chunk00000", None),
+        # Nodes that failed are tried last
+        (NODES[2], "f_chunk00001", None),
+    ]
+
+
+def test_download_fails_when_no_replica_has_a_good_copy(monkeypatch, tmp_path):
+    parts = [b"a" * 1000]
+    metadata = build_metadata("f", 1000, 1000, chunk_entries(parts, NODES[:2]))
+    http = NodesHTTP({"f_chunk00000": parts[0]}, down=[NODES[0]], serve=lambda node, chunk_id: b"x" * 1000)
+    monkeypatch.setattr(download, "NODE_HTTP", http)
+    assert not download.download_to_path(metadata, os.path.join(tmp_path, "f"), workers=1)
+    assert [node for node, _, _ in http.requests] == NODES[:2]
+
+
+def test_chunks_completing_out_of_order_land_at_their_offsets(monkeypatch, tmp_path):
+    parts = [bytes([i]) * (1000 + i) for i in range(4)]
+    metadata = build_metadata("f", sum(map(len, parts)), 1000, chunk_entries(parts))
+    stored = {c["id"]: data for c, data in zip(metadata["chunks"], parts)}
+    offsets = [c["offset"] for c in metadata["chunks"]]
+
+    # Each chunk is served only once the one after it has been written
+    written = {offset: threading.Event() for offset in offsets}
+    writes = []
+
+    def serve(node, chunk_id):
+        index = int(chunk_id[-5:])
+        if index + 1 < len(parts):
+            assert written[offsets[index + 1]].wait(5)
+        return None
+
+    def write_at(fd, data, offset):
+        writes.append((offset, os.fstat(fd).st_size))
+        os.pwrite(fd, data, offset)
+        written[offset].set()
+
+    monkeypatch.setattr(download, "NODE_HTTP", NodesHTTP(stored, serve=serve))
+    monkeypatch.setattr(download, "write_at", write_at)
+    path = os.path.join(tmp_path, "f")
+    assert download.download_to_path(metadata, path, workers=len(parts))
+    with open(path, "rb") as f:
+        assert f.read() == b"".join(parts)
+    # Last chunk first, into a file already at its full size
+    assert writes == [(offset, metadata["file_size"]) for offset in reversed(offsets)]
+
+
+def test_file_without_a_recorded_size_is_trimmed_to_its_chunks(monkeypatch, tmp_path):
+    parts = [b"a" * 1000, b"b" * 10]
+    metadata = build_metadata("f", None, 1000, chunk_entries(parts))
+    stored = {c["id"]: data for c, data in zip(metadata["chunks"], parts)}
+    monkeypatch.setattr(download, "NODE_HTTP", NodesHTTP(stored))
+    path = os.path.join(tmp_path, "f")
+    # A longer file left at the path is replaced
+    with open(path, "wb") as f:
+        f.write(b"z" * 5000)
+    assert download.download_to_path(metadata, path)
+    with open(path, "rb") as f:
+        assert f.read() == b"".join(parts)
+
+
+def test_read_range_fetches_only_the_overlapping_bytes(monkeypatch):
+    parts = [b"a" * 1000, b"b" * 1000, b"c" * 500]
+    metadata = build_metadata("f", 2500, 1000, chunk_entries(parts))
+    data = b"".join(parts)
+    http = NodesHTTP({c["id"]: part for c, part in zip(metadata["chunks"], parts)})
+    monkeypatch.setattr(download, "NODE_HTTP", http)
+
+    assert download.read_range(metadata, 900, 1200) == data[900:2100]
+    assert sorted(request[1:] for request in http.requests) == [
+        ("f_chunk00000", "bytes=900-999"),
+        ("f_chunk00001", "bytes=0-999"),
+        ("f_chunk00002", "bytes=0-99"),
+    ]
+
+    # Ranges running past the end of the file are cut short
+    http.requests.clear()
+    assert download.read_range(metadata, 2400, 500) == data[2400:]
+    assert [request[1:] for request in http.requests] == [("f_chunk00002", "bytes=400-499")]
+    assert download.read_range(metadata, 2500, 10) == b""
+    assert download.read_range(metadata, 0, 0) == b""
+    assert len(http.requests) == 1
+
+
+def test_read_range_of_legacy_metadata_stops_at_the_end_of_the_data(monkeypatch):
+    # No file size and no chunk sizes: chunks are assumed to be chunk_size
+    parts = [b"a" * 1000, b"b" * 500]
+    metadata = build_metadata("f", None, 1000, chunk_entries(parts))
+    for chunk in metadata["chunks"]:
+        chunk["size"] = None
+    stored = {c["id"]: data for c, data in zip(metadata["chunks"], parts)}
+    monkeypatch.setattr(download, "NODE_HTTP", NodesHTTP(stored))
+
+    assert download.read_range(metadata, 900, 300) == b"a" * 100 + b"b" * 200
+    assert download.read_range(metadata, 1400, 300) == b"b" * 100
+    # The node answers 416 for a range wholly past the end of the chunk
+    assert download.read_range(metadata, 1600, 100) == b""
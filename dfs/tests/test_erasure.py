@@ -0,0 +1,17 @@
+import sys
+import os
+import itertools
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.erasure import ReedSolomon
+
+
+def test_rebuild_from_any_k_fragments():
+    rs = ReedSolomon(4, 2)
+    data = os.urandom(100003)  # not a multiple of k
+    fragments = rs.encode(data)
+    assert len(fragments) == 6
+    for indices in itertools.combinations(range(6), 4):
+        assert rs.decode({i: fragments[i] for i in indices}, len(data)) == data
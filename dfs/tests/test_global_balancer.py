@@ -0,0 +1,77 @@
+import sys
+import os
+import pytest
+
+# Add load_balancers/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import load_balancers
+from core.metadata import build_metadata
+from load_balancers.metadata_store import MetadataStore
+
+NODES = ["http://localhost:5001", "http://localhost:5002", "http://localhost:5003"]
+
+
+@pytest.fixture
+def balancer(monkeypatch, tmp_path):
+    # Importing and serving log; keep its lines and state out of the tree
+    monkeypatch.setenv("METADATA_DB", os.path.join(tmp_path, "metadata.db"))
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(load_balancers, "STATE_DIR", str(tmp_path))
+    from load_balancers import global_balancer
+
+    monkeypatch.setattr(global_balancer, "METADATA", MetadataStore(os.path.join(tmp_path, "files.db")))
+    calls = []
+    monkeypatch.setattr(global_balancer, "broadcast", lambda path, payload: calls.append((path, payload)) or {})
+    yield global_balancer.app.test_client(), calls
+    load_balancers.flush_logs()
+
+
+def chunk(chunk_id, nodes):
+    return {"id": chunk_id, "offset": 0, "size": 10, "nodes": nodes}
+
+
+def test_overwriting_a_file_tombstones_its_old_copies(balancer):
+    client, calls = balancer
+    old = build_metadata("f", 20, 10, [chunk("f_chunk00000", NODES[:2]), chunk("f_chunk00001", NODES[1:])])
+    assert client.put("/files/f", json=old).status_code == 200
+    assert calls == []
+
+    # Chunk IDs are reused; copies stay only where the new version wrote them
+    new = build_metadata("f", 10, 10, [chunk("f_chunk00000", NODES[1:])])
+    assert client.put("/files/f", json=new).status_code == 200
+    assert calls == [("/tombstones", {"tombstones": {NODES[0]: ["f_chunk00000"], NODES[1]: ["f_chunk00001"],
+                                                     NODES[2]: ["f_chunk00001"]}})]
+
+
+def test_overwriting_a_deduplicated_file_releases_its_references(balancer):
+    client, calls = balancer
+    old = build_metadata("f", 20, 10, [chunk("shared", NODES[:1]), chunk("gone", NODES[1:2])], chunking="cdc")
+    assert client.put("/files/f", json=old).status_code == 200
+
+    new = build_metadata("f", 20, 10, [chunk("shared", NODES[:1]), chunk("added", NODES[2:])], chunking="cdc")
+    calls.clear()
+    assert client.put("/files/f", json=new).status_code == 200
+    # The new version holds its own reference to the chunk both share
+    assert calls == [
+        ("/dedup/confirm", {"chunk_ids": ["added", "shared"]}),
+        ("/dedup/release", {"chunks": {"shared": NODES[:1], "gone": NODES[1:2]}}),
+    ]
+
+
+def test_invalid_placements_are_rejected(balancer):
+    client, calls = balancer
+    for body in ({"chunks": {"id": "c1"}}, {"chunks": [{"id": 1}]}, {"chunks": [{"id": "c1"}], "replicas": 0}):
+        assert client.post("/place", json=dict(body, dedup=True)).status_code == 400
+    # No cluster was asked for a dedup lookup
+    assert calls == []
+
+
+def test_objects_are_located_in_one_request(balancer):
+    client, _ = balancer
+    metadata = build_metadata("f", 20, 10, [chunk("f_chunk00000", NODES[:2]), chunk("f_chunk00001", NODES[2:])])
+    assert client.put("/files/f", json=metadata).status_code == 200
+
+    r = client.post("/objects/locate", json={"ids": ["f_chunk00001", "unknown"]})
+    assert r.get_json() == {"nodes": {"f_chunk00001": NODES[2:]}}
+    assert client.post("/objects/locate", json={"ids": "f_chunk00001"}).status_code == 400
@@ -0,0 +1,75 @@
+import sys
+import os
+
+# Add benchmarks/ and core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks import harness
+from core.metrics import Metrics
+
+MB = 1024 * 1024
+
+
+class Topology:
+    """
+    Services whose metrics live in this process.
+    """
+
+    def __init__(self, **tiers):
+        self.tiers = tiers
+
+    def scrape(self):
+        return {tier: [metrics.snapshot() for metrics in services] for tier, services in self.tiers.items()}
+
+
+def test_parse_mix():
+    assert harness.parse_mix("1MB:2,512KB,10") == [MB, MB, 512 * 1024, 10]
+    assert harness.parse_mix("1.5kb:1") == [1536]
+
+
+def test_run_phase_counts_only_what_the_phase_did(monkeypatch):
+    nodes, cluster, client = Metrics(), Metrics(), Metrics()
+    # Traffic from before the phase
+    nodes.observe("store.seconds", 0.5)
+    nodes.inc("store.bytes", 100)
+    client.observe("chunk.upload.seconds", 0.5)
+
+    def operation(item):
+        name, size = item
+        for _ in range(size // MB):
+            nodes.observe("store.seconds", 0.002)
+            client.observe("chunk.upload.seconds", 0.004)
+        nodes.inc("store.bytes", size)
+        return name != "failed"
+
+    clock = iter([10.0, 12.0])
+    monkeypatch.setattr(harness.time, "perf_counter", lambda: next(clock))
+    items = [("a", MB), ("b", 2 * MB), ("failed", 4 * MB)]
+    result = harness.run_phase(Topology(node=[nodes], cluster=[cluster]), operation, items, 2,
+                               client, "chunk.upload.seconds")
+
+    # Failed files count against the phase but not toward its throughput
+    assert (result["files"], result["failed"], result["bytes"]) == (3, 1, 3 * MB)
+    assert (result["seconds"], result["mb_s"], result["files_s"]) == (2.0, 1.5, 1.5)
+    assert result["chunk_latency"]["count"] == 7
+    assert result["chunk_latency"]["mean_ms"] == 4.0
+
+    node_hops = result["hops"]["node"]
+    assert node_hops["counters"] == {"store.bytes": 7 * MB}
+    assert node_hops["latency"]["store.seconds"]["count"] == 7
+    assert node_hops["latency"]["store.seconds"]["mean_ms"] == 2.0
+    # Tiers the phase did not touch report nothing
+    assert result["hops"]["cluster"] == {"latency": {}, "counters": {}}
+
+
+def test_hop_breakdown_merges_the_services_of_a_tier():
+    first, second = Metrics(), Metrics()
+    before = {"node": [first.snapshot(), second.snapshot()]}
+    first.observe("store.seconds", 0.001)
+    second.observe("store.seconds", 0.003)
+    first.inc("store.bytes", 10)
+    second.inc("store.bytes", 5)
+    tiers = harness.hop_breakdown(before, {"node": [first.snapshot(), second.snapshot()]})
+    assert tiers["node"]["counters"] == {"store.bytes": 15}
+    assert tiers["node"]["latency"]["store.seconds"]["count"] == 2
+    assert tiers["node"]["latency"]["store.seconds"]["mean_ms"] == 2.0
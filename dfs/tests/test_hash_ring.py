@@ -0,0 +1,70 @@
+import sys
+import os
+
+# Add core/ and load_balancers/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import load_balancers
+from core.hash_ring import HashRing
+from load_balancers.ring import RingPlacement
+
+NODES = [f"http://localhost:{5001 + i}" for i in range(4)]
+KEYS = [f"file.bin_chunk{i:05d}" for i in range(4000)]
+
+
+def test_lookup_is_deterministic_and_distinct():
+    ring = HashRing({node: 1 for node in NODES})
+    again = HashRing.from_dict(ring.to_dict())
+    for key in KEYS[:200]:
+        owners = ring.lookup(key, 3)
+        assert owners == again.lookup(key, 3)
+        assert len(set(owners)) == 3
+    assert len(ring.lookup(KEYS[0], 10)) == len(NODES)
+    assert HashRing().lookup(KEYS[0]) == []
+
+
+def test_adding_a_node_moves_its_share():
+    before = HashRing({node: 1 for node in NODES})
+    after = HashRing({node: 1 for node in NODES + ["http://localhost:5005"]})
+    moved = [key for key in KEYS if before.lookup(key) != after.lookup(key)]
+    # About 1/5 of the keys move, and only to the new node
+    assert 0.12 < len(moved) / len(KEYS) < 0.28
+    assert all(after.lookup(key) == ["http://localhost:5005"] for key in moved)
+
+
+def test_weights_and_skipped_members():
+    ring = HashRing({NODES[0]: 3, NODES[1]: 1})
+    share = sum(ring.lookup(key) == [NODES[0]] for key in KEYS) / len(KEYS)
+    assert 0.65 < share < 0.85
+
+    for key in KEYS[:100]:
+        home = ring.lookup(key, 1)[0]
+        other = NODES[1] if home == NODES[0] else NODES[0]
+        assert ring.lookup(key, 1, skip=lambda member: member == home) == [other]
+
+
+def test_placement_learns_capacities_and_drains(monkeypatch, tmp_path):
+    # Learning logs; keep its lines and state out of the tree
+    monkeypatch.setenv("DFS_LOG_DIR", str(tmp_path))
+    monkeypatch.setenv("DFS_STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(load_balancers, "STATE_DIR", str(tmp_path))
+    path = os.path.join(tmp_path, "ring.json")
+    placement = RingPlacement(NODES, unit_mb=1000, overrides={NODES[3]: 0})
+    placement.load(path)
+    assert placement.capacity_mb() is None
+    assert placement.learn({"url": NODES[0], "capacity_mb": 2000})
+    assert not placement.learn({"url": NODES[0], "capacity_mb": 2050})  # Within tolerance
+    assert not placement.learn({"url": "http://elsewhere:5001", "capacity_mb": 2000})
+    # Unknown capacities take the mean weight; the drained node has none
+    assert placement.weights() == {NODES[0]: 2.0, NODES[1]: 2.0, NODES[2]: 2.0, NODES[3]: 0}
+    assert placement.capacity_mb() == 6000
+    assert all(NODES[3] not in placement.home(key, 3) for key in KEYS[:200])
+
+    healthy = set(NODES[1:])
+    assert all(NODES[0] not in placement.place(key, 2, healthy) for key in KEYS[:200])
+
+    reloaded = RingPlacement(NODES, unit_mb=1000, overrides={NODES[3]: 0})
+    reloaded.load(path)
+    assert reloaded.ring.to_dict() == placement.ring.to_dict()
+    load_balancers.flush_logs()
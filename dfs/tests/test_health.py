@@ -0,0 +1,102 @@
+import sys
+import os
+import pytest
+
+# Add load_balancers/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import load_balancers
+from load_balancers.health import HealthMonitor
+
+NODES = ["http://localhost:5001", "http://localhost:5002"]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def monitor(monkeypatch, tmp_path):
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    clock = Clock()
+    up = {url: True for url in NODES}
+    probed = []
+
+    def probe(url):
+        probed.append(url)
+        return {"chunks": 1} if up[url] else None
+
+    recovered = []
+    monitor = HealthMonitor(NODES, probe, "TEST", interval=2.0, ttl=10.0, max_backoff=8.0,
+                            on_recover=recovered.append, clock=clock)
+    yield monitor, clock, up, probed, recovered
+    load_balancers.flush_logs()
+
+
+def test_cached_status_expires_after_the_ttl(monitor):
+    monitor, clock, up, probed, _ = monitor
+    monitor.refresh()
+    assert [s["url"] for s in monitor.healthy()] == NODES
+    assert monitor.down_for(NODES[0]) is None
+
+    # No poll and no heartbeat: the entries go stale
+    clock.now += 10.5
+    assert monitor.healthy() == []
+    assert monitor.down_for(NODES[0]) == 10.5
+    assert monitor.snapshot()[NODES[0]]["healthy"] is False
+
+
+def test_heartbeats_refresh_an_entry_without_a_poll(monitor):
+    monitor, clock, up, probed, _ = monitor
+    monitor.refresh()
+    clock.now += 8
+    assert monitor.report(NODES[1], {"chunks": 5})
+    clock.now += 8
+    assert monitor.healthy() == [{"chunks": 5, "url": NODES[1]}]
+    assert probed == NODES
+    # Heartbeats from unknown targets are ignored
+    assert not monitor.report("http://localhost:5999", {})
+
+
+def test_failing_targets_back_off_exponentially(monitor):
+    monitor, clock, up, probed, recovered = monitor
+    up[NODES[0]] = False
+    start = clock.now
+    attempts = []
+    while clock.now - start <= 40:
+        probed.clear()
+        monitor.refresh()
+        if NODES[0] in probed:
+            attempts.append(clock.now - start)
+        clock.now += 0.5
+    # The delay doubles from the interval, capped at max_backoff
+    assert attempts == [0, 2, 6, 14, 22, 30, 38]
+    assert monitor.snapshot()[NODES[0]]["failures"] == 7
+    # The healthy target kept its own schedule
+    assert [s["url"] for s in monitor.healthy()] == NODES[1:]
+
+    # The first good probe brings it back and reports the recovery
+    up[NODES[0]] = True
+    clock.now += 8
+    monitor.refresh()
+    assert recovered == [NODES[0]]
+    assert monitor.down_for(NODES[0]) is None
+    assert monitor.snapshot()[NODES[0]]["failures"] == 0
+
+
+def test_down_for_counts_from_the_last_good_status(monitor):
+    monitor, clock, up, _, _ = monitor
+    # Never seen: down since monitoring began
+    clock.now += 3
+    assert monitor.down_for(NODES[0]) == 3
+
+    monitor.refresh()
+    clock.now += 1
+    monitor.mark_failed(NODES[0])
+    clock.now += 4
+    assert monitor.down_for(NODES[0]) == 5
+    assert monitor.down_for(NODES[1]) is None
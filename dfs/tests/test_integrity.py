@@ -0,0 +1,57 @@
+import sys
+import os
+import io
+import hashlib
+import tempfile
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.integrity import ChecksumMismatch, DigestReader, chunk_digest, merkle_root, verify
+from nodes.storage_engine import open_engine, ENGINES
+
+
+def test_merkle_root():
+    digests = [chunk_digest(bytes([i]) * 100) for i in range(7)]
+    assert merkle_root([]) == hashlib.sha256(b"").hexdigest()
+    assert merkle_root(digests[:1]) == digests[0]
+    assert merkle_root(digests) == merkle_root(list(digests))
+
+    # Any changed, missing or reordered chunk changes the root
+    roots = {
+        merkle_root(digests),
+        merkle_root(digests[:-1]),
+        merkle_root(digests[1:] + digests[:1]),
+        merkle_root(digests[:3] + [chunk_digest(b"other")] + digests[4:]),
+    }
+    assert len(roots) == 4
+
+
+def test_engines_verify_before_publishing():
+    original, corrupt = os.urandom(5000), os.urandom(5000)
+    expected = chunk_digest(original)
+    for name in ENGINES:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = os.path.join(tmp, "node")
+            os.makedirs(root)
+            engine = open_engine(name, root, fsync=False)
+            engine.load()
+
+            reader = DigestReader(io.BytesIO(original))
+            engine.put("c", reader, len(original), verify=lambda: verify("c", reader.hexdigest(), expected))
+            assert reader.hexdigest() == expected
+
+            # A corrupt upload is refused and the stored copy survives
+            reader = DigestReader(io.BytesIO(corrupt))
+            try:
+                engine.put("c", reader, len(corrupt), verify=lambda: verify("c", reader.hexdigest(), expected))
+                assert False, "expected a checksum mismatch"
+            except ChecksumMismatch:
+                pass
+            assert len(engine.index) == 1
+            if engine.whole_files:
+                with open(engine.locate("c")[0], "rb") as f:
+                    assert f.read() == original
+            else:
+                assert engine.read("c") == original
+            engine.close()
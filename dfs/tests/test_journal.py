@@ -0,0 +1,44 @@
+import sys
+import os
+import tempfile
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from client.journal import UploadJournal
+
+
+def test_journal_resume():
+    source = {"file": "f", "size": 10, "mtime_ns": 1, "chunk_size": 4, "chunking": "fixed",
+              "replicas": 2, "erasure": None}
+    placements = {"f_chunk00000": {"cluster": "c", "nodes": ["n1", "n2"], "existing": False}}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal", "f.journal")
+        journal = UploadJournal(path)
+        assert not journal.load()
+        journal.start(source)
+        journal.record_placements(placements)
+        journal.record_placements({"f_chunk00001": {"cluster": "c", "nodes": ["n2"], "existing": False}})
+        journal.record_stored("f_chunk00000", "n1", "d0")
+        journal.close()
+        # A crash in the middle of a record leaves a torn last line
+        with open(path, "a") as f:
+            f.write('{"stored":"f_chunk00000","no')
+
+        resumed = UploadJournal(path)
+        assert resumed.load() and resumed.resumes(source)
+        assert not resumed.resumes(dict(source, mtime_ns=2))
+        # Placements are recorded a batch at a time
+        assert resumed.placements == {**placements, "f_chunk00001": {"cluster": "c", "nodes": ["n2"],
+                                                                      "existing": False}}
+        assert resumed.stored("f_chunk00000", "n1", "d0")
+        assert not resumed.stored("f_chunk00000", "n1", "other")
+        assert not resumed.stored("f_chunk00000", "n2", "d0")
+
+        resumed.reopen()
+        resumed.record_stored("f_chunk00000", "n2", "d0")
+        resumed.close()
+        again = UploadJournal(path)
+        assert again.load() and again.stored_count() == 2
+        again.discard()
+        assert not os.path.exists(path)
@@ -0,0 +1,51 @@
+import sys
+import os
+import tempfile
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.metadata import build_metadata
+from load_balancers.metadata_store import MetadataStore
+
+
+def test_store_roundtrip_and_node_index():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MetadataStore(os.path.join(tmp, "metadata.db"))
+        chunks = [
+            {"id": f"f_chunk{i:05d}", "offset": i * 10, "size": 10, "nodes": ["n1", f"n{i % 2 + 2}"]}
+            for i in range(5)
+        ]
+        assert store.put_file(build_metadata("f", 50, 10, chunks)) is None
+
+        assert store.get_file("f")["chunks"] == chunks
+        assert [f["name"] for f in store.list_files()] == ["f"]
+        assert [o["id"] for o in store.objects_on_node("n3")] == ["f_chunk00001", "f_chunk00003"]
+        assert sorted(store.locate("f_chunk00000")) == ["n1", "n2"]
+        located = store.locate_many(["f_chunk00001", "f_chunk00002", "unknown"])
+        assert {k: sorted(v) for k, v in located.items()} == {"f_chunk00001": ["n1", "n3"],
+                                                              "f_chunk00002": ["n1", "n2"]}
+
+        # Replacing a file returns the version replaced and rewrites its reverse index
+        assert store.put_file(build_metadata("f", 10, 10, chunks[:1]))["chunks"] == chunks
+        assert store.objects_on_node("n3") == []
+        assert store.delete_file("f") and store.get_file("f") is None
+
+
+def test_relocate_object():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MetadataStore(os.path.join(tmp, "metadata.db"))
+        fragments = [{"id": f"f_chunk00000_frag{i:02d}", "index": i, "nodes": [f"n{i}"]} for i in range(3)]
+        store.put_file(build_metadata("f", 10, 10, [{"id": "f_chunk00000", "offset": 0, "size": 10,
+                                                     "fragments": fragments}], erasure={"k": 2, "m": 1}))
+        for name in ("a", "b"):
+            store.put_file(build_metadata(name, 10, 10, [{"id": "shared", "offset": 0, "size": 10,
+                                                          "nodes": ["n1", "n2"]}], chunking="cdc"))
+
+        assert store.relocate("f_chunk00000_frag01", "n1", "n9") == 1
+        assert [f["nodes"] for f in store.get_file("f")["chunks"][0]["fragments"]] == [["n0"], ["n9"], ["n2"]]
+        # A deduplicated chunk moves in every file that references it
+        assert store.relocate("shared", "n2", "n1") == 2
+        assert store.get_file("b")["chunks"][0]["nodes"] == ["n1"]
+        assert sorted(store.locate("shared")) == ["n1"]
+        assert store.relocate("shared", "n2", "n1") == 0
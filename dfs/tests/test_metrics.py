@@ -0,0 +1,51 @@
+import sys
+import os
+from flask import Flask
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in [0.005] * 50 + [0.05] * 49 + [5.0]:
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["buckets"] == {"0.01": 50, "0.1": 99, "1.0": 99, "+Inf": 100}
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.25) == 0.005
+    assert histogram.quantile(0.99) == 0.1
+    assert histogram.quantile(1.0) == 1.0
+
+    rebuilt = Histogram.from_snapshot(snapshot)
+    assert rebuilt.snapshot() == snapshot
+    earlier = Histogram(buckets=(0.01, 0.1, 1.0))
+    earlier.observe(0.005)
+    assert rebuilt.merge(earlier, sign=-1).snapshot()["buckets"] == {"0.01": 49, "0.1": 98, "1.0": 98, "+Inf": 99}
+
+
+def test_instrumented_app_reports_requests():
+    metrics = Metrics()
+    app = Flask("test")
+    metrics.instrument(app)
+    app.add_url_rule("/echo", "echo", lambda: b"x" * 10, methods=["POST"])
+
+    client = app.test_client()
+    for _ in range(3):
+        client.post("/echo", data=b"y" * 100)
+    client.get("/missing")
+    with metrics.timer("forward.node.put.seconds"):
+        pass
+
+    snapshot = client.get("/metrics").get_json()
+    assert snapshot["counters"]["http.echo.requests"] == 3
+    assert snapshot["counters"]["http.status.2xx"] == 3
+    assert snapshot["counters"]["http.status.4xx"] == 1
+    assert snapshot["counters"]["http.bytes_in"] == 300
+    assert snapshot["counters"]["http.bytes_out"] >= 30
+    assert snapshot["histograms"]["http.echo.seconds"]["count"] == 3
+    assert snapshot["histograms"]["forward.node.put.seconds"]["count"] == 1
+    assert "http.metrics.requests" not in snapshot["counters"]
@@ -0,0 +1,62 @@
+import sys
+import os
+import io
+import pytest
+
+# Add nodes/ and core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from nodes import node_storage
+from nodes.storage_engine import open_engine
+
+DATA = bytes(range(100))
+
+
+@pytest.fixture(params=["flat", "segment"])
+def client(request, monkeypatch, tmp_path):
+    engine = open_engine(request.param, str(tmp_path / "node"), fsync=False)
+    engine.load()
+    # Packed after another chunk, so ranges start inside a segment
+    engine.put("before", io.BytesIO(b"x" * 37))
+    engine.put("c1", io.BytesIO(DATA))
+    monkeypatch.setattr(node_storage, "ENGINE", engine)
+    yield node_storage.app.test_client()
+    engine.close()
+
+
+def get(client, byte_range):
+    return client.get("/chunk/c1", headers={"Range": byte_range})
+
+
+def test_byte_ranges(client):
+    for byte_range, start, stop in (
+        ("bytes=10-19", 10, 20),
+        ("bytes=90-", 90, 100),
+        # Suffix range: the last 5 bytes
+        ("bytes=-5", 95, 100),
+        # Clipped to the end of the chunk
+        ("bytes=95-200", 95, 100),
+        ("bytes=-500", 0, 100),
+    ):
+        r = get(client, byte_range)
+        assert r.status_code == 206, byte_range
+        assert r.data == DATA[start:stop], byte_range
+        assert r.headers["Content-Range"] == f"bytes {start}-{stop - 1}/100"
+        assert r.headers["Content-Length"] == str(stop - start)
+
+
+def test_unsatisfiable_ranges(client):
+    for byte_range in ("bytes=100-", "bytes=500-600"):
+        r = get(client, byte_range)
+        assert r.status_code == 416
+        assert r.headers["Content-Range"] == "bytes */100"
+        assert r.data == b""
+
+
+def test_whole_chunk_without_a_single_range(client):
+    for headers in ({}, {"Range": "bytes=0-9,20-29"}, {"Range": "lines=1-2"}):
+        r = client.get("/chunk/c1", headers=headers)
+        assert (r.status_code, r.data) == (200, DATA)
+        assert r.headers["Accept-Ranges"] == "bytes"
+    assert get(client, "bytes=0-1").status_code == 206
+    assert client.get("/chunk/missing", headers={"Range": "bytes=0-1"}).status_code == 404
@@ -0,0 +1,97 @@
+import sys
+import os
+
+# Add load_balancers/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import load_balancers
+from core.integrity import chunk_digest
+from core.metadata import build_metadata
+from load_balancers import rebalance
+from load_balancers.rebalance import Rebalancer
+from load_balancers.ring import RingPlacement
+
+NODES = ["http://localhost:5001", "http://localhost:5002", "http://localhost:5003"]
+DATA = b"chunk contents"
+
+
+class Response:
+    def __init__(self, status_code=200, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise rebalance.RequestException(f"{self.status_code}")
+
+
+class NodesHTTP:
+    """
+    Nodes holding chunks in memory, recording every request in events.
+    """
+
+    def __init__(self, stored, events):
+        self.stored = stored
+        self.events = events
+
+    def get(self, url, headers=None):
+        node, _, chunk_id = url.rpartition("/chunk/")
+        return Response(content=self.stored[node][chunk_id])
+
+    def put(self, url, data, headers=None):
+        node, _, chunk_id = url.rpartition("/chunk/")
+        self.events.append(("put", node, chunk_id))
+        self.stored.setdefault(node, {})[chunk_id] = data
+        return Response()
+
+    def delete(self, url, headers=None):
+        node, _, chunk_id = url.rpartition("/chunk/")
+        self.events.append(("delete", node, chunk_id))
+        del self.stored[node][chunk_id]
+        return Response()
+
+
+class AllUp:
+    def down_for(self, node):
+        return None
+
+
+def test_misplaced_chunks_move_home_before_the_old_copy_goes(monkeypatch, tmp_path):
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    ring = RingPlacement(NODES, unit_mb=1000)
+    # Chunk 0 is at home; chunk 1 is on a node it does not belong on
+    home = {f"f_chunk{i:05d}": ring.home(f"f_chunk{i:05d}", 1)[0] for i in range(2)}
+    away = next(node for node in NODES if node != home["f_chunk00001"])
+    chunks = [
+        {"id": "f_chunk00000", "offset": 0, "size": len(DATA), "sha256": chunk_digest(DATA),
+         "nodes": [home["f_chunk00000"]]},
+        {"id": "f_chunk00001", "offset": len(DATA), "size": len(DATA), "sha256": chunk_digest(DATA),
+         "nodes": [away]},
+    ]
+    metadata = build_metadata("f", 2 * len(DATA), len(DATA), chunks)
+    stored = {home["f_chunk00000"]: {"f_chunk00000": DATA}}
+    stored.setdefault(away, {})["f_chunk00001"] = DATA
+
+    events = []
+    listed = {node: [{"id": c["id"], "files": ["f"]} for c in chunks if node in c["nodes"]] for node in NODES}
+    monkeypatch.setattr(rebalance, "iter_node_objects", lambda node: iter(listed[node]))
+    monkeypatch.setattr(rebalance, "load_metadata", lambda name: metadata)
+    monkeypatch.setattr(rebalance, "relocate_object",
+                        lambda object_id, old, new: events.append(("relocate", old, new, object_id)))
+
+    rebalancer = Rebalancer(NODES, AllUp(), NodesHTTP(stored, events), ring)
+    assert rebalancer.run_pass() == 1
+    target = home["f_chunk00001"]
+    # Copied, recorded in the metadata, and only then deleted at the source
+    assert events == [
+        ("put", target, "f_chunk00001"),
+        ("relocate", away, target, "f_chunk00001"),
+        ("delete", away, "f_chunk00001"),
+    ]
+    assert stored[target]["f_chunk00001"] == DATA
+    assert rebalancer.stats()["moved_bytes"] == len(DATA)
+
+    # The move updated the chunk's entry; listed again, nothing is left to move
+    listed = {node: [{"id": c["id"], "files": ["f"]} for c in chunks if node in c["nodes"]] for node in NODES}
+    assert rebalancer.run_pass() == 0
+    load_balancers.flush_logs()
@@ -0,0 +1,91 @@
+import sys
+import os
+
+# Add load_balancers/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import load_balancers
+from core.integrity import chunk_digest
+from core.metadata import build_metadata
+from load_balancers import repair
+from load_balancers.repair import RepairLoop
+
+NODES = [f"http://localhost:500{i}" for i in range(1, 6)]
+DATA = b"chunk contents"
+
+
+class Response:
+    def __init__(self, status_code=200, content=b"", body=None):
+        self.status_code = status_code
+        self.content = content
+        self.body = body
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise repair.RequestException(f"{self.status_code}")
+
+
+class NodesHTTP:
+    """
+    Nodes holding chunks in memory.
+    """
+
+    def __init__(self, stored):
+        self.stored = stored
+
+    def get(self, url, params=None, headers=None):
+        node, _, path = url.rpartition("/chunk")
+        if path == "s":
+            return Response(body={"chunks": [{"id": c} for c in sorted(self.stored.get(node, {}))], "next": None})
+        return Response(content=self.stored[node][path.lstrip("/")])
+
+    def put(self, url, data, headers=None):
+        node, _, chunk_id = url.rpartition("/chunk/")
+        self.stored.setdefault(node, {})[chunk_id] = data
+        return Response()
+
+
+class Down:
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def down_for(self, node):
+        return 600.0 if node in self.nodes else None
+
+
+def test_repair_pass_loads_each_file_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    chunks = [
+        {"id": f"f_chunk{i:05d}", "offset": i * len(DATA), "size": len(DATA), "sha256": chunk_digest(DATA),
+         "nodes": NODES[:3]}
+        for i in range(2)
+    ]
+    metadata = build_metadata("f", 2 * len(DATA), len(DATA), chunks)
+    stored = {NODES[2]: {c["id"]: DATA for c in chunks}}
+    listed = {node: [{"id": c["id"], "files": ["f"]} for c in chunks if node in c["nodes"]] for node in NODES}
+
+    loaded, relocated = [], []
+    monkeypatch.setattr(repair, "iter_node_objects", lambda node: iter(listed[node]))
+    monkeypatch.setattr(repair, "load_metadata", lambda name: loaded.append(name) or metadata)
+    monkeypatch.setattr(repair, "relocate_object",
+                        lambda object_id, old, new: relocated.append((object_id, old, new)))
+
+    def pick_target(exclude):
+        return next((node for node in NODES[3:] if node not in exclude), None)
+
+    # Two nodes holding both chunks are down
+    loop = RepairLoop(NODES, Down(NODES[:2]), NodesHTTP(stored), pick_target, grace=0)
+    assert loop.run_pass() == 4
+    assert loaded == ["f"]
+    # The second lost copy of a chunk sees where the first one went
+    assert relocated == [
+        ("f_chunk00000", NODES[0], NODES[3]),
+        ("f_chunk00001", NODES[0], NODES[3]),
+        ("f_chunk00000", NODES[1], NODES[4]),
+        ("f_chunk00001", NODES[1], NODES[4]),
+    ]
+    assert all(stored[node] == {c["id"]: DATA for c in chunks} for node in NODES[2:])
+    load_balancers.flush_logs()
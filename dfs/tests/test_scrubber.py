@@ -0,0 +1,69 @@
+import sys
+import os
+import io
+import time
+import tempfile
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.integrity import chunk_digest
+from core.throttle import RateLimiter
+from nodes.scrubber import Scrubber
+from nodes.storage_engine import open_engine, ENGINES
+
+
+def store(engine, chunk_id, data):
+    engine.put(chunk_id, io.BytesIO(data), len(data), verify=lambda: chunk_digest(data))
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(1000, burst=100)
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(100)
+    # The burst is free, the other 200 tokens take 0.2 s
+    assert 0.15 <= time.monotonic() - started < 0.5
+    assert RateLimiter(0).acquire(10 ** 9) == 0.0
+
+
+def test_scrubber_finds_corrupt_chunks():
+    chunks = {f"c{i}": os.urandom(5000) for i in range(5)}
+    for name in ENGINES:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = os.path.join(tmp, "node")
+            os.makedirs(root)
+            engine = open_engine(name, root, fsync=False)
+            engine.load()
+            for chunk_id, data in chunks.items():
+                store(engine, chunk_id, data)
+            engine.close()
+
+            # Checksums survive a snapshot
+            engine = open_engine(name, root, fsync=False)
+            assert engine.load() == "snapshot"
+            assert engine.index.digest("c0") == chunk_digest(chunks["c0"])
+
+            # Flip a byte of c3 in place
+            path, offset, size = engine.locate("c3")
+            with open(path, "r+b") as f:
+                f.seek(offset + 100)
+                byte = f.read(1)
+                f.seek(offset + 100)
+                f.write(bytes([byte[0] ^ 0xFF]))
+
+            scrubber = Scrubber(engine, RateLimiter(0), interval=0)
+            assert scrubber.run_pass() == ["c3"], name
+            assert "c3" not in engine.index and len(engine.index) == 4
+            assert scrubber.stats()["scanned"] == 5
+
+            # After a rescan checksums are unknown: the first pass learns
+            # them, the next one checks against them
+            engine.close()
+            os.remove(engine.index.snapshot_path)
+            engine = open_engine(name, root, fsync=False)
+            assert engine.load() == "scan"
+            assert engine.index.digest("c0") is None
+            scrubber = Scrubber(engine, RateLimiter(0), interval=0)
+            assert scrubber.run_pass() == [] and scrubber.stats()["learned"] == 4
+            assert engine.index.digest("c0") == chunk_digest(chunks["c0"])
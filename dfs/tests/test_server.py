@@ -0,0 +1,157 @@
+import sys
+import os
+import socket
+import threading
+import pytest
+from flask import Flask, Response, request
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.server import FileRange, PooledWSGIServer
+
+DATA = bytes(range(256)) * 4096
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = os.path.join(tmp_path, "data.bin")
+    with open(path, "wb") as f:
+        f.write(DATA)
+
+    app = Flask("test_server")
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        return request.get_data()
+
+    @app.route("/ignore", methods=["POST"])
+    def ignore():
+        return "ignored"
+
+    @app.route("/range/<int:offset>/<int:length>")
+    def file_range(offset, length):
+        body = FileRange(open(path, "rb"), offset, length, request.environ)
+        return Response(body, headers={"Content-Length": str(length)}, direct_passthrough=True)
+
+    # A single worker shows that a connection's worker is freed for the next
+    server = PooledWSGIServer("127.0.0.1", 0, app, threads=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def connect(port):
+    connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+    return connection, connection.makefile("rb")
+
+
+def post(path, body, length=None):
+    length = len(body) if length is None else length
+    return f"POST {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {length}\r\n\r\n".encode() + body
+
+
+def read_response(stream):
+    """
+    Returns:
+        Tuple[int, dict, bytes]: Status, headers (lowercase names) and body
+        of the next response on a connection, or None when it was closed.
+    """
+    status_line = stream.readline()
+    if not status_line:
+        return None
+    headers = {}
+    for line in iter(stream.readline, b"\r\n"):
+        if not line:
+            return None
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        body = stream.read(int(headers["content-length"]))
+    else:
+        body = b""
+        for size in iter(lambda: int(stream.readline(), 16), 0):
+            body += stream.read(size)
+            stream.readline()
+        stream.readline()
+    return int(status_line.split()[1]), headers, body
+
+
+def test_pipelined_requests_share_a_connection(server):
+    connection, stream = connect(server)
+    # The second request starts right after the unread body of the first
+    connection.sendall(post("/ignore", b"x" * 1000) + post("/echo", b"hello") + post("/echo", b""))
+    assert read_response(stream)[::2] == (200, b"ignored")
+    assert read_response(stream)[::2] == (200, b"hello")
+    assert read_response(stream)[::2] == (200, b"")
+    connection.close()
+
+
+def test_client_disconnecting_mid_body_frees_the_worker(server):
+    connection, stream = connect(server)
+    connection.sendall(post("/echo", b"partial", length=1000))
+    stream.close()
+    connection.close()
+
+    connection, stream = connect(server)
+    connection.sendall(post("/echo", b"next"))
+    assert read_response(stream)[::2] == (200, b"next")
+    connection.close()
+
+
+def test_body_shorter_than_content_length(server):
+    connection, stream = connect(server)
+    connection.sendall(post("/echo", b"partial", length=1000))
+    connection.shutdown(socket.SHUT_WR)
+    status, headers, _ = read_response(stream)
+    assert status == 400
+    # The connection is not reused
+    assert read_response(stream) is None
+    connection.close()
+
+
+def test_body_longer_than_content_length(server):
+    connection, stream = connect(server)
+    # What follows the declared body is read as the next request
+    connection.sendall(post("/echo", b"hello / HTTP/1.1\r\n\r\n", length=2))
+    assert read_response(stream)[::2] == (200, b"he")
+    assert read_response(stream)[0] == 404  # "llo /"
+    connection.close()
+
+
+def test_file_ranges_are_sent_with_sendfile(server, monkeypatch):
+    sent = []
+    sendfile = socket.socket.sendfile
+
+    def counting_sendfile(self, file, offset=0, count=None):
+        sent.append((offset, count))
+        return sendfile(self, file, offset, count)
+
+    monkeypatch.setattr(socket.socket, "sendfile", counting_sendfile)
+    connection, stream = connect(server)
+    for offset, length in ((0, 100), (5000, 300000), (len(DATA) - 1, 1)):
+        connection.sendall(f"GET /range/{offset}/{length} HTTP/1.1\r\nHost: test\r\n\r\n".encode())
+        status, headers, body = read_response(stream)
+        assert status == 200
+        assert body == DATA[offset:offset + length]
+    connection.close()
+    assert sent == [(0, 100), (5000, 300000), (len(DATA) - 1, 1)]
+
+
+def test_file_range_read_in_blocks_stops_at_the_end_of_the_file(tmp_path):
+    path = os.path.join(tmp_path, "data.bin")
+    with open(path, "wb") as f:
+        f.write(DATA)
+
+    def read(offset, length):
+        # No socket to send the file to: the range is read in blocks
+        body = FileRange(open(path, "rb"), offset, length, {})
+        try:
+            return b"".join(body)
+        finally:
+            body.close()
+
+    assert read(1000, 300000) == DATA[1000:301000]
+    assert read(len(DATA) - 10, 100) == DATA[-10:]
+    assert read(len(DATA) + 10, 100) == b""
@@ -0,0 +1,64 @@
+import sys
+import os
+import io
+import tempfile
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from nodes.storage_engine import open_engine, ENGINES
+
+
+def read(engine, chunk_id):
+    if engine.whole_files:
+        path, offset, size = engine.locate(chunk_id)
+        with open(path, "rb") as f:
+            return f.read()
+    return engine.read(chunk_id)
+
+
+def test_engines_store_reload_and_delete():
+    chunks = {f"c{i}": os.urandom(1000 + i) for i in range(50)}
+    for name in ENGINES:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = os.path.join(tmp, "node")
+            os.makedirs(root)
+            engine = open_engine(name, root, fsync=False)
+            engine.load()
+            for chunk_id, data in chunks.items():
+                engine.put(chunk_id, io.BytesIO(data), len(data))
+            engine.put("c0", io.BytesIO(b"replaced"))
+            assert engine.delete("c1") and not engine.delete("c1")
+            engine.close()
+
+            for source in ("snapshot", "scan"):
+                if source == "scan":
+                    os.remove(engine.index.snapshot_path)
+                reloaded = open_engine(name, root, fsync=False)
+                assert reloaded.load() == source, name
+                assert len(reloaded.index) == 49
+                assert read(reloaded, "c0") == b"replaced"
+                assert read(reloaded, "c2") == chunks["c2"]
+                assert reloaded.locate("c1") is None
+
+
+def test_segment_compaction_keeps_live_chunks():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = open_engine("segment", tmp, fsync=False, segment_size=64 * 1024)
+        engine.load()
+        chunks = {f"c{i}": os.urandom(4000) for i in range(40)}
+        for chunk_id, data in chunks.items():
+            engine.put(chunk_id, io.BytesIO(data), len(data))
+        for i in range(0, 40, 2):
+            engine.delete(f"c{i}")
+        before = engine.segments()
+        engine.maintain()
+        assert engine.segments() != before
+        for i in range(1, 40, 2):
+            assert engine.read(f"c{i}") == chunks[f"c{i}"]
+
+        engine.close()
+        os.remove(engine.index.snapshot_path)
+        rescanned = open_engine("segment", tmp, fsync=False)
+        rescanned.load()
+        assert sorted(c for c, _ in rescanned.index.page()) == sorted(f"c{i}" for i in range(1, 40, 2))
@@ -0,0 +1,28 @@
+import sys
+import os
+import filecmp
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.chunker import ChunkReader, assemble_file
+
+# Define directories
+BASE_DIR = os.path.dirname(__file__)
+input_dir = os.path.join(BASE_DIR, "input_files")
+output_dir = os.path.join(BASE_DIR, "output_files")
+os.makedirs(output_dir, exist_ok=True)
+
+input_file = os.path.join(input_dir, "sample1.pdf")
+output_file = os.path.join(output_dir, "streamed_sample1.pdf")
+
+
+def test_stream_roundtrip():
+    # Small chunks so the sample spans many views
+    with ChunkReader(input_file, chunk_size=64 * 1024) as reader:
+        offsets = [offset for _, offset, _ in reader]
+        assert len(offsets) == len(reader)
+        assemble_file((view for _, _, view in reader), output_file)
+
+    assert offsets == list(range(0, os.path.getsize(input_file), 64 * 1024))
+    assert filecmp.cmp(input_file, output_file, shallow=False)
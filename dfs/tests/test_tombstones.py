@@ -0,0 +1,37 @@
+import sys
+import os
+
+# Add load_balancers/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import load_balancers
+from load_balancers.tombstones import TombstoneLog
+
+NODES = ["http://localhost:5001", "http://localhost:5002"]
+
+
+def test_tombstones_persist_until_done_or_cancelled(monkeypatch, tmp_path):
+    # Loading logs; keep its lines and state out of the tree
+    monkeypatch.setenv("DFS_LOG_DIR", str(tmp_path))
+    monkeypatch.setenv("DFS_STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(load_balancers, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(load_balancers, "STATE_DIR", str(tmp_path))
+    path = os.path.join(tmp_path, "tombstones.log")
+    tombstones = TombstoneLog(NODES)
+    tombstones.load(path)
+    assert tombstones.add(NODES[0], ["a", "b", "c"]) == 3
+    assert tombstones.add(NODES[1], ["a", "d"]) == 2
+    assert tombstones.add("http://elsewhere:5001", ["x"]) == 0
+    tombstones.done(NODES[0], ["a"])
+    tombstones.cancel(["d"])
+    assert tombstones.pending() == {NODES[0]: 2, NODES[1]: 1}
+
+    reloaded = TombstoneLog(NODES)
+    reloaded.load(path)
+    assert reloaded.pending(NODES[0]) == ["b", "c"]
+    assert reloaded.pending(NODES[1]) == ["a"]
+
+    # The log is compacted to the pending tombstones on load
+    with open(path) as f:
+        assert len(f.readlines()) == 2
+    load_balancers.flush_logs()
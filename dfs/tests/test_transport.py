@@ -0,0 +1,71 @@
+import sys
+import os
+import threading
+
+# Add core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+from flask import Flask, request, jsonify
+from core.server import PooledWSGIServer
+from core.transport import Transport
+
+
+def start_server():
+    """
+    Serves a small app on the pooled keep-alive server, on a free port.
+    /flaky fails with 503 as many times as its ?fail= says, per key.
+    """
+    app = Flask("test_transport")
+    failures = {}
+    peers = []
+
+    @app.route("/flaky/<key>", methods=["GET", "POST"])
+    def flaky(key):
+        peers.append(request.environ["REMOTE_PORT"])
+        failures[key] = failures.get(key, 0) + 1
+        if failures[key] <= int(request.args.get("fail", 0)):
+            return jsonify({"error": "busy"}), 503
+        return jsonify({"attempts": failures[key]})
+
+    @app.route("/ignore", methods=["PUT"])
+    def ignore():
+        # Leaves the request body unread
+        peers.append(request.environ["REMOTE_PORT"])
+        return jsonify({"ok": True})
+
+    server = PooledWSGIServer("127.0.0.1", 0, app, threads=4)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", peers
+
+
+def test_retries_and_keep_alive():
+    server, url, peers = start_server()
+    http = Transport(timeout=5, retries=2, backoff=0.001)
+    try:
+        # Idempotent requests are retried through 503s, over one connection
+        r = http.get(f"{url}/flaky/a?fail=2")
+        assert r.status_code == 200 and r.json()["attempts"] == 3
+        assert len(set(peers)) == 1
+
+        # Out of retries: the last answer is returned
+        assert http.get(f"{url}/flaky/b?fail=5").status_code == 503
+
+        # POST reached the server, so it is not sent again
+        assert http.post(f"{url}/flaky/c?fail=1").status_code == 503
+
+        # A body left unread by the app does not break the next request
+        assert http.put(f"{url}/ignore", data=os.urandom(100000)).status_code == 200
+        assert http.get(f"{url}/flaky/d").json()["attempts"] == 1
+        assert len(set(peers)) == 1
+    finally:
+        http.close()
+        server.shutdown()
+        server.server_close()
+
+    # Nothing listens any more: a refused POST is retried, then fails
+    try:
+        Transport(timeout=1, retries=1, backoff=0.001).post(f"{url}/flaky/e")
+        assert False, "expected a connection error"
+    except requests.ConnectionError:
+        pass
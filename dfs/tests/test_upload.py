@@ -0,0 +1,77 @@
+import sys
+import os
+import threading
+import pytest
+
+# Add client/ and core/ to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from client import journal, upload
+from client.throughput import ThroughputEstimate
+
+WORKERS = 2
+MAX_IN_FLIGHT = 4
+PLACE_BATCH = 3
+
+
+@pytest.mark.parametrize("chunking", ["fixed", "cdc"])
+def test_backpressure_bounds_the_chunks_read_ahead(monkeypatch, tmp_path, chunking):
+    path = os.path.join(tmp_path, "f.bin")
+    with open(path, "wb") as f:
+        f.write(os.urandom(512 * 1024))
+    monkeypatch.setattr(journal, "JOURNAL_DIR", str(tmp_path))
+    monkeypatch.setattr(upload, "THROUGHPUT", ThroughputEstimate(os.path.join(tmp_path, "throughput.json")))
+    monkeypatch.setattr(upload, "PLACE_BATCH", PLACE_BATCH)
+
+    lock = threading.Lock()
+    read, sent, ahead = [], [], []
+    for name in ("ChunkReader", "ContentDefinedChunkReader"):
+        reader_class = getattr(upload, name)
+
+        class CountingReader(reader_class):
+            def __iter__(self):
+                for chunk in super().__iter__():
+                    with lock:
+                        read.append(chunk[0])
+                        # Chunks read but not sent yet, this one included
+                        ahead.append(len(read) - len(sent))
+                    yield chunk
+
+        monkeypatch.setattr(upload, name, CountingReader)
+
+    placed = []
+
+    def place_chunks(chunks, dedup=False, replicas=None):
+        chunks = list(chunks)
+        placed.append(len(chunks))
+        return {chunk_id: {"cluster": "c", "nodes": ["n1"], "existing": False} for chunk_id, _ in chunks}
+
+    monkeypatch.setattr(upload, "place_chunks", place_chunks)
+
+    # Nodes answer only once the gate opens
+    gate = threading.Event()
+
+    def send_chunk(node, chunk_name, data, digest):
+        gate.wait(10)
+        with lock:
+            sent.append(chunk_name)
+
+    monkeypatch.setattr(upload, "send_chunk", send_chunk)
+    saved = []
+    monkeypatch.setattr(upload, "save_metadata", saved.append)
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(upload.upload_file(
+        path, workers=WORKERS, max_in_flight=MAX_IN_FLIGHT, chunking=chunking, chunk_size=8192)))
+    thread.start()
+    thread.join(0.5)
+    # The reader stops once every slot is taken and a batch is waiting
+    assert thread.is_alive()
+    assert len(read) <= MAX_IN_FLIGHT + PLACE_BATCH
+
+    gate.set()
+    thread.join(10)
+    assert result and result[0] is saved[0]
+    assert len(result[0]["chunks"]) == len(read) > 2 * (MAX_IN_FLIGHT + PLACE_BATCH)
+    assert max(ahead) <= MAX_IN_FLIGHT + PLACE_BATCH
+    assert set(placed) <= set(range(1, PLACE_BATCH + 1))